@@ -0,0 +1,182 @@
+"""
+Шина сообщений чата между процессами (воркерами uvicorn).
+
+Каждый воркер знает только о своих websocket-соединениях, поэтому
+сообщение публикуется в шину, а каждый воркер доставляет его тем сокетам
+получателя, которые подключены к нему.
+"""
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional, Set
+from dotenv import load_dotenv
+from backend.log.log_config import logger
+
+load_dotenv()
+
+# Обработчик входящих из шины сообщений: (id получателя, сообщение в JSON)
+MessageHandler = Callable[[str, str], Awaitable[None]]
+
+
+class PayloadTooLargeError(ValueError):
+    """
+    Сообщение не помещается в шину
+    """
+
+
+class ChatBackplane(ABC):
+    """
+    Базовый класс шины. Наследники реализуют start/stop (подключение к брокеру
+    и подписка на канал) и publish.
+    """
+
+    def __init__(self):
+        self._handler: Optional[MessageHandler] = None
+
+    def subscribe(self, handler: MessageHandler) -> None:
+        """
+        Задаёт обработчик сообщений, пришедших из шины
+
+        Args:
+            handler: корутина (id получателя, сообщение)
+        """
+        self._handler = handler
+
+    @abstractmethod
+    async def start(self) -> None:
+        """
+        Подключается к брокеру и подписывается на сообщения
+        """
+
+    @abstractmethod
+    async def stop(self) -> None:
+        """
+        Отписывается и отключается от брокера
+        """
+
+    @abstractmethod
+    async def publish(self, user_id: str, payload: str) -> None:
+        """
+        Публикует сообщение для пользователя во все процессы
+
+        Args:
+            user_id (str): id получателя
+            payload (str): сообщение в JSON
+        """
+
+    async def _dispatch(self, user_id: str, payload: str) -> None:
+        if self._handler is not None:
+            await self._handler(user_id, payload)
+
+
+class InProcessBackplane(ChatBackplane):
+    """
+    Шина внутри одного процесса - для запуска с одним воркером и тестов
+    """
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, user_id: str, payload: str) -> None:
+        await self._dispatch(user_id, payload)
+
+
+class PostgresBackplane(ChatBackplane):
+    """
+    Шина на LISTEN/NOTIFY в Postgres. Каждый воркер держит одно соединение,
+    слушающее канал, и небольшой пул соединений для NOTIFY. При обрыве
+    слушающего соединения оно переподключается.
+    """
+
+    # NOTIFY принимает сообщения короче 8000 байт
+    max_notify_bytes = 7999
+    reconnect_delay = 1.0
+
+    def __init__(self, dsn: str, channel: str = 'chat_messages'):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self._listener = None
+        self._pool = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopped = False
+
+    async def start(self) -> None:
+        import asyncpg
+
+        self._stopped = False
+        self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=2)
+        await self._listen()
+
+    async def _listen(self) -> None:
+        import asyncpg
+
+        self._listener = await asyncpg.connect(self.dsn)
+        self._listener.add_termination_listener(self._on_termination)
+        await self._listener.add_listener(self.channel, self._on_notify)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        data = json.loads(payload)
+        self._spawn(self._dispatch(data['user_id'], data['payload']))
+
+    def _on_termination(self, connection) -> None:
+        if not self._stopped:
+            logger.warning('Соединение шины чата с Postgres потеряно, переподключаемся')
+            self._spawn(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        while not self._stopped:
+            try:
+                await self._listen()
+                return
+            except Exception as exc:
+                logger.warning(f'Не удалось переподключить шину чата: {exc}')
+                await asyncio.sleep(self.reconnect_delay)
+
+    def _spawn(self, coroutine: Awaitable[None]) -> None:
+        # Храним ссылки на задачи, иначе их может собрать сборщик мусора
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self) -> None:
+        self._stopped = True
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def publish(self, user_id: str, payload: str) -> None:
+        if self._pool is None:
+            raise RuntimeError('Шина чата не запущена')
+        notification = json.dumps({'user_id': user_id, 'payload': payload})
+        if len(notification.encode('utf-8')) > self.max_notify_bytes:
+            raise PayloadTooLargeError('Сообщение слишком большое для NOTIFY')
+        await self._pool.execute('SELECT pg_notify($1, $2)', self.channel, notification)
+
+
+def create_backplane() -> ChatBackplane:
+    """
+    Создаёт шину по настройкам из окружения: CHAT_BACKPLANE - memory
+    (по умолчанию, один процесс) или postgres (LISTEN/NOTIFY через
+    CHAT_BACKPLANE_DSN, по умолчанию DATABASE_URL)
+
+    Returns:
+        ChatBackplane
+    """
+    backend = os.getenv('CHAT_BACKPLANE', 'memory')
+    if backend == 'memory':
+        return InProcessBackplane()
+    if backend == 'postgres':
+        dsn = os.getenv('CHAT_BACKPLANE_DSN') or os.getenv('DATABASE_URL', '')
+        # asyncpg не понимает диалект SQLAlchemy в схеме url
+        return PostgresBackplane(dsn.replace('postgresql+asyncpg://', 'postgresql://', 1))
+    raise ValueError(f'Неизвестный CHAT_BACKPLANE: {backend}')
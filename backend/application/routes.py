@@ -1,19 +1,25 @@
 """
 Модуль routes.py содержит маршруты FastAPI для обработки HTTP-запросов и WebSocket-соединений.
 """
-from typing import Generator, Annotated
-from fastapi import Response, WebSocket, APIRouter, Depends, UploadFile, Query
+from typing import Generator, Annotated, Optional
+from fastapi import (
+    Request, Response, WebSocket, APIRouter, Depends, UploadFile, Query, BackgroundTasks
+)
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from backend.db.models import engine
-from .utils import get_current_user_id, WebSocketConnectionManager
-from .config import security, config
+from backend.db.message_writer import MessageWriter
+from backend.db.routing import create_read_router
+from backend.metrics import metrics
+from .utils import get_current_user_id, require_metrics_access, WebSocketConnectionManager
+from .config import config
+from .backplane import create_backplane
 from .views import (
     register_view, login_view, create_post_view, create_comment_view,
     create_friendship_request_view, edit_profile_view, create_or_delete_like_view,
     vote_view, handle_websocket, add_media_to_post_view, get_posts_view,
     get_post_img_view, get_post_view, edit_post_view, delete_post_view, delete_comment_view,
     delete_vote_view, delete_message_view, change_avatar_view, get_avatar_view,
-    get_chat_view, get_users_posts_view, get_my_page_view,
+    get_chat_view, get_chats_view, read_chat_view, get_users_posts_view, get_my_page_view,
     get_other_page_view, get_is_friend_view, get_friends_view, delete_friend_view,
     get_friendship_requests_view, delete_friendship_request_view,
     delete_post_image_view, complaint_post_view, complaint_comment_view, get_voted_users_view
@@ -21,25 +27,55 @@ from .views import (
 
 from .schemas import (
     RegisterFormData, LoginFormData, CreatePostData, CreateCommentData, EditProfileFormData,
-    EditPostData
+    EditPostData, PaginationParams
 )
 
 router = APIRouter()
-manager = WebSocketConnectionManager()
+manager = WebSocketConnectionManager(create_backplane())
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
 async def get_db() -> Generator[AsyncSession, None, None]:
     """
-    Генератор для получения сессии базы данных.
+    Генератор для получения сессии базы данных. Сессия - единица работы
+    запроса: view и вспомогательные функции только добавляют изменения,
+    а коммит один, после успешного завершения view. Если view выбросил
+    исключение (в том числе HTTPException), изменения откатываются.
 
     Yields:
         AsyncSession: Асинхронная сессия базы данных.
     """
     async with SessionLocal() as db:
         yield db
+        await db.commit()
 
 SessionDep = Annotated[AsyncSession, Depends(get_db)]
 
+read_router = create_read_router(SessionLocal)
+
+async def get_read_db(request: Request) -> Generator[AsyncSession, None, None]:
+    """
+    Генератор сессии для запросов только на чтение: реплика, если они
+    настроены и пользователь недавно ничего не записывал, иначе основная бд.
+
+    Yields:
+        AsyncSession: Асинхронная сессия базы данных.
+    """
+    async with read_router.choose(request)() as db:
+        yield db
+
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_db)]
+
+message_writer = MessageWriter(SessionLocal)
+
+def get_message_writer() -> MessageWriter:
+    """
+    Возвращает общий для процесса буфер записи сообщений чата.
+
+    Returns:
+        MessageWriter: Буфер записи сообщений.
+    """
+    return message_writer
+
 
 @router.get('/')
 async def example() -> dict:
@@ -52,6 +88,17 @@ async def example() -> dict:
     return {'status': 'ok'}
 
 
+@router.get('/metrics', dependencies=[Depends(require_metrics_access)])
+async def get_metrics() -> dict:
+    """
+    Возвращает метрики процесса для мониторинга.
+
+    Returns:
+        dict: Счётчики, текущие значения и наблюдения.
+    """
+    return metrics.snapshot()
+
+
 @router.post('/register')
 async def submit_form(
     data: RegisterFormData, db: SessionDep
@@ -71,7 +118,7 @@ async def submit_form(
 
 @router.post('/login')
 async def login(
-    data: LoginFormData, response: Response, db: SessionDep
+    data: LoginFormData, response: Response, db: SessionDep, background_tasks: BackgroundTasks
 ) -> dict:
     """
     Аутентифицирует пользователя.
@@ -80,14 +127,17 @@ async def login(
         data (LoginFormData): Данные для входа.
         response (Response): Объект ответа FastAPI.
         db (AsyncSession): Сессия базы данных.
+        background_tasks (BackgroundTasks): Фоновые задачи FastAPI.
 
     Returns:
         dict: Токен аутентификации.
     """
-    return await login_view(data=data, response=response, db=db)
+    return await login_view(
+        data=data, response=response, db=db, background_tasks=background_tasks
+    )
 
 
-@router.get('/my_id', dependencies=[Depends(security.access_token_required)])
+@router.get('/my_id')
 async def secret(user_id: str = Depends(get_current_user_id)) -> dict:
     """
     Возвращает ID текущего пользователя.
@@ -116,7 +166,7 @@ async def logout(response: Response) -> dict:
     return {"status": "ok"}
 
 
-@router.post('/post', dependencies=[Depends(security.access_token_required)])
+@router.post('/post')
 async def create_post(
     data: CreatePostData, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -134,8 +184,7 @@ async def create_post(
     return await create_post_view(data=data, user_id=int(user_id), db=db)
 
 
-@router.post('/friendship_request/{getter_id}',
-dependencies=[Depends(security.access_token_required)])
+@router.post('/friendship_request/{getter_id}')
 async def create_friendship_request(
     getter_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -153,7 +202,7 @@ async def create_friendship_request(
     return await create_friendship_request_view(author_id=int(user_id), getter_id=getter_id, db=db)
 
 
-@router.put('/profile', dependencies=[Depends(security.access_token_required)])
+@router.put('/profile')
 async def edit_profile(
     data: EditProfileFormData, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -171,7 +220,7 @@ async def edit_profile(
     return await edit_profile_view(data=data, author_id=int(user_id), db=db)
 
 
-@router.post('/post/{post_id}/comment', dependencies=[Depends(security.access_token_required)])
+@router.post('/post/{post_id}/comment')
 async def create_comment(
     post_id: int, data: CreateCommentData, db: SessionDep,
     user_id: str = Depends(get_current_user_id)
@@ -191,8 +240,7 @@ async def create_comment(
     return await create_comment_view(data=data, post_id=post_id, user_id=int(user_id), db=db)
 
 
-@router.post('/post/{post_id}/like',
-dependencies=[Depends(security.access_token_required)])
+@router.post('/post/{post_id}/like')
 async def create_or_delete_like(
     post_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -210,7 +258,7 @@ async def create_or_delete_like(
     return await create_or_delete_like_view(post_id=post_id, user_id=int(user_id), db=db)
 
 
-@router.post('/vote/{variant_id}', dependencies=[Depends(security.access_token_required)])
+@router.post('/vote/{variant_id}')
 async def create_or_delete_vote(
     variant_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -230,7 +278,7 @@ async def create_or_delete_vote(
 
 @router.websocket("/chatsocket/{user_id}")
 async def websocket_endpoint(
-    websocket: WebSocket, db: SessionDep, user_id: str
+    websocket: WebSocket, user_id: str, writer: MessageWriter = Depends(get_message_writer)
 ) -> None:
     """
     Обрабатывает WebSocket-соединение для чата.
@@ -238,12 +286,12 @@ async def websocket_endpoint(
     Args:
         websocket (WebSocket): WebSocket-соединение.
         user_id (str): ID пользователя.
-        db (AsyncSession): Сессия базы данных.
+        writer (MessageWriter): Буфер записи сообщений в бд.
     """
-    await handle_websocket(websocket=websocket, user_id=user_id, manager=manager, db=db)
+    await handle_websocket(websocket=websocket, user_id=user_id, manager=manager, writer=writer)
 
 
-@router.post('/posts/{post_id}/media', dependencies=[Depends(security.access_token_required)])
+@router.post('/posts/{post_id}/media')
 async def add_media_to_post(
     post_id: int, uploaded_file: UploadFile, db: SessionDep,
     user_id: str = Depends(get_current_user_id)
@@ -263,10 +311,10 @@ async def add_media_to_post(
     post_id=post_id, user_id=int(user_id), db=db)
 
 
-@router.get('/posts', dependencies=[Depends(security.access_token_required)])
+@router.get('/posts')
 async def get_posts(
-    db: SessionDep, user_id: str = Depends(get_current_user_id),
-    skip: int = Query(0), limit: int = Query(100)
+    db: ReadSessionDep, user_id: str = Depends(get_current_user_id),
+    skip: int = Query(0), page: PaginationParams = Depends()
 ) -> dict:
     """
     Отдаёт данные для отрисовки ленты постов.
@@ -274,31 +322,41 @@ async def get_posts(
     Args:
         user_id (str): ID пользователя.
         db (AsyncSession): Сессия базы данных.
+        skip (int): сколько постов пропустить (устаревший режим пагинации)
+        page (PaginationParams): limit - сколько постов вернуть, cursor - курсор
+            следующей страницы (next_cursor из прошлого ответа), before_id -
+            вернуть посты с id меньше этого
     Returns:
         json: Данные в виде json
     """
-    return await get_posts_view(user_id=int(user_id), db=db, skip=skip, limit=limit)
+    return await get_posts_view(
+        user_id=int(user_id), db=db, skip=skip, limit=page.limit,
+        cursor=page.cursor, before_id=page.before_id
+    )
 
 
-@router.get('/posts/image/{image_id}', dependencies=[Depends(security.access_token_required)])
+@router.get('/posts/image/{image_id}', dependencies=[Depends(get_current_user_id)])
 async def get_post_img(
-    image_id: int, db: SessionDep
+    image_id: int, request: Request, db: ReadSessionDep,
+    size: Optional[int] = Query(None, ge=1)
 ):
     """
     Отдаёт файл картинки, прикреплённой к посту
 
     Args:
         image_id (int): id картинки в бд
+        request (Request): http request
         db (AsyncSession): Сессия базы данных.
+        size (int): нужный размер (64, 256 или 1024), по умолчанию оригинал
     Returns:
-        StreamingResponse: файл картинки
+        FileResponse: файл картинки (или 304, если он не изменился)
     """
-    return await get_post_img_view(image_id=image_id, db=db)
+    return await get_post_img_view(image_id=image_id, request=request, db=db, size=size)
 
 
-@router.get('/posts/{post_id}', dependencies=[Depends(security.access_token_required)])
+@router.get('/posts/{post_id}')
 async def get_post(
-    post_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
+    post_id: int, db: ReadSessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
     """
     Отдаёт данные для просмотра одного поста.
@@ -313,7 +371,7 @@ async def get_post(
     return await get_post_view(post_id=post_id, user_id=int(user_id), db=db)
 
 
-@router.put('/post/{post_id}', dependencies=[Depends(security.access_token_required)])
+@router.put('/post/{post_id}')
 async def edit_post(
     post_id: int, data: EditPostData, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -330,7 +388,7 @@ async def edit_post(
     return await edit_post_view(data=data, post_id=post_id, user_id=int(user_id), db=db)
 
 
-@router.delete('/post/{post_id}', dependencies=[Depends(security.access_token_required)])
+@router.delete('/post/{post_id}')
 async def delete_post(
     post_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -347,7 +405,7 @@ async def delete_post(
     return await delete_post_view(post_id=post_id, user_id=int(user_id), db=db)
 
 
-@router.delete('/comment/{comment_id}', dependencies=[Depends(security.access_token_required)])
+@router.delete('/comment/{comment_id}')
 async def delete_comment(
     comment_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -364,7 +422,7 @@ async def delete_comment(
     return await delete_comment_view(comment_id=comment_id, user_id=int(user_id), db=db)
 
 
-@router.delete('/vote/{post_id}', dependencies=[Depends(security.access_token_required)])
+@router.delete('/vote/{post_id}')
 async def delete_vote(
     post_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -381,7 +439,7 @@ async def delete_vote(
     return await delete_vote_view(post_id=post_id, user_id=int(user_id), db=db)
 
 
-@router.delete('/message/{message_id}', dependencies=[Depends(security.access_token_required)])
+@router.delete('/message/{message_id}')
 async def delete_message(
     message_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -398,7 +456,7 @@ async def delete_message(
     return await delete_message_view(message_id=message_id, user_id=int(user_id), db=db)
 
 
-@router.post('/avatar', dependencies=[Depends(security.access_token_required)])
+@router.post('/avatar')
 async def change_avatar(
     uploaded_file: UploadFile, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -416,59 +474,114 @@ async def change_avatar(
 
 
 @router.get('/user/{another_user_id}/avatar',
-dependencies=[Depends(security.access_token_required)])
+dependencies=[Depends(get_current_user_id)])
 async def get_someones_avatar(
-    another_user_id: int, db: SessionDep
+    another_user_id: int, request: Request, db: ReadSessionDep,
+    size: Optional[int] = Query(None, ge=1)
 ) -> dict:
     """
     Возвращает аватарку пользователя
 
     Args:
         another_user_id (int): id пользователя, аватарку которого мы получаем
-        user_id (str): id пользователя
+        request (Request): http request
         db (AsyncSession): сессия бд
+        size (int): нужный размер (64, 256 или 1024), по умолчанию оригинал
     Returns:
-        StreamingResponse - файл аватарки
+        FileResponse - файл аватарки (или 304, если она не изменилась)
     """
-    return await get_avatar_view(another_user_id=another_user_id, db=db)
+    return await get_avatar_view(
+        another_user_id=another_user_id, request=request, db=db, size=size
+    )
 
 
-@router.get('/mypage/avatar', dependencies=[Depends(security.access_token_required)])
+@router.get('/mypage/avatar')
 async def get_my_avatar(
-    db: SessionDep, user_id: str = Depends(get_current_user_id)
+    request: Request, db: ReadSessionDep, user_id: str = Depends(get_current_user_id),
+    size: Optional[int] = Query(None, ge=1)
 ) -> dict:
     """
     Возвращает аватарку пользователя
 
     Args:
+        request (Request): http request
         user_id (str): id пользователя
         db (AsyncSession): сессия бд
+        size (int): нужный размер (64, 256 или 1024), по умолчанию оригинал
     Returns:
-        StreamingResponse - файл аватарки
+        FileResponse - файл аватарки (или 304, если она не изменилась)
     """
-    return await get_avatar_view(another_user_id=int(user_id), db=db)
+    return await get_avatar_view(
+        another_user_id=int(user_id), request=request, db=db, size=size
+    )
 
 
-@router.get('/chat/{recipient_id}', dependencies=[Depends(security.access_token_required)])
+# Чат читается из основной бд: сообщения пишутся через websocket, который не
+# может выставить куки "липкости" к основной бд, поэтому реплика могла бы
+# не показать только что отправленные сообщения
+@router.get('/chat/{recipient_id}')
 async def get_chat(
+    recipient_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id),
+    page: PaginationParams = Depends()
+) -> dict:
+    """
+    Возвращает данные для страницы чата (последние сообщения)
+
+    Args:
+        recipient_id (int): id собеседника
+        user_id (str): id пользователя
+        db (AsyncSession): сессия бд
+        page (PaginationParams): limit - размер страницы, cursor - курсор более
+            старых сообщений из предыдущего ответа, before_id - отдать сообщения
+            с id меньше этого
+    Returns:
+        json - массив сообщений и курсор более старых сообщений
+    """
+    return await get_chat_view(
+        recipient_id=recipient_id, user_id=int(user_id), db=db,
+        limit=page.limit, cursor=page.cursor, before_id=page.before_id
+    )
+
+
+@router.get('/chats')
+async def get_chats(
+    db: SessionDep, user_id: str = Depends(get_current_user_id),
+    limit: int = Query(100, ge=1)
+) -> dict:
+    """
+    Возвращает список переписок пользователя
+
+    Args:
+        user_id (str): id пользователя
+        db (AsyncSession): сессия бд
+        limit (int): сколько переписок вернуть
+    Returns:
+        json - массив переписок с последним сообщением и числом непрочитанных
+    """
+    return await get_chats_view(user_id=int(user_id), db=db, limit=limit)
+
+
+@router.post('/chat/{recipient_id}/read')
+async def read_chat(
     recipient_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
     """
-    Возвращает данные для страницы чата (массив сообщений)
+    Отмечает переписку с собеседником прочитанной
 
     Args:
         recipient_id (int): id собеседника
         user_id (str): id пользователя
         db (AsyncSession): сессия бд
     Returns:
-        json - массив сообщений
+        json - статус операции
     """
-    return await get_chat_view(recipient_id=recipient_id, user_id=int(user_id), db=db)
+    return await read_chat_view(recipient_id=recipient_id, user_id=int(user_id), db=db)
 
 
-@router.get('/profile/posts', dependencies=[Depends(security.access_token_required)])
+@router.get('/profile/posts')
 async def get_users_posts(
-    db: SessionDep, user_id: str = Depends(get_current_user_id)
+    db: SessionDep, user_id: str = Depends(get_current_user_id),
+    page: PaginationParams = Depends()
 ) -> dict:
     """
     Возвращает список постов пользователя
@@ -476,15 +589,19 @@ async def get_users_posts(
     Args:
         user_id (str): id пользователя
         db (AsyncSession): сессия бд
+        page (PaginationParams): limit, cursor и before_id страницы
     Returns:
         json - список постов
     """
-    return await get_users_posts_view(user_id=int(user_id), db=db)
+    return await get_users_posts_view(
+        user_id=int(user_id), db=db, limit=page.limit, cursor=page.cursor,
+        before_id=page.before_id
+    )
 
 
-@router.get('/users/{user_id}/posts', dependencies=[Depends(security.access_token_required)])
+@router.get('/users/{user_id}/posts', dependencies=[Depends(get_current_user_id)])
 async def get_user_posts(
-    user_id: int, db: SessionDep
+    user_id: int, db: SessionDep, page: PaginationParams = Depends()
 ) -> dict:
     """
     Возвращает список постов пользователя
@@ -492,15 +609,20 @@ async def get_user_posts(
     Args:
         user_id (str): id пользователя
         db (AsyncSession): сессия бд
+        page (PaginationParams): limit, cursor и before_id страницы
     Returns:
         json - список постов
     """
-    return await get_users_posts_view(user_id=user_id, db=db)
+    return await get_users_posts_view(
+        user_id=user_id, db=db, limit=page.limit, cursor=page.cursor,
+        before_id=page.before_id
+    )
 
 
-@router.get('/mypage', dependencies=[Depends(security.access_token_required)])
+@router.get('/mypage')
 async def get_my_page(
-    db: SessionDep, user_id: str = Depends(get_current_user_id)
+    db: SessionDep, page: PaginationParams = Depends(),
+    user_id: str = Depends(get_current_user_id)
 ) -> dict:
     """
     Возвращает пользователю информацию о нём
@@ -508,30 +630,38 @@ async def get_my_page(
     Args:
         user_id (str): id пользователя
         db (AsyncSession): сессия бд
+        page (PaginationParams): параметры страницы постов
     Returns:
         json - данные
     """
-    return await get_my_page_view(user_id=int(user_id), db=db)
+    return await get_my_page_view(
+        user_id=int(user_id), db=db, limit=page.limit,
+        cursor=page.cursor, before_id=page.before_id
+    )
 
 
-@router.get('/users/{other_user_id}', dependencies=[Depends(security.access_token_required)])
+@router.get('/users/{other_user_id}',
+dependencies=[Depends(get_current_user_id)])
 async def get_other_page(
-    other_user_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
+    other_user_id: int, db: ReadSessionDep, page: PaginationParams = Depends()
 ) -> dict:
     """
     Возвращает пользователю информацию о пользователе по id
 
     Args:
         other_user_id (int): id пользователя, информацию о котором мы получаем
-        user_id (str): id пользователя
         db (AsyncSession): сессия бд
+        page (PaginationParams): параметры страницы постов
     Returns:
         json - данные
     """
-    return await get_other_page_view(other_user_id=other_user_id, db=db)
+    return await get_other_page_view(
+        other_user_id=other_user_id, db=db, limit=page.limit,
+        cursor=page.cursor, before_id=page.before_id
+    )
 
 
-@router.get('/isfriend/{friend_id}', dependencies=[Depends(security.access_token_required)])
+@router.get('/isfriend/{friend_id}')
 async def get_is_friend(
     friend_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -548,9 +678,9 @@ async def get_is_friend(
     return await get_is_friend_view(friend_id=friend_id, user_id=int(user_id), db=db)
 
 
-@router.get('/friends', dependencies=[Depends(security.access_token_required)])
+@router.get('/friends')
 async def get_friends(
-    db: SessionDep, user_id: str = Depends(get_current_user_id)
+    db: ReadSessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
     """
     Возвращает массив id пользователя
@@ -564,7 +694,7 @@ async def get_friends(
     return await get_friends_view(user_id=int(user_id), db=db)
 
 
-@router.delete('/friend/{friend_id}', dependencies=[Depends(security.access_token_required)])
+@router.delete('/friend/{friend_id}')
 async def delete_friend(
     friend_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -581,7 +711,7 @@ async def delete_friend(
     return await delete_friend_view(friend_id=friend_id, user_id=int(user_id), db=db)
 
 
-@router.get('/friendship_requests', dependencies=[Depends(security.access_token_required)])
+@router.get('/friendship_requests')
 async def get_friendship_requests(
     db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -597,8 +727,7 @@ async def get_friendship_requests(
     return await get_friendship_requests_view(user_id=int(user_id), db=db)
 
 
-@router.delete('/friendship_request/{request_id}',
-dependencies=[Depends(security.access_token_required)])
+@router.delete('/friendship_request/{request_id}')
 async def delete_friendship_request(
     request_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -615,7 +744,7 @@ async def delete_friendship_request(
     return await delete_friendship_request_view(request_id=request_id, user_id=int(user_id), db=db)
 
 
-@router.delete('/posts/image/{image_id}', dependencies=[Depends(security.access_token_required)])
+@router.delete('/posts/image/{image_id}')
 async def delete_post_image(
     image_id: int, db: SessionDep, user_id: str = Depends(get_current_user_id)
 ) -> dict:
@@ -632,7 +761,7 @@ async def delete_post_image(
     return await delete_post_image_view(image_id=image_id, user_id=int(user_id), db=db)
 
 
-@router.post('/complaint_post/{post_id}', dependencies=[Depends(security.access_token_required)])
+@router.post('/complaint_post/{post_id}')
 async def complaint_post(db: SessionDep, post_id: int, user_id: str = Depends(get_current_user_id)):
     """
     Создаёт жалобу на пост
@@ -646,8 +775,7 @@ async def complaint_post(db: SessionDep, post_id: int, user_id: str = Depends(ge
     return await complaint_post_view(post_id = post_id, user_id = int(user_id), db=db)
 
 
-@router.post('/complaint_comment/{comment_id}',
-dependencies=[Depends(security.access_token_required)])
+@router.post('/complaint_comment/{comment_id}')
 async def complaint_comment(
     db: SessionDep, comment_id: int, user_id: str = Depends(get_current_user_id)
 ):
@@ -663,8 +791,7 @@ async def complaint_comment(
     return await complaint_comment_view(comment_id = comment_id, user_id = int(user_id), db=db)
 
 
-@router.get('/voted_users/{voting_variant_id}',
-dependencies=[Depends(security.access_token_required)])
+@router.get('/voted_users/{voting_variant_id}')
 async def get_voted_users(
     voting_variant_id: int, db: SessionDep, user_id = Depends(get_current_user_id)
 ) -> dict:
@@ -56,3 +56,12 @@ class EditPostData(BaseModel):
     """
     text: Optional[constr(min_length=3, max_length=10000)] = None
     options: Optional[List[constr(min_length=3, max_length=100)]] = None
+
+
+class PaginationParams(BaseModel):
+    """
+    Параметры keyset-пагинации в строке запроса
+    """
+    limit: int = Field(100, ge=1)
+    cursor: Optional[str] = None
+    before_id: Optional[int] = None
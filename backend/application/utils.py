@@ -1,18 +1,74 @@
 """
 Вспомогательные функции, которые используются во view функциях
 """
-from typing import Dict
-from datetime import datetime
+from typing import Callable, Dict, Optional, Set, Tuple, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import lru_cache
+from collections import OrderedDict
+import base64
+import binascii
+import asyncio
+import hashlib
+import hmac
 import json
+import os
+import threading
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-import bcrypt
 from fastapi import Request, HTTPException, status, WebSocket
+from backend.metrics import metrics
 from .config import config
+from .backplane import ChatBackplane, InProcessBackplane, PayloadTooLargeError
+
+T = TypeVar('T')
+
+
+PASSWORD_HASH_SCHEMES = ('bcrypt', 'argon2')
+
+
+def create_password_context() -> CryptContext:
+    """
+    Создаёт контекст для хэширования паролей по настройкам из окружения:
+
+    - PASSWORD_HASH_SCHEME - bcrypt (по умолчанию) или argon2 (нужен пакет argon2-cffi)
+    - PASSWORD_BCRYPT_ROUNDS - стоимость bcrypt (по умолчанию 12)
+    - PASSWORD_ARGON2_MEMORY_COST, PASSWORD_ARGON2_TIME_COST, PASSWORD_ARGON2_PARALLELISM -
+      параметры argon2id (память в КиБ, число проходов и потоков)
+
+    Хэши других схем и с другими параметрами по-прежнему проверяются,
+    но считаются устаревшими и пересчитываются при следующем входе.
+
+    Returns:
+        CryptContext
+    """
+    scheme = os.getenv('PASSWORD_HASH_SCHEME', 'bcrypt')
+    if scheme not in PASSWORD_HASH_SCHEMES:
+        raise ValueError(f'Неизвестная схема хэширования паролей: {scheme}')
+    bcrypt_rounds = int(os.getenv('PASSWORD_BCRYPT_ROUNDS', 12))
+    settings = {
+        # Совпадающие границы заставляют needs_update пересчитывать хэши,
+        # созданные с другой стоимостью, в том числе при её снижении
+        'bcrypt__default_rounds': bcrypt_rounds,
+        'bcrypt__min_rounds': bcrypt_rounds,
+        'bcrypt__max_rounds': bcrypt_rounds,
+    }
+    schemes = ['bcrypt']
+    if scheme == 'argon2':
+        schemes.insert(0, 'argon2')
+        settings.update({
+            'argon2__type': 'ID',
+            'argon2__memory_cost': int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', 65536)),
+            'argon2__time_cost': int(os.getenv('PASSWORD_ARGON2_TIME_COST', 3)),
+            'argon2__parallelism': int(os.getenv('PASSWORD_ARGON2_PARALLELISM', 4)),
+        })
+    return CryptContext(schemes=schemes, default=scheme, deprecated="auto", **settings)
 
 
 # Настройка контекста для хэширования
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = create_password_context()
 
 # Хэширование пароля
 def hash_password(password: str) -> str:
@@ -36,11 +92,230 @@ def verify_password(stored_hashed_password: str, provided_password: str) -> bool
     Returns:
         bool - результат проверки
     """
-    return bcrypt.checkpw(provided_password.encode('utf-8'), stored_hashed_password.encode('utf-8'))
+    return pwd_context.verify(provided_password, stored_hashed_password)
+
+def password_needs_rehash(stored_hashed_password: str) -> bool:
+    """
+    Проверяет, создан ли хэш с устаревшей схемой или параметрами
+
+    Args:
+        stored_hashed_password (str): хэш
+    Returns:
+        bool - нужно ли пересчитать хэш
+    """
+    return pwd_context.needs_update(stored_hashed_password)
+
+
+class PasswordHashingPool:
+    """
+    Ограниченный пул потоков для хэширования и проверки паролей.
+
+    bcrypt занимает сотни миллисекунд процессорного времени, поэтому его
+    нельзя вызывать прямо в event loop. Пул выполняет не больше max_workers
+    операций одновременно, а ждать в очереди могут не больше max_queue
+    запросов - остальные сразу получают 503, чтобы всплеск логинов
+    не копил бесконечную очередь.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='password-hashing'
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        metrics.register_gauge('password_hashing_in_flight', lambda: self._in_flight)
+        metrics.register_gauge('password_hashing_running', lambda: self._running)
+        metrics.register_gauge('password_hashing_queue_depth', lambda: self.queue_depth)
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Количество операций, ожидающих свободного потока
+        """
+        with self._lock:
+            return self._in_flight - self._running
+
+    def _call(self, func: Callable[..., T], queued_at: float, *args) -> T:
+        with self._lock:
+            self._running += 1
+        started_at = time.perf_counter()
+        metrics.observe('password_hashing_wait_seconds', started_at - queued_at)
+        try:
+            return func(*args)
+        finally:
+            metrics.observe('password_hashing_seconds', time.perf_counter() - started_at)
+            with self._lock:
+                self._running -= 1
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """
+        Выполняет функцию в пуле и дожидается результата
+
+        Args:
+            func: синхронная функция
+            args: её аргументы
+        Returns:
+            результат функции
+        """
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                metrics.inc('password_hashing_rejected')
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Сервер перегружен, попробуйте позже",
+                )
+            self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, self._call, func, time.perf_counter(), *args
+            )
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            metrics.inc('password_hashing_completed')
+
+
+password_hashing_pool = PasswordHashingPool(
+    max_workers=int(os.getenv('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1)),
+    max_queue=int(os.getenv('PASSWORD_HASHING_MAX_QUEUE', 64)),
+)
+
+async def hash_password_async(password: str) -> str:
+    """
+    Хэширует пароль в пуле потоков, не блокируя event loop
+
+    Args:
+        password (str): пароль
+    Returns:
+        str - хэш
+    """
+    return await password_hashing_pool.run(hash_password, password)
+
+async def verify_password_async(stored_hashed_password: str, provided_password: str) -> bool:
+    """
+    Сверяет пароль и хэш из бд в пуле потоков, не блокируя event loop
+
+    Args:
+        stored_hashed_password (str): хэш
+        provided_password (str): пароль
+    Returns:
+        bool - результат проверки
+    """
+    return await password_hashing_pool.run(
+        verify_password, stored_hashed_password, provided_password
+    )
+
+class VerifiedTokenCache:
+    """
+    Ограниченный LRU-кэш проверенных токенов авторизации.
+
+    Ключ - sha256 от токена (сами токены в памяти не храним), значение -
+    id пользователя из токена и срок действия токена. Запись живёт до
+    истечения токена, поэтому повторная проверка подписи не нужна.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token: str) -> Optional[str]:
+        """
+        Возвращает id пользователя для ранее проверенного и ещё не истёкшего токена
+
+        Args:
+            token (str): токен
+        Returns:
+            str - id пользователя или None
+        """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user_id
+
+    def put(self, token: str, user_id: str, expires_at: float) -> None:
+        """
+        Запоминает проверенный токен
+
+        Args:
+            token (str): токен
+            user_id (str): id пользователя из токена
+            expires_at (float): время истечения токена (unix timestamp)
+        """
+        if self.max_size <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (user_id, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Очищает кэш
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = VerifiedTokenCache(max_size=int(os.getenv('TOKEN_CACHE_SIZE', 10000)))
+
+def decode_access_token(token: str) -> str:
+    """
+    Проверяет подпись, срок действия и тип токена и достаёт из него id пользователя
+
+    Args:
+        token (str): токен
+    Returns:
+        str - id в формате строки
+    """
+    try:
+        payload = jwt.decode(
+            token,
+            config.JWT_SECRET_KEY,  # Ваш секретный ключ
+            algorithms=[config.JWT_ALGORITHM]  # Алгоритм, используемый для подписи токена
+        )
+    except JWTError:
+        metrics.inc('auth_token_rejected')
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Не удалось декодировать токен",
+        )
+    user_id = payload.get("sub")
+    expires_at = payload.get("exp")
+    if (
+        payload.get("type") != "access" or not isinstance(user_id, str)
+        or not user_id.isdigit() or expires_at is None
+    ):
+        metrics.inc('auth_token_rejected')
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Неверный токен",
+        )
+    token_cache.put(token, user_id, float(expires_at))
+    return user_id
 
 async def get_current_user_id(request: Request) -> str:
     """
-    Достаёт из файлов куки токен авторизации и дешифрует оттуда id пользователя
+    Достаёт из файлов куки токен авторизации и дешифрует оттуда id пользователя.
+    Токен проверяется один раз за время жизни: результат проверки кэшируется
+    до истечения токена.
 
     Args:
         request (Request): http request
@@ -53,60 +328,391 @@ async def get_current_user_id(request: Request) -> str:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Токен отсутствует",
         )
-    try:
-        payload = jwt.decode(
-            token,
-            config.JWT_SECRET_KEY,  # Ваш секретный ключ
-            algorithms=[config.JWT_ALGORITHM]  # Алгоритм, используемый для подписи токена
-        )
-        user_id: str = payload.get("sub")
-        if not user_id.isdigit():
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Неверный токен",
-            )
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        metrics.inc('auth_token_cache_hits')
         return user_id
-    except JWTError:
+    metrics.inc('auth_token_cache_misses')
+    return decode_access_token(token)
+
+async def require_metrics_access(request: Request) -> None:
+    """
+    Пускает к метрикам. Если задана переменная окружения METRICS_TOKEN,
+    требуется заголовок Authorization: Bearer <токен> (для сборщика метрик),
+    иначе - авторизованный пользователь.
+
+    Args:
+        request (Request): http request
+    """
+    metrics_token = os.getenv('METRICS_TOKEN')
+    if not metrics_token:
+        await get_current_user_id(request)
+        return
+    authorization = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(authorization.encode(), f'Bearer {metrics_token}'.encode()):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Не удалось декодировать токен",
+            detail="Неверный токен метрик",
         )
 
 
+def encode_cursor(last_id: int) -> str:
+    """
+    Кодирует id последнего обьекта страницы в непрозрачный курсор
+
+    Args:
+        last_id (int): id последнего обьекта на странице
+    Returns:
+        str - курсор
+    """
+    return base64.urlsafe_b64encode(f'id:{last_id}'.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Декодирует курсор, полученный от клиента, обратно в id
+
+    Args:
+        cursor (str): курсор
+    Returns:
+        int - id, начиная с которого (не включительно) надо отдавать обьекты
+    """
+    try:
+        prefix, last_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split(':')
+        if prefix != 'id' or not last_id.isdigit():
+            raise ValueError
+        return int(last_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Неверный курсор") from None
+
+
+def resolve_before_id(cursor: Optional[str], before_id: Optional[int]) -> Optional[int]:
+    """
+    Определяет границу keyset-пагинации по курсору или явному before_id
+    (курсор имеет приоритет)
+
+    Args:
+        cursor (str): курсор или None
+        before_id (int): id или None
+    Returns:
+        int или None - id, меньше которого должны быть обьекты страницы
+    """
+    if cursor:
+        return decode_cursor(cursor)
+    return before_id
+
+
+def split_page(objects: list, limit: int) -> Tuple[list, Optional[str]]:
+    """
+    Отрезает от выборки из limit + 1 обьектов лишний обьект и
+    формирует курсор следующей страницы
+
+    Args:
+        objects (list): обьекты, отсортированные по убыванию id
+        limit (int): размер страницы
+    Returns:
+        tuple - обьекты страницы и курсор следующей страницы (или None)
+    """
+    if len(objects) > limit:
+        page = objects[:limit]
+        return page, encode_cursor(page[-1].id)
+    return objects, None
+
+
+# Картинки постов никогда не меняются, поэтому их можно кэшировать надолго
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Аватарка по тому же адресу может смениться, поэтому браузер должен
+# каждый раз переспрашивать сервер (и получать 304, если она не менялась)
+AVATAR_CACHE_CONTROL = 'public, no-cache'
+
+
+def make_etag(content_hash: str) -> str:
+    """
+    Формирует значение заголовка ETag из хэша содержимого
+
+    Args:
+        content_hash (str): хэш содержимого
+    Returns:
+        str - ETag в кавычках
+    """
+    return f'"{content_hash}"'
+
+
+@lru_cache(maxsize=None)
+def get_file_etag(path: str) -> str:
+    """
+    Считает ETag статического файла (один раз за время работы процесса)
+
+    Args:
+        path (str): путь к файлу
+    Returns:
+        str - ETag
+    """
+    with open(path, 'rb') as file:
+        return make_etag(hashlib.sha256(file.read()).hexdigest())
+
+
+def to_http_date(moment: datetime) -> str:
+    """
+    Переводит время в формат http-заголовков (Last-Modified)
+
+    Args:
+        moment (datetime): время (без часового пояса считается UTC)
+    Returns:
+        str
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return format_datetime(moment.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def get_cache_headers(
+        etag: str, last_modified: Optional[datetime], cache_control: str
+) -> Dict[str, str]:
+    """
+    Формирует заголовки кэширования для ответа с картинкой
+
+    Args:
+        etag (str): ETag
+        last_modified (datetime): время изменения или None
+        cache_control (str): значение Cache-Control
+    Returns:
+        dict - заголовки
+    """
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if last_modified:
+        headers['Last-Modified'] = to_http_date(last_modified)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Проверяет условные заголовки запроса (If-None-Match, If-Modified-Since):
+    если у клиента уже есть актуальная версия, можно ответить 304.
+    If-Modified-Since учитывается только при отсутствии If-None-Match.
+
+    Args:
+        request (Request): http request
+        etag (str): текущий ETag
+        last_modified (datetime): время изменения или None
+    Returns:
+        bool
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        client_etags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return etag in client_etags
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified:
+        try:
+            client_time = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if client_time.tzinfo is None:
+            client_time = client_time.replace(tzinfo=timezone.utc)
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= client_time
+    return False
+
+
 async def process_voting_variants(variants) -> list:
     """
     Обрабатывает данные голосования для возврата пользователю (высчитывает процент)
     
     Args:
-        variants (list): варианты
+        variants (list): варианты (строки с полями id, text и votes_count)
     Returns:
         list - в обработанном формате
     """
     if not variants:
         return []
 
-    total_votes = sum(len(variant.votes) for variant in variants)
+    total_votes = sum(variant.votes_count for variant in variants)
     return [
         {
             'id': variant.id,
             'text': variant.text,
-            'percent': round((len(variant.votes) / total_votes * 100) if total_votes else 0),
-            'votes_count':len(variant.votes)
+            'percent': round((variant.votes_count / total_votes * 100) if total_votes else 0),
+            'votes_count':variant.votes_count
         }
         for variant in variants
     ]
 
 
+CHAT_OVERFLOW_POLICIES = ('disconnect', 'drop_oldest', 'drop_newest')
+
+# Сообщение, которое отправляется в пустое соединение, чтобы прокси
+# не закрывали его по таймауту и чтобы быстрее замечать мёртвые сокеты
+HEARTBEAT_MESSAGE = json.dumps({'type': 'ping'})
+
+
+class ChatConnection:
+    """
+    Одно websocket-соединение с собственной ограниченной очередью исходящих
+    сообщений. Очередь разбирает отдельная задача-писатель, поэтому
+    отправитель сообщения никогда не ждёт медленного получателя.
+
+    Если очередь переполнена, срабатывает политика:
+    disconnect - соединение закрывается (клиент переподключится и
+    подгрузит историю), drop_oldest / drop_newest - выбрасывается самое
+    старое или новое сообщение.
+    """
+
+    def __init__(
+        self, websocket: WebSocket, max_queue: int, overflow_policy: str,
+        heartbeat_interval: float, send_timeout: float
+    ):
+        if overflow_policy not in CHAT_OVERFLOW_POLICIES:
+            raise ValueError(f'Неизвестная политика переполнения очереди: {overflow_policy}')
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.overflow_policy = overflow_policy
+        self.heartbeat_interval = heartbeat_interval
+        self.send_timeout = send_timeout
+        self.closed = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._close_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+        Запускает задачу-писателя
+        """
+        self._loop = asyncio.get_running_loop()
+        self._writer_task = self._loop.create_task(self._write_loop())
+
+    def enqueue(self, payload: str) -> bool:
+        """
+        Ставит сообщение в очередь на отправку, не дожидаясь её.
+        Можно вызывать из другого event loop (потока) - тогда сообщение
+        передаётся в loop соединения потокобезопасно.
+
+        Args:
+            payload (str): сообщение
+        Returns:
+            bool - попало ли сообщение в очередь
+        """
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is not self._loop:
+            self._loop.call_soon_threadsafe(self._enqueue, payload)
+            return not self.closed
+        return self._enqueue(payload)
+
+    def _enqueue(self, payload: str) -> bool:
+        if self.closed:
+            return False
+        if self.queue.full():
+            if self.overflow_policy == 'disconnect':
+                metrics.inc('chat_slow_consumers_disconnected')
+                self.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return False
+            metrics.inc('chat_messages_dropped')
+            if self.overflow_policy == 'drop_newest':
+                return False
+            self.queue.get_nowait()
+        self.queue.put_nowait((payload, time.perf_counter()))
+        return True
+
+    async def _write_loop(self) -> None:
+        while True:
+            try:
+                payload, queued_at = await asyncio.wait_for(
+                    self.queue.get(), timeout=self.heartbeat_interval
+                )
+            except asyncio.TimeoutError:
+                payload, queued_at = HEARTBEAT_MESSAGE, None
+            try:
+                await asyncio.wait_for(self.websocket.send_text(payload), timeout=self.send_timeout)
+            except Exception:
+                metrics.inc('chat_send_failures')
+                self.close()
+                return
+            if queued_at is not None:
+                metrics.inc('chat_messages_sent')
+                metrics.observe('chat_send_latency_seconds', time.perf_counter() - queued_at)
+
+    def close(self, code: Optional[int] = None) -> None:
+        """
+        Останавливает писателя, неотправленные сообщения отбрасываются.
+        Если передан code, закрывает и сам websocket с этим кодом.
+
+        Args:
+            code (int): код закрытия websocket
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer_task is not None and self._writer_task is not asyncio.current_task():
+            self._writer_task.cancel()
+        if code is not None:
+            self._close_task = asyncio.ensure_future(self._close_websocket(code))
+
+    async def _close_websocket(self, code: int) -> None:
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
 class WebSocketConnectionManager:
     """
-    Упрощает обработку websocket-соединений
+    Упрощает обработку websocket-соединений. У пользователя может быть
+    несколько соединений (вкладок), а сообщения ходят через шину, поэтому
+    доходят до получателя, к какому бы воркеру он ни был подключён.
     """
 
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+    def __init__(self, backplane: Optional[ChatBackplane] = None):
+        self.active_connections: Dict[str, Dict[WebSocket, ChatConnection]] = {}
+        self.backplane = backplane or InProcessBackplane()
+        self.backplane.subscribe(self.deliver_local)
+        self.max_queue = int(os.getenv('CHAT_OUTBOUND_QUEUE_SIZE', 100))
+        self.overflow_policy = os.getenv('CHAT_OVERFLOW_POLICY', 'disconnect')
+        self.heartbeat_interval = float(os.getenv('CHAT_HEARTBEAT_INTERVAL', 25))
+        self.send_timeout = float(os.getenv('CHAT_SEND_TIMEOUT', 10))
+        metrics.register_gauge('chat_connections', self.connections_count)
+        metrics.register_gauge('chat_outbound_queue_depth', self.outbound_queue_depth)
+
+
+    def connections_count(self) -> int:
+        """
+        Количество соединений, подключённых к этому процессу
+        """
+        return sum(len(connections) for connections in self.active_connections.values())
 
 
-    async def connect(self, user_id: str, websocket: WebSocket):
+    def outbound_queue_depth(self) -> int:
+        """
+        Суммарное количество сообщений, ожидающих отправки
+        """
+        return sum(
+            connection.queue.qsize()
+            for connections in list(self.active_connections.values())
+            for connection in list(connections.values())
+        )
+
+
+    async def start(self):
+        """
+        Подключает шину сообщений (вызывается при старте приложения)
+        """
+        await self.backplane.start()
+
+
+    async def stop(self):
+        """
+        Отключает шину сообщений (вызывается при остановке приложения)
+        """
+        await self.backplane.stop()
+
+
+    async def connect(self, user_id: str, websocket: WebSocket) -> ChatConnection:
         """
         Устанавливает соединение через websocket с
         пользователем
@@ -116,39 +722,72 @@ class WebSocketConnectionManager:
             websocket: вебсокет
 
         Returns:
-            None
+            ChatConnection - соединение с очередью исходящих сообщений
         """
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        connection = ChatConnection(
+            websocket, max_queue=self.max_queue, overflow_policy=self.overflow_policy,
+            heartbeat_interval=self.heartbeat_interval, send_timeout=self.send_timeout
+        )
+        connection.start()
+        self.active_connections.setdefault(user_id, {})[websocket] = connection
+        return connection
 
 
-    def disconnect(self, user_id: str):
+    def disconnect(self, user_id: str, websocket: WebSocket):
         """
-        Отключает соединение с через вебсокетом
+        Отключает одно соединение пользователя
 
         Args:
             user_id (str): id отключаемого пользователя
+            websocket: вебсокет
         Returns:
             None
         """
-        if user_id in self.active_connections:
+        connections = self.active_connections.get(user_id)
+        if connections is None:
+            return
+        connection = connections.pop(websocket, None)
+        if connection is not None:
+            connection.close()
+        if not connections:
             del self.active_connections[user_id]
 
 
-    async def send_personal_message(self, message_id: int, author_id: str, text: str, user_id: str):
+    async def send_personal_message(
+        self, message_id: int, author_id: str, text: str, user_id: str,
+        created_at: Optional[datetime] = None
+    ):
         """
-        Отправляет персональное сообщение в формате JSON
+        Отправляет персональное сообщение в формате JSON через шину
 
         Args:
             author_id: ID отправителя
             text: Текст сообщения
             user_id: ID получателя
+            created_at: Время создания сообщения (по умолчанию - текущее)
+        """
+        message_data = {
+            'id':message_id,
+            'author_id': author_id,
+            'text': text,
+            'created_at': (created_at or datetime.now()).isoformat()
+        }
+        try:
+            await self.backplane.publish(str(user_id), json.dumps(message_data))
+        except PayloadTooLargeError:
+            # Сообщение уже сохранено в бд, получатель увидит его в истории чата
+            metrics.inc('chat_messages_too_large')
+
+
+    async def deliver_local(self, user_id: str, payload: str):
+        """
+        Ставит сообщение из шины в очереди всех соединений получателя,
+        подключённых к этому процессу
+
+        Args:
+            user_id: ID получателя
+            payload: сообщение в JSON
         """
-        if user_id in self.active_connections:
-            message_data = {
-                'id':message_id,
-                'author_id': author_id,
-                'text': text,
-                'created_at': datetime.now().isoformat()
-            }
-            await self.active_connections[user_id].send_text(json.dumps(message_data))
+        for connection in list(self.active_connections.get(user_id, {}).values()):
+            connection.enqueue(payload)
@@ -2,32 +2,45 @@
 View-функции для обработки всех запросов
 """
 import json
-from io import BytesIO
+from typing import Optional
 from fastapi import (
-    HTTPException, Response, WebSocket, WebSocketDisconnect,
-    UploadFile
+    HTTPException, Request, Response, WebSocket, WebSocketDisconnect,
+    UploadFile, BackgroundTasks
 )
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
 from backend.db.models import (
-    User, Post, Comment, Vote, VotingVariant, Message, Friendship, FriendshipRequest,
-    Like, MediaInPost, ComplaintAboutPost, ComplaintAboutComment
+    User, Post, Comment, VotingVariant, Message, Friendship, FriendshipRequest,
+    MediaInPost, ComplaintAboutPost, ComplaintAboutComment
 )
 from backend.db.utils import (
-    delete_object, add_and_refresh_object, get_user_by_email,
-    get_like_on_post_from_user, get_likes_count, get_user_vote,
+    delete_object, delete_post, delete_comment, add_object, get_user_by_email, update_password_hash,
     get_user_by_username, get_existing_friendship, get_existing_friendship_request,
     get_all_from_table, get_post_voting_variants, get_object_by_id,
     get_messages_between_two_users, get_votes_on_voting_variant,
     get_user_posts, get_user_friends, get_friendship_requests_for_user,
+    get_usernames_by_ids, get_media_ids_for_posts,
+    get_liked_post_ids, get_voting_variants_for_posts, get_comments_for_posts,
+    get_post_with_author_username, is_post_liked_by_user,
+    change_post_counter, add_voting_variants, delete_voting_variants, add_like, delete_like,
+    get_voting_variant_post_id, delete_user_vote, add_user_vote,
+    get_media_blob, get_user_avatar_blob, get_image_variant,
+    get_conversations, mark_conversation_read, update_conversations_before_message_delete,
 )
 from backend.application.utils import (
-    hash_password, verify_password, WebSocketConnectionManager, process_voting_variants
+    hash_password_async, verify_password_async, password_needs_rehash,
+    WebSocketConnectionManager, process_voting_variants,
+    resolve_before_id, split_page, make_etag, get_file_etag, get_cache_headers,
+    is_not_modified, IMMUTABLE_CACHE_CONTROL, AVATAR_CACHE_CONTROL
 )
+from backend.db.message_writer import MessageWriter
 from backend.log.log_config import logger
+from backend.storage.blob_storage import blob_storage
+from backend.storage.images import (
+    store_image, InvalidImageError, choose_variant_format, choose_variant_size
+)
 from .schemas import (
     RegisterFormData, LoginFormData, CreatePostData, CreateCommentData, EditProfileFormData,
     EditPostData
@@ -65,15 +78,36 @@ async def register_view(data: RegisterFormData, db: AsyncSession) -> dict:
         email=data.email,
         name=data.name,
         surname=data.surname,
-        password=hash_password(data.password)
+        password=await hash_password_async(data.password)
     )
-    await add_and_refresh_object(new_user, db)
+    await add_object(new_user, db)
     logger.info(f'Пользователь c id {new_user.id} зарегистрировался')
 
     return {'status': 'ok'}
 
 
-async def login_view(data: LoginFormData, response: Response, db: AsyncSession) -> dict:
+async def rehash_password(user_id: int, old_hash: str, password: str, bind) -> None:
+    """
+    Пересчитывает хэш пароля с текущими настройками. Выполняется в фоне
+    после ответа на запрос входа, поэтому открывает собственную сессию.
+
+    Args:
+        user_id (int): ID пользователя.
+        old_hash (str): Устаревший хэш.
+        password (str): Пароль, прошедший проверку.
+        bind: Движок базы данных, с которым работал запрос.
+    """
+    new_hash = await hash_password_async(password)
+    async with AsyncSession(bind=bind, expire_on_commit=False) as db:
+        if await update_password_hash(user_id, old_hash, new_hash, db):
+            await db.commit()
+            logger.info(f'Хэш пароля пользователя c id {user_id} пересчитан')
+
+
+async def login_view(
+    data: LoginFormData, response: Response, db: AsyncSession,
+    background_tasks: Optional[BackgroundTasks] = None
+) -> dict:
     """
     Авторизует пользователя.
 
@@ -81,6 +115,8 @@ async def login_view(data: LoginFormData, response: Response, db: AsyncSession)
         data (LoginFormData): Данные для входа.
         response (Response): Объект ответа FastAPI.
         db (AsyncSession): Сессия базы данных.
+        background_tasks (BackgroundTasks): Фоновые задачи, в которых
+            пересчитывается устаревший хэш пароля.
 
     Returns:
         dict: Токен аутентификации.
@@ -91,8 +127,10 @@ async def login_view(data: LoginFormData, response: Response, db: AsyncSession)
             status_code=400,
             detail="Пользователя с таким email не существует! Зарегистрируйтесь, пожалуйста."
         )
-    if not verify_password(user.password, data.password):
+    if not await verify_password_async(user.password, data.password):
         raise HTTPException(status_code=400, detail="Неверный пароль!")
+    if background_tasks is not None and password_needs_rehash(user.password):
+        background_tasks.add_task(rehash_password, user.id, user.password, data.password, db.bind)
 
     token = security.create_access_token(uid=str(user.id))
     response.set_cookie(config.JWT_ACCESS_COOKIE_NAME, token)
@@ -112,13 +150,11 @@ async def create_post_view(data: CreatePostData, user_id: int, db: AsyncSession)
     Returns:
         dict: Статус операции.
     """
+    # Пост и все варианты голосования записываются в одной транзакции
     post = Post(text=data.text, author_id=user_id)
-    await add_and_refresh_object(post, db)
-
-    if data.options:
-        for option in data.options:
-            var = VotingVariant(post_id=post.id, text=option)
-            await add_and_refresh_object(var, db)
+    db.add(post)
+    await db.flush()
+    await add_voting_variants(post.id, data.options or [], db)
 
     logger.info(f'Пользователь c id {user_id} создал пост с id {post.id}')
     return {'status': 'ok'}
@@ -160,12 +196,12 @@ async def create_friendship_request_view(
     if mutual_request:
         new_friendship = Friendship(first_friend_id=author_id, second_friend_id=getter_id)
         await delete_object(mutual_request, db)
-        await add_and_refresh_object(new_friendship, db)
+        await add_object(new_friendship, db)
         logger.info(f'Пользователь c id {author_id} теперь дружит с {getter_id}')
         return {'status': 'you got a new friend!'}
 
     new_request = FriendshipRequest(author_id=author_id, getter_id=getter_id)
-    await add_and_refresh_object(new_request, db)
+    await add_object(new_request, db)
     logger.info(f'Пользователь c id {author_id} отправил запрос дружбы пользователю {getter_id}')
     return {'status': 'запрос отправлен, ожидайте ответа от пользователя'}
 
@@ -207,10 +243,8 @@ async def edit_profile_view(
     if data.surname:
         user.surname = data.surname
     if data.password:
-        user.password = hash_password(data.password)
+        user.password = await hash_password_async(data.password)
 
-    await db.commit()
-    await db.refresh(user)
     logger.info(f'Пользователь c id {author_id} изменил свой профиль')
     return {'status': 'ok'}
 
@@ -234,7 +268,8 @@ async def create_comment_view(
         raise HTTPException(status_code=400, detail="Поста с таким id не существует!")
 
     comment = Comment(text=data.text, post_id=post_id, author_id=user_id)
-    await add_and_refresh_object(comment, db)
+    db.add(comment)
+    await change_post_counter(post_id, 'comments_count', 1, db)
     return {'status': 'ok'}
 
 
@@ -250,34 +285,39 @@ async def create_or_delete_like_view(post_id: int, user_id: int, db: AsyncSessio
     Returns:
         dict: Статус операции и количество лайков.
     """
+    # Лайк ставится или снимается одним запросом, счётчик меняется вместе с ним
+    # и возвращается из того же UPDATE. Уникальный ключ (post_id, author_id)
+    # не даёт двойному клику создать два лайка
+    if await add_like(post_id, user_id, db):
+        likes_count = await change_post_counter(post_id, 'likes_count', 1, db)
+        return {'status': 'liked', 'likes_count': likes_count}
+
+    if await delete_like(post_id, user_id, db):
+        likes_count = await change_post_counter(post_id, 'likes_count', -1, db)
+        return {'status': 'unliked', 'likes_count': likes_count}
+
+    # Ни вставки, ни удаления: поста нет, либо лайк снял параллельный запрос
     post = await get_object_by_id(object_type=Post, id=post_id, db=db)
     if not post:
         raise HTTPException(status_code=400, detail="Такого поста не существует!")
-
-    like = await get_like_on_post_from_user(post_id, user_id, db)
-    if not like:
-        new_like = Like(post_id=post_id, author_id=user_id)
-        await add_and_refresh_object(new_like, db)
-        return {'status': 'liked', 'likes_count': await get_likes_count(post_id, db)}
-
-    await delete_object(like, db)
-    return {'status': 'unliked', 'likes_count': await get_likes_count(post_id, db)}
+    return {'status': 'unliked', 'likes_count': post.likes_count}
 
 
 async def handle_websocket(
     websocket: WebSocket, user_id: str, manager: WebSocketConnectionManager,
-    db: AsyncSession
+    writer: MessageWriter
 ) -> None:
     """
-    Обрабатывает WebSocket-соединение.
+    Обрабатывает WebSocket-соединение. Сообщения доставляются получателю
+    сразу, а в бд записываются пакетами через MessageWriter.
 
     Args:
         websocket (WebSocket): WebSocket-соединение.
         user_id (str): ID пользователя.
         manager (WebSocketConnectionManager): Менеджер соединений.
-        db (AsyncSession): Сессия базы данных.
+        writer (MessageWriter): Буфер записи сообщений в бд.
     """
-    await manager.connect(user_id, websocket)
+    connection = await manager.connect(user_id, websocket)
     try:
         while True:
             data = await websocket.receive_text()
@@ -286,21 +326,22 @@ async def handle_websocket(
             message = message_data.get("message")
 
             if recipient_id and message:
-                new_message = Message(
-                    text=message,
-                    author_id=int(user_id),
-                    getter_id=int(recipient_id)
+                new_message = await writer.submit(
+                    author_id=int(user_id), getter_id=int(recipient_id), text=message
                 )
-                await add_and_refresh_object(new_message, db)
                 await manager.send_personal_message(
-                    message_id=new_message.id,
+                    message_id=new_message['id'],
                     author_id=user_id,
-                    text=message, user_id=recipient_id
+                    text=message, user_id=recipient_id,
+                    created_at=new_message['created_at']
                 )
             else:
-                await websocket.send_text("Invalid message format")
+                connection.enqueue("Invalid message format")
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        pass
+    finally:
+        manager.disconnect(user_id, websocket)
+        await writer.flush()
 
 
 async def vote_view(variant_id: int, user_id: int, db: AsyncSession) -> dict:
@@ -315,23 +356,15 @@ async def vote_view(variant_id: int, user_id: int, db: AsyncSession) -> dict:
     Returns:
         dict: Статус операции.
     """
-    var = await db.execute(
-        select(VotingVariant)
-        .where(VotingVariant.id == variant_id)
-        .options(selectinload(VotingVariant.post).selectinload(Post.voting_variants))
-    )
-    var = var.scalars().first()
+    post_id = await get_voting_variant_post_id(variant_id, db)
 
-    if not var:
+    if post_id is None:
         raise HTTPException(status_code=400, detail="Такого варианта голосования не существует!")
 
-    for variant in var.post.voting_variants:
-        vote = await get_user_vote(variant.id, user_id, db)
-        if vote:
-            await delete_object(vote, db)
-
-    new_vote = Vote(user_id=user_id, variant_id=variant_id)
-    await add_and_refresh_object(new_vote, db)
+    # Прежний голос снимается и новый ставится в одной транзакции. Уникальный
+    # ключ (post_id, user_id) не даёт параллельным запросам оставить два голоса
+    await delete_user_vote(post_id, user_id, db)
+    await add_user_vote(post_id, variant_id, user_id, db)
     return {'status': 'ok'}
 
 
@@ -358,53 +391,198 @@ async def add_media_to_post_view(
     if post.author_id != user_id:
         raise HTTPException(status_code=403, detail="Вы не являетесь автором поста")
 
-    file_bytes = await uploaded_file.read()
+    blob_hash = await save_uploaded_image(uploaded_file=uploaded_file, db=db)
 
-    new_media = MediaInPost(post_id=post_id, image=file_bytes)
+    new_media = MediaInPost(post_id=post_id, blob_hash=blob_hash)
 
-    await add_and_refresh_object(object=new_media, db=db)
+    await add_object(object=new_media, db=db)
     return {'status': 'file successfully added'}
 
 
-async def get_posts_view(user_id: int, db: AsyncSession, skip: int, limit: int):
+async def save_uploaded_image(uploaded_file: UploadFile, db: AsyncSession) -> str:
+    """
+    Сохраняет загруженную картинку в хранилище файлов и добавляет
+    её метаданные в бд (без коммита). Картинка проверяется, из неё
+    удаляются метаданные и генерируются уменьшенные копии.
+    Одинаковые файлы хранятся один раз.
+
+    Args:
+        uploaded_file (UploadFile): картинка от пользователя
+        db (AsyncSession): Сессия базы данных.
+    Returns:
+        str: хэш содержимого (ключ в хранилище)
+    """
+    file_bytes = await uploaded_file.read()
+    try:
+        return await store_image(data=file_bytes, storage=blob_storage, db=db)
+    except InvalidImageError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+async def image_response(
+    request: Request, blob_hash: str, content_type: str, last_modified,
+    cache_control: str, size: int, db: AsyncSession
+):
+    """
+    Отдаёт картинку из хранилища: оригинал или, если передан size,
+    ближайшую уменьшенную копию в формате, который поддерживает клиент
+
+    Args:
+        request (Request): http request
+        blob_hash (str): ключ оригинала
+        content_type (str): mime-тип оригинала
+        last_modified (datetime): время изменения
+        cache_control (str): значение Cache-Control
+        size (int): нужный размер или None для оригинала
+        db (AsyncSession): Сессия базы данных.
+    Returns:
+        Response
+    """
+    if size:
+        variant = await get_image_variant(
+            source_hash=blob_hash, size=choose_variant_size(size),
+            image_format=choose_variant_format(request.headers.get('accept')), db=db
+        )
+        if variant:
+            response = blob_response(
+                request, variant.blob_hash, variant.content_type, last_modified, cache_control
+            )
+            response.headers['Vary'] = 'Accept'
+            return response
+    return blob_response(request, blob_hash, content_type, last_modified, cache_control)
+
+
+def blob_response(
+    request: Request, blob_hash: str, content_type: str,
+    last_modified, cache_control: str
+):
+    """
+    Формирует ответ с файлом из хранилища. ETag - хэш содержимого, поэтому
+    если у клиента уже есть этот файл, отдаётся 304 без чтения файла.
+
+    Args:
+        request (Request): http request (для условных заголовков)
+        blob_hash (str): ключ файла в хранилище
+        content_type (str): mime-тип
+        last_modified (datetime): время изменения или None
+        cache_control (str): значение Cache-Control
+    Returns:
+        Response 304, FileResponse для локального хранилища,
+        иначе Response с содержимым
+    """
+    etag = make_etag(blob_hash)
+    headers = get_cache_headers(etag, last_modified, cache_control)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    path = blob_storage.local_path(blob_hash)
+    if path:
+        return FileResponse(path, media_type=content_type, headers=headers)
+    return Response(
+        content=blob_storage.read(blob_hash), media_type=content_type, headers=headers
+    )
+
+
+async def get_posts_view(
+    user_id: int, db: AsyncSession, skip: int, limit: int,
+    cursor: str = None, before_id: int = None
+):
     """
     Отдаёт данные для отрисовки ленты постов.
+    Если передан курсор или before_id, используется keyset-пагинация
+    (WHERE id < before_id), иначе - старый режим со смещением skip.
 
     Args:
         user_id (str): ID пользователя.
         db (AsyncSession): Сессия базы данных.
         skip (int): сколько постов пропустить (пагинация)
         limit (int): сколько постов вернуть
+        cursor (str): курсор следующей страницы из предыдущего ответа
+        before_id (int): вернуть посты с id меньше этого
     Returns:
-        dict: Данные в виде json
+        dict: Данные в виде json (посты и курсор следующей страницы)
+    """
+    before_id = resolve_before_id(cursor, before_id)
+    posts_db = await get_all_from_table(
+        object_type=Post, db=db, limit=limit + 1, skip=skip, before_id=before_id
+    )
+    posts_db, next_cursor = split_page(posts_db, limit)
+    return {
+        'posts': await build_posts_data(posts_db=posts_db, user_id=user_id, db=db),
+        'next_cursor': next_cursor
+    }
+
+
+async def build_posts_data(posts_db: list, user_id: int, db: AsyncSession) -> list:
     """
-    posts_db = await get_all_from_table(object_type=Post, db=db, limit=limit, skip=skip)
-    posts=[]
-    for post in posts_db:
-        post_data = await get_post_view(post_id=post.id, user_id=user_id, db=db)
-        posts.append(post_data.get('post'))
-    return {'posts':posts}
+    Собирает данные для отрисовки списка постов. Авторы, картинки, лайки,
+    голосования и комментарии подгружаются для всей страницы сразу
+    фиксированным числом запросов, независимо от количества постов.
+    Количество лайков, комментариев и голосов берётся из счётчиков.
+
+    Args:
+        posts_db (list): список обьектов Post
+        user_id (int): ID пользователя, который смотрит посты
+        db (AsyncSession): Сессия базы данных.
+    Returns:
+        list: данные постов в том же формате, что и в get_post_view
+    """
+    if not posts_db:
+        return []
+    post_ids = [post.id for post in posts_db]
+
+    usernames = await get_usernames_by_ids([post.author_id for post in posts_db], db)
+    media = await get_media_ids_for_posts(post_ids, db)
+    liked_post_ids = await get_liked_post_ids(post_ids, user_id, db)
+    voting_variants = await get_voting_variants_for_posts(post_ids, db)
+    comments = await get_comments_for_posts(post_ids, db)
+
+    return [
+        {
+            'id': post.id,
+            'author_id': post.author_id,
+            'author_username': usernames.get(post.author_id),
+            'text': post.text,
+            'created_at': post.created_at,
+            'images_id': media[post.id],
+            'likes_count': post.likes_count,
+            'liked_status': post.id in liked_post_ids,
+            'voting_variants': await process_voting_variants(voting_variants[post.id]),
+            'comments': comments[post.id],
+            'comments_count': post.comments_count,
+        }
+        for post in posts_db
+    ]
 
 
-async def get_post_img_view(image_id: int, db: AsyncSession):
+async def get_post_img_view(
+    image_id: int, request: Request, db: AsyncSession, size: int = None
+):
     """
     Отдаёт файл картинки, прикреплённой к посту
 
     Args:
         image_id (int): id картинки в бд
+        request (Request): http request (для условных заголовков)
         db (AsyncSession): Сессия базы данных.
+        size (int): нужный размер картинки или None для оригинала
     Returns:
-        StreamingResponse: файл картинки
+        Response: файл картинки (или 304, если она не изменилась)
     """
-    img_db = await get_object_by_id(object_type=MediaInPost, id=image_id, db=db)
-    if not img_db:
+    img_db = await get_media_blob(image_id=image_id, db=db)
+    if not img_db or not img_db.blob_hash:
         raise HTTPException(status_code=400, detail="Такой картинки не существует!")
-    return StreamingResponse(BytesIO(img_db.image), media_type='image/png')
+    return await image_response(
+        request, img_db.blob_hash, img_db.content_type,
+        img_db.created_at, IMMUTABLE_CACHE_CONTROL, size, db
+    )
 
 
 async def get_post_view(post_id: int, user_id: int, db: AsyncSession):
     """
-    Возвращает данные в json для просмотра отдельного поста
+    Возвращает данные в json для просмотра отдельного поста.
+    Лайки и голоса не загружаются в виде обьектов: их количество берётся
+    из счётчиков, лайк пользователя проверяется через EXISTS, а комментарии
+    читаются отдельным запросом.
 
     Args:
         post_id (int): id поста
@@ -413,48 +591,28 @@ async def get_post_view(post_id: int, user_id: int, db: AsyncSession):
     Returns:
         json - данные поста
     """
-    stmt = (
-        select(Post)
-        .options(
-            joinedload(Post.author),
-            joinedload(Post.voting_variants).joinedload(VotingVariant.votes),
-            joinedload(Post.media),
-            joinedload(Post.likes),
-            joinedload(Post.comments).joinedload(Comment.author)
-        )
-        .where(Post.id == post_id)
-        # Убираем дубликаты из JOIN (если нужно)
-        .execution_options(populate_existing=True)
-    )
-
-    result = await db.execute(stmt)
-    post_db = result.scalars().first()
+    post_db = await get_post_with_author_username(post_id=post_id, db=db)
 
     if not post_db:
         raise HTTPException(status_code=404, detail="Post not found")
 
+    voting_variants = await get_voting_variants_for_posts([post_id], db)
+    comments = await get_comments_for_posts([post_id], db)
+    media = await get_media_ids_for_posts([post_id], db)
+
     # Обработка данных
     post = {
         'id':post_id,
-        'author_id': post_db.author.id,
-        'author_username': post_db.author.username,
+        'author_id': post_db.author_id,
+        'author_username': post_db.username,
         'text': post_db.text,
         'created_at': post_db.created_at,
-        'images_id': [img.id for img in post_db.media],
-        'likes_count': len(post_db.likes),
-        'liked_status': any(like.author_id == user_id for like in post_db.likes),
-        'voting_variants': await process_voting_variants(post_db.voting_variants),
-        'comments': [
-            {
-                'id': comment.id,
-                'text': comment.text,
-                'author_id': comment.author.id,
-                'author_username': comment.author.username,
-                'created_at': comment.created_at
-            }
-            for comment in post_db.comments
-        ],
-        'comments_count':len(post_db.comments),
+        'images_id': media[post_id],
+        'likes_count': post_db.likes_count,
+        'liked_status': await is_post_liked_by_user(post_id, user_id, db),
+        'voting_variants': await process_voting_variants(voting_variants[post_id]),
+        'comments': comments[post_id],
+        'comments_count':post_db.comments_count,
     }
 
     return {'post': post}
@@ -479,15 +637,19 @@ async def edit_post_view(data: EditPostData, post_id: int, user_id: int, db: Asy
         raise HTTPException(status_code = 400, detail = "Вы не являетесь автором поста!")
     if data.text:
         post.text = data.text
-        await db.commit()
     if data.options is not None:
-        old_options = await get_post_voting_variants(post_id = post_id, db = db)
-        for option in old_options:
-            await delete_object(object = option, db = db)
-        await db.commit()
-        for option in data.options:
-            var = VotingVariant(post_id=post.id, text=option)
-            await add_and_refresh_object(var, db)
+        # Варианты с неизменным текстом остаются вместе с голосами,
+        # удаляются и добавляются только изменённые
+        old_variants = await get_post_voting_variants(post_id = post_id, db = db)
+        new_texts = list(data.options)
+        removed_ids = []
+        for variant in old_variants:
+            if variant.text in new_texts:
+                new_texts.remove(variant.text)
+            else:
+                removed_ids.append(variant.id)
+        await delete_voting_variants(removed_ids, db)
+        await add_voting_variants(post.id, new_texts, db)
     logger.info(f'Пользователь c id {user_id} редактировал пост {post_id}')
     return {'status':'ok'}
 
@@ -508,7 +670,7 @@ async def delete_post_view(post_id: int, user_id: int, db: AsyncSession):
         raise HTTPException(status_code=400, detail="Такого поста не существует!")
     if post.author_id != user_id:
         raise HTTPException(status_code=400, detail="Вы не являетесь автором поста!")
-    await delete_object(object=post, db=db)
+    await delete_post(post.id, db)
     logger.info(f'Пользователь c id {user_id} удалил пост с текстом "{post.text}"')
     return {'status':'ok'}
 
@@ -529,7 +691,8 @@ async def delete_comment_view(comment_id: int, user_id: int, db: AsyncSession):
         raise HTTPException(status_code=400, detail="Такого комментария не существует!")
     if comment.author_id != user_id:
         raise HTTPException(status_code=400, detail="Вы не являетесь автором комментария!")
-    await delete_object(object=comment, db=db)
+    await delete_comment(comment.id, db)
+    await change_post_counter(comment.post_id, 'comments_count', -1, db)
     logger.info(f'Пользователь c id {user_id} удалил коммент с текстом "{comment.text}"')
     return {'status': 'ok'}
 
@@ -545,17 +708,9 @@ async def delete_vote_view(post_id: int, user_id: int, db: AsyncSession):
     Returns:
         json - статус операции
     """
-    result = await db.execute(select(Post).where(Post.id==post_id).options(
-        joinedload(Post.voting_variants)
-    ))
-    post = result.scalars().first()
-    if not post:
+    if not await get_object_by_id(object_type=Post, id=post_id, db=db):
         raise HTTPException(status_code=400, detail="Такого поста не существует")
-    for var in post.voting_variants:
-        vote = await get_user_vote(var_id=var.id, user_id=user_id, db=db)
-        if vote:
-            await delete_object(object=vote, db=db)
-    await db.commit()
+    await delete_user_vote(post_id, user_id, db)
     return {'status':'ok'}
 
 
@@ -575,6 +730,7 @@ async def delete_message_view(message_id: int, user_id: int, db: AsyncSession):
         raise HTTPException(status_code=400, detail="Такого сообщения не существует")
     if message.author_id != user_id:
         raise HTTPException(status_code=400, detail="Вы не автор сообщения")
+    await update_conversations_before_message_delete(message, db)
     await delete_object(object = message, db=db)
     return {'status': 'ok'}
 
@@ -591,50 +747,85 @@ async def change_avatar_view(uploaded_file: UploadFile, user_id: int, db: AsyncS
         json - статус операции
     """
     user = await get_object_by_id(object_type=User, id=user_id, db=db)
-    file_bytes = await uploaded_file.read()
-    user.avatar = file_bytes
-    await db.commit()
+    user.avatar_hash = await save_uploaded_image(uploaded_file=uploaded_file, db=db)
+    user.avatar = None
     return {'status':'ok'}
 
 
-async def get_avatar_view(another_user_id: int, db: AsyncSession):
+async def get_avatar_view(
+    another_user_id: int, request: Request, db: AsyncSession, size: int = None
+):
     """
     Возвращает аватарку пользователя
 
     Args:
         another_user_id (int): id пользователя, аватарку которого мы получаем
-        user_id (int): id пользователя
+        request (Request): http request (для условных заголовков)
         db (AsyncSession): сессия бд
+        size (int): нужный размер аватарки или None для оригинала
     Returns:
-        StreamingResponse - файл аватарки, или None
+        Response - файл аватарки (или 304, если она не изменилась)
     """
-    user = await get_object_by_id(object_type=User, id = another_user_id, db=db)
+    user = await get_user_avatar_blob(user_id=another_user_id, db=db)
     if not user:
         raise HTTPException(status_code=400, detail="Такого юзера не существует")
-    if not user.avatar:
-        return FileResponse('backend/static/avatar.png')
-    return StreamingResponse(BytesIO(user.avatar), media_type='image/png')
+    if not user.avatar_hash:
+        return default_avatar_response(request, user.updated_at)
+    return await image_response(
+        request, user.avatar_hash, user.content_type,
+        user.updated_at, AVATAR_CACHE_CONTROL, size, db
+    )
 
 
-async def get_chat_view(recipient_id: int, user_id: int, db: AsyncSession):
+def default_avatar_response(request: Request, last_modified):
     """
-    Возвращает данные для страницы чата (массив сообщений)
+    Отдаёт стандартную аватарку с теми же заголовками кэширования,
+    что и у загруженных аватарок
+
+    Args:
+        request (Request): http request (для условных заголовков)
+        last_modified (datetime): время изменения профиля пользователя
+    Returns:
+        Response 304 или FileResponse
+    """
+    path = 'backend/static/avatar.png'
+    etag = get_file_etag(path)
+    headers = get_cache_headers(etag, last_modified, AVATAR_CACHE_CONTROL)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type='image/png', headers=headers)
+
+
+async def get_chat_view(
+    recipient_id: int, user_id: int, db: AsyncSession, limit: int = 100,
+    cursor: str = None, before_id: int = None
+):
+    """
+    Возвращает данные для страницы чата: страницу последних сообщений
+    (keyset-пагинация, внутри страницы сообщения идут по времени)
 
     Args:
         recipient_id (int): id собеседника
         user_id (int): id пользователя
         db (AsyncSession): сессия бд
+        limit (int): размер страницы
+        cursor (str): курсор следующей страницы (более старых сообщений)
+        before_id (int): отдать сообщения с id меньше этого
     Returns:
-        json - массив сообщений
+        json - массив сообщений и курсор более старых сообщений
     """
     recipient = await get_object_by_id(object_type=User, id=recipient_id, db=db)
     if not recipient:
         raise HTTPException(status_code=400, detail="Такого пользователя не существует")
-    messages_db = await get_messages_between_two_users(
-        first_user_id=user_id, second_user_id=recipient_id, db=db
+    messages_db, next_cursor = split_page(
+        await get_messages_between_two_users(
+            first_user_id=user_id, second_user_id=recipient_id, db=db,
+            limit=limit + 1, before_id=resolve_before_id(cursor, before_id)
+        ),
+        limit
     )
     messages = []
-    for message in messages_db:
+    for message in reversed(messages_db):
         messages.append({
             'id':message.id,
             'author_id':message.author_id,
@@ -645,69 +836,142 @@ async def get_chat_view(recipient_id: int, user_id: int, db: AsyncSession):
     return {
         'recipient_id':recipient.id,
         'recipient_username':recipient.username,
-        'messages':messages
+        'messages':messages,
+        'next_cursor': next_cursor
     }
 
 
-async def get_users_posts_view(user_id: int, db: AsyncSession):
+async def get_chats_view(user_id: int, db: AsyncSession, limit: int = 100):
     """
-    Отдаёт данные для отрисовки постов пользователя.
+    Возвращает список переписок пользователя с последним сообщением и
+    числом непрочитанных
+
+    Args:
+        user_id (int): id пользователя
+        db (AsyncSession): сессия бд
+        limit (int): сколько переписок вернуть
+    Returns:
+        json - массив переписок, от новых к старым (last_message равен None,
+        если последнее сообщение удалено)
+    """
+    conversations = await get_conversations(owner_id=user_id, db=db, limit=limit)
+    return {'chats': [
+        {
+            'partner_id': conversation.partner_id,
+            'partner_username': conversation.partner_username,
+            'unread_count': conversation.unread_count,
+            'last_message': {
+                'id': conversation.message_id,
+                'author_id': conversation.message_author_id,
+                'text': conversation.message_text,
+                'created_at': conversation.message_created_at
+            } if conversation.message_id is not None else None
+        }
+        for conversation in conversations
+    ]}
+
+
+async def read_chat_view(recipient_id: int, user_id: int, db: AsyncSession):
+    """
+    Отмечает переписку с собеседником прочитанной
+
+    Args:
+        recipient_id (int): id собеседника
+        user_id (int): id пользователя
+        db (AsyncSession): сессия бд
+    Returns:
+        json - статус операции
+    """
+    await mark_conversation_read(owner_id=user_id, partner_id=recipient_id, db=db)
+    return {'status': 'ok'}
+
+
+async def get_users_posts_view(
+    user_id: int, db: AsyncSession, limit: int = 100,
+    cursor: str = None, before_id: int = None
+):
+    """
+    Отдаёт данные для отрисовки постов пользователя (keyset-пагинация).
 
     Args:
         user_id (str): ID пользователя.
         db (AsyncSession): Сессия базы данных.
+        limit (int): сколько постов вернуть
+        cursor (str): курсор следующей страницы из предыдущего ответа
+        before_id (int): вернуть посты с id меньше этого
     Returns:
-        dict: Данные в виде json
+        dict: Данные в виде json (посты и курсор следующей страницы)
     """
-    posts_db = await get_user_posts(user_id=user_id, db=db)
-    posts=[]
-    for post in posts_db:
-        post_data = await get_post_view(post_id=post.id, user_id=user_id, db=db)
-        posts.append(post_data.get('post'))
-    return {'posts':posts}
+    before_id = resolve_before_id(cursor, before_id)
+    posts_db = await get_user_posts(
+        user_id=user_id, db=db, limit=limit + 1, before_id=before_id
+    )
+    posts_db, next_cursor = split_page(posts_db, limit)
+    return {
+        'posts': await build_posts_data(posts_db=posts_db, user_id=user_id, db=db),
+        'next_cursor': next_cursor
+    }
 
 
-async def get_my_page_view(user_id: int, db: AsyncSession):
+async def get_my_page_view(
+    user_id: int, db: AsyncSession, limit: int = 100,
+    cursor: str = None, before_id: int = None
+):
     """
     Возвращает пользователю информацию о нём
 
     Args:
         user_id (int): id пользователя
         db (AsyncSession): сессия бд
+        limit (int): сколько постов вернуть
+        cursor (str): курсор следующей страницы постов
+        before_id (int): вернуть посты с id меньше этого
     Returns:
-        json - данные
+        json - данные и курсор следующей страницы постов
     """
     user = await get_object_by_id(object_type=User, id=user_id, db=db)
-    posts = await get_users_posts_view(user_id=user_id, db=db)
+    posts = await get_users_posts_view(
+        user_id=user_id, db=db, limit=limit, cursor=cursor, before_id=before_id
+    )
     return {
         'username':user.username,
         'name':user.name,
         'surname':user.surname,
         'email':user.email,
-        'posts': posts.get('posts')
+        'posts': posts.get('posts'),
+        'next_cursor': posts.get('next_cursor')
     }
 
 
-async def get_other_page_view(other_user_id: int, db: AsyncSession):
+async def get_other_page_view(
+    other_user_id: int, db: AsyncSession, limit: int = 100,
+    cursor: str = None, before_id: int = None
+):
     """
     Возвращает пользователю информацию о нём
 
     Args:
-        user_id (int): id пользователя
+        other_user_id (int): id пользователя
         db (AsyncSession): сессия бд
+        limit (int): сколько постов вернуть
+        cursor (str): курсор следующей страницы постов
+        before_id (int): вернуть посты с id меньше этого
     Returns:
-        json - данные
+        json - данные и курсор следующей страницы постов
     """
     user = await get_object_by_id(object_type=User, id=other_user_id, db=db)
     if not user:
         raise HTTPException(status_code=400, detail="Такого юзера не существует!")
-    posts = await get_users_posts_view(user_id=other_user_id, db=db)
+    posts = await get_users_posts_view(
+        user_id=other_user_id, db=db, limit=limit, cursor=cursor, before_id=before_id
+    )
     return {
         'username':user.username,
         'name':user.name,
         'surname':user.surname,
         'email':user.email,
-        'posts': posts.get('posts')
+        'posts': posts.get('posts'),
+        'next_cursor': posts.get('next_cursor')
     }
 
 
@@ -823,7 +1087,7 @@ async def delete_post_image_view(image_id: int, user_id: int, db: AsyncSession):
         json - статус операции
     """
     result = await db.execute(select(MediaInPost).options(
-        joinedload(MediaInPost.post)
+        joinedload(MediaInPost.post).load_only(Post.author_id)
     ).where(MediaInPost.id == image_id))
     image = result.scalars().first()
     if not image:
@@ -877,7 +1141,7 @@ async def complaint_post_view(post_id: int, user_id: int, db: AsyncSession):
 
     new_complaint = ComplaintAboutPost(post_id=post_id, author_id=user_id)
 
-    await add_and_refresh_object(object=new_complaint, db=db)
+    await add_object(object=new_complaint, db=db)
     return {'status': 'ok'}
 
 
@@ -898,5 +1162,5 @@ async def complaint_comment_view(comment_id: int, user_id: int, db: AsyncSession
 
     new_complaint = ComplaintAboutComment(comment_id=comment_id, author_id=user_id)
 
-    await add_and_refresh_object(object=new_complaint, db=db)
+    await add_object(object=new_complaint, db=db)
     return {'status': 'ok'}
@@ -0,0 +1,166 @@
+"""
+Отложенная пакетная запись сообщений чата в бд (write-behind).
+
+Сообщение получает id сразу (id резервируются блоками), доставляется
+получателю и попадает в буфер, который сбрасывается в бд одним
+многострочным INSERT раз в CHAT_FLUSH_INTERVAL_MS миллисекунд или
+когда в нём набирается CHAT_FLUSH_SIZE сообщений. В той же транзакции
+обновляются сводки переписок (модель Conversation).
+
+Гарантии: доставка не ждёт коммита, поэтому при падении процесса теряются
+сообщения, принятые за последний интервал сброса (по умолчанию 50 мс).
+Буфер сбрасывается при отключении сокета и при остановке приложения.
+id уникальны и растут, но в них могут быть пропуски. По умолчанию они
+берутся из последовательности Postgres; для других бд (например, sqlite
+в тестах) нужно передать свой id_allocator.
+"""
+import asyncio
+import os
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, List, Optional, Set
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.metrics import metrics
+from backend.log.log_config import logger
+from .models import Message
+from .utils import (
+    allocate_message_ids, get_conversation_changes, upsert_conversations
+)
+
+# Выдаёт блок из count новых уникальных id сообщений
+IdAllocator = Callable[[int], Awaitable[List[int]]]
+
+
+class MessageWriter:
+    """
+    Буфер сообщений чата с пакетной записью в бд
+    """
+
+    def __init__(
+        self, session_factory: Callable[[], AsyncSession],
+        flush_interval: Optional[float] = None, flush_size: Optional[int] = None,
+        id_block_size: Optional[int] = None, id_allocator: Optional[IdAllocator] = None
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = (
+            flush_interval if flush_interval is not None
+            else int(os.getenv('CHAT_FLUSH_INTERVAL_MS', 50)) / 1000
+        )
+        self.flush_size = flush_size or int(os.getenv('CHAT_FLUSH_SIZE', 100))
+        self.id_block_size = id_block_size or int(os.getenv('CHAT_ID_BLOCK_SIZE', 100))
+        self._buffer: List[dict] = []
+        self.id_allocator = id_allocator or self._allocate_from_sequence
+        self._ids: Deque[int] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task] = set()
+        metrics.register_gauge('chat_message_buffer_size', lambda: len(self._buffer))
+
+    async def _allocate_from_sequence(self, count: int) -> List[int]:
+        async with self.session_factory() as db:
+            if db.get_bind().dialect.name != 'postgresql':
+                raise RuntimeError(
+                    'MessageWriter выдаёт id из последовательности Postgres, '
+                    'для другой бд передайте id_allocator'
+                )
+            return await allocate_message_ids(count, db)
+
+    async def _next_message_id(self) -> int:
+        if not self._ids:
+            # Резервируем сразу блок id, чтобы не ходить в бд за каждым
+            self._ids.extend(await self.id_allocator(self.id_block_size))
+        return self._ids.popleft()
+
+    async def submit(self, author_id: int, getter_id: int, text: str) -> dict:
+        """
+        Принимает сообщение: выдаёт ему id и ставит в буфер на запись
+
+        Args:
+            author_id (int): id отправителя
+            getter_id (int): id получателя
+            text (str): текст
+        Returns:
+            dict - сообщение (id, author_id, getter_id, text, created_at)
+        """
+        message = {
+            'id': await self._next_message_id(),
+            'author_id': author_id,
+            'getter_id': getter_id,
+            'text': text,
+            'created_at': datetime.now(),
+        }
+        self._buffer.append(message)
+        metrics.inc('chat_messages_accepted')
+        if len(self._buffer) >= self.flush_size:
+            self._schedule_flush(delay=0)
+        elif self._timer is None or self._timer_loop is not asyncio.get_running_loop():
+            self._schedule_flush(delay=self.flush_interval)
+        return message
+
+    def _schedule_flush(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_loop = asyncio.get_running_loop()
+        self._timer = self._timer_loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> None:
+        """
+        Записывает все сообщения из буфера одним INSERT. При ошибке
+        сообщения возвращаются в буфер и записываются при следующем сбросе.
+        """
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        try:
+            async with self.session_factory() as db:
+                await self._insert(rows, db)
+        except asyncio.CancelledError:
+            # Сброс прервали (например, при закрытии соединения) - не теряем сообщения
+            self._buffer[:0] = rows
+            raise
+        except IntegrityError:
+            # Одна плохая строка (например, несуществующий получатель)
+            # не должна мешать записи остальных
+            await self._insert_one_by_one(rows)
+        except Exception:
+            logger.exception('Не удалось записать сообщения чата, повторим при следующем сбросе')
+            metrics.inc('chat_message_flush_failures')
+            self._buffer[:0] = rows
+            if self._timer is None:
+                self._schedule_flush(delay=self.flush_interval)
+            return
+        metrics.inc('chat_messages_flushed', len(rows))
+        metrics.observe('chat_message_flush_batch_size', len(rows))
+
+    @staticmethod
+    async def _insert(rows: List[dict], db: AsyncSession) -> None:
+        # Сообщения и сводки переписок пишутся в одной транзакции
+        await db.execute(insert(Message), rows)
+        await upsert_conversations(get_conversation_changes(rows), db)
+        await db.commit()
+
+    async def _insert_one_by_one(self, rows: List[dict]) -> None:
+        for row in rows:
+            try:
+                async with self.session_factory() as db:
+                    await self._insert([row], db)
+            except IntegrityError:
+                logger.error(f'Сообщение {row["id"]} отброшено: нарушена целостность данных')
+                metrics.inc('chat_messages_rejected')
+
+    async def close(self) -> None:
+        """
+        Отменяет отложенный сброс и записывает буфер (при остановке приложения)
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
@@ -2,19 +2,30 @@
 Модели (таблицы в бд)
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, LargeBinary
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import (
+    Column, Integer, String, Text, ForeignKey, DateTime, LargeBinary, UniqueConstraint, Index
+)
+from sqlalchemy.orm import relationship, declarative_base, deferred
 from dotenv import load_dotenv
 import os
+from .pool_metrics import register_pool_metrics
+from .settings import DatabaseSettings, create_engine_from_settings
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+database_settings = DatabaseSettings.from_env(DATABASE_URL)
+engine = create_engine_from_settings(database_settings)
+pool_usage = register_pool_metrics(engine)
 Base = declarative_base()
 
+# Все связи объявлены с lazy="raise": обращение к незагруженной связи падает
+# сразу, а не делает скрытый запрос (в AsyncSession он всё равно закончился бы
+# MissingGreenlet). Нужные связи загружаются явно через selectinload/joinedload.
+# Зависимые строки удаляются массовыми DELETE (см. delete_post и delete_comment
+# в db/utils), поэтому ORM не загружает коллекции при удалении (passive_deletes)
+
 
 class User(Base):
     """
@@ -26,39 +37,45 @@ class User(Base):
     password = Column(String, nullable=False)  # hash
     name = Column(String)
     surname = Column(String)
-    avatar = Column(LargeBinary)
+    # Устаревшее хранение аватарки в строке, новые аватарки лежат в хранилище.
+    # Колонка не загружается вместе с пользователем (обращение к ней без явной
+    # загрузки вызывает ошибку), читать её можно только отдельным запросом
+    avatar = deferred(Column(LargeBinary), raiseload=True)
+    avatar_hash = Column(String(64), ForeignKey('blobs.hash'), index=True)
     email = Column(String, unique=True, nullable=False)
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
-    comments = relationship("Comment", back_populates="author", cascade="all, delete-orphan")
-    posts = relationship("Post", back_populates="author", cascade="all, delete-orphan")
+    comments = relationship(
+        "Comment", back_populates="author", lazy="raise", passive_deletes=True
+    )
+    posts = relationship("Post", back_populates="author", lazy="raise", passive_deletes=True)
     complaints_about_comments = relationship(
-        "ComplaintAboutComment", back_populates="author", cascade="all, delete-orphan"
+        "ComplaintAboutComment", back_populates="author", lazy="raise", passive_deletes=True
     )
     complaints_about_posts = relationship(
-        "ComplaintAboutPost", back_populates="author", cascade="all, delete-orphan"
+        "ComplaintAboutPost", back_populates="author", lazy="raise", passive_deletes=True
     )
     votes = relationship(
-        "Vote", back_populates="user", cascade="all, delete-orphan"
+        "Vote", back_populates="user", lazy="raise", passive_deletes=True
     )
     friendship_requests_sent = relationship(
         "FriendshipRequest", foreign_keys="FriendshipRequest.author_id",
-        back_populates="author", cascade="all, delete-orphan"
+        back_populates="author", lazy="raise", passive_deletes=True
     )
     friendship_requests_received = relationship(
         "FriendshipRequest", foreign_keys="FriendshipRequest.getter_id",
-        back_populates="getter", cascade="all, delete-orphan"
+        back_populates="getter", lazy="raise", passive_deletes=True
     )
     messages_sent = relationship(
         "Message", foreign_keys="Message.author_id",
-        back_populates="author", cascade="all, delete-orphan"
+        back_populates="author", lazy="raise", passive_deletes=True
     )
     messages_received = relationship(
         "Message", foreign_keys="Message.getter_id",
-        back_populates="getter", cascade="all, delete-orphan"
+        back_populates="getter", lazy="raise", passive_deletes=True
     )
-    likes = relationship("Like", back_populates="author", cascade="all, delete-orphan")
+    likes = relationship("Like", back_populates="author", lazy="raise", passive_deletes=True)
 
 
 class Comment(Base):
@@ -66,38 +83,47 @@ class Comment(Base):
     Модель комментария
     """
     __tablename__ = 'comments'
+    __table_args__ = (
+        Index('ix_comments_post_id', 'post_id', 'id'),
+    )
     id = Column(Integer, primary_key=True)
     text = Column(Text, nullable=False)
     author_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     post_id = Column(Integer, ForeignKey('posts.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
 
-    author = relationship("User", back_populates="comments")
-    post = relationship("Post", back_populates="comments")
+    author = relationship("User", back_populates="comments", lazy="raise")
+    post = relationship("Post", back_populates="comments", lazy="raise")
     complaints = relationship(
-        "ComplaintAboutComment", back_populates="comment", cascade="all, delete-orphan"
+        "ComplaintAboutComment", back_populates="comment", lazy="raise", passive_deletes=True
     )
 
 
 class ComplaintAboutComment(Base):
     __tablename__ = 'complaints_about_comment'
+    __table_args__ = (
+        Index('ix_complaints_about_comment_comment_id', 'comment_id'),
+    )
     id = Column(Integer, primary_key=True)
     author_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     comment_id = Column(Integer, ForeignKey('comments.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
 
-    author = relationship("User", back_populates="complaints_about_comments")
-    comment = relationship("Comment", back_populates="complaints")
+    author = relationship("User", back_populates="complaints_about_comments", lazy="raise")
+    comment = relationship("Comment", back_populates="complaints", lazy="raise")
 
 class ComplaintAboutPost(Base):
     __tablename__ = 'complaints_about_post'
+    __table_args__ = (
+        Index('ix_complaints_about_post_post_id', 'post_id'),
+    )
     id = Column(Integer, primary_key=True)
     author_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     post_id = Column(Integer, ForeignKey('posts.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
 
-    author = relationship("User", back_populates="complaints_about_posts")
-    post = relationship("Post", back_populates="complaints")
+    author = relationship("User", back_populates="complaints_about_posts", lazy="raise")
+    post = relationship("Post", back_populates="complaints", lazy="raise")
 
 
 class Post(Base):
@@ -105,24 +131,32 @@ class Post(Base):
     Модель поста
     """
     __tablename__ = 'posts'
+    __table_args__ = (
+        Index('ix_posts_author_id', 'author_id', 'id'),
+    )
     id = Column(Integer, primary_key=True)
     text = Column(Text, nullable=False)
     author_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
+    # Денормализованные счётчики, обновляются вместе с лайками и комментариями
+    likes_count = Column(Integer, nullable=False, default=0, server_default='0')
+    comments_count = Column(Integer, nullable=False, default=0, server_default='0')
 
-    author = relationship("User", back_populates="posts")
-    comments = relationship("Comment", back_populates="post", cascade="all, delete-orphan")
+    author = relationship("User", back_populates="posts", lazy="raise")
+    comments = relationship(
+        "Comment", back_populates="post", lazy="raise", passive_deletes=True
+    )
     complaints = relationship(
-        "ComplaintAboutPost", back_populates="post", cascade="all, delete-orphan"
+        "ComplaintAboutPost", back_populates="post", lazy="raise", passive_deletes=True
     )
     voting_variants = relationship(
-        "VotingVariant", back_populates="post", cascade="all, delete-orphan"
+        "VotingVariant", back_populates="post", lazy="raise", passive_deletes=True
     )
     media = relationship(
-        "MediaInPost", back_populates="post", cascade="all, delete-orphan"
+        "MediaInPost", back_populates="post", lazy="raise", passive_deletes=True
     )
     likes = relationship(
-        "Like", back_populates="post", cascade="all, delete-orphan"
+        "Like", back_populates="post", lazy="raise", passive_deletes=True
     )
 
 
@@ -131,13 +165,18 @@ class VotingVariant(Base):
     Модель варианта голосования в посте
     """
     __tablename__ = 'voting_variants'
+    __table_args__ = (
+        Index('ix_voting_variants_post_id', 'post_id', 'id'),
+    )
     id = Column(Integer, primary_key=True)
     text = Column(String, nullable=False)
     post_id = Column(Integer, ForeignKey('posts.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
+    # Денормализованный счётчик голосов, обновляется вместе с голосами
+    votes_count = Column(Integer, nullable=False, default=0, server_default='0')
 
-    post = relationship("Post", back_populates="voting_variants")
-    votes = relationship("Vote", back_populates="variant", cascade="all, delete-orphan")
+    post = relationship("Post", back_populates="voting_variants", lazy="raise")
+    votes = relationship("Vote", back_populates="variant", lazy="raise", passive_deletes=True)
 
 
 class Vote(Base):
@@ -145,13 +184,20 @@ class Vote(Base):
     Модель голоса в голосовании
     """
     __tablename__ = 'votes'
+    __table_args__ = (
+        UniqueConstraint('variant_id', 'user_id', name='uq_votes_variant_user'),
+        # В одном голосовании у пользователя может быть только один голос
+        UniqueConstraint('post_id', 'user_id', name='uq_votes_post_user'),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     variant_id = Column(Integer, ForeignKey('voting_variants.id'), nullable=False)
+    # Пост варианта, денормализован ради уникального ключа (post_id, user_id)
+    post_id = Column(Integer, ForeignKey('posts.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
 
-    user = relationship("User", back_populates="votes")
-    variant = relationship("VotingVariant", back_populates="votes")
+    user = relationship("User", back_populates="votes", lazy="raise")
+    variant = relationship("VotingVariant", back_populates="votes", lazy="raise")
 
 
 class Friendship(Base):
@@ -159,13 +205,17 @@ class Friendship(Base):
     Модель дружбы
     """
     __tablename__ = 'friendship'
+    __table_args__ = (
+        Index('ix_friendship_first_second', 'first_friend_id', 'second_friend_id'),
+        Index('ix_friendship_second_first', 'second_friend_id', 'first_friend_id'),
+    )
     id = Column(Integer, primary_key=True)
     first_friend_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     second_friend_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
 
-    first_friend = relationship("User", foreign_keys=[first_friend_id])
-    second_friend = relationship("User", foreign_keys=[second_friend_id])
+    first_friend = relationship("User", foreign_keys=[first_friend_id], lazy="raise")
+    second_friend = relationship("User", foreign_keys=[second_friend_id], lazy="raise")
 
 
 class FriendshipRequest(Base):
@@ -173,16 +223,21 @@ class FriendshipRequest(Base):
     Модель запроса дружбы
     """
     __tablename__ = 'friendship_requests'
+    __table_args__ = (
+        Index('ix_friendship_requests_getter_author', 'getter_id', 'author_id'),
+    )
     id = Column(Integer, primary_key=True)
     author_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     getter_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
 
     author = relationship(
-        "User", foreign_keys=[author_id], back_populates="friendship_requests_sent"
+        "User", foreign_keys=[author_id], back_populates="friendship_requests_sent",
+        lazy="raise"
     )
     getter = relationship(
-        "User", foreign_keys=[getter_id], back_populates="friendship_requests_received"
+        "User", foreign_keys=[getter_id], back_populates="friendship_requests_received",
+        lazy="raise"
     )
 
 
@@ -191,25 +246,97 @@ class MediaInPost(Base):
     Модель картинки, прикреплённой к посту
     """
     __tablename__ = 'media_in_post'
+    __table_args__ = (
+        Index('ix_media_in_post_post_id', 'post_id', 'id'),
+    )
     id = Column(Integer, primary_key=True)
-    image = Column(LargeBinary)
+    # Устаревшее хранение картинки в строке, новые картинки лежат в хранилище.
+    # Колонка не загружается вместе с обьектом, как и User.avatar
+    image = deferred(Column(LargeBinary), raiseload=True)
+    blob_hash = Column(String(64), ForeignKey('blobs.hash'), index=True)
     post_id = Column(Integer, ForeignKey('posts.id'), nullable=False)
-    post = relationship("Post", back_populates="media")
+    post = relationship("Post", back_populates="media", lazy="raise")
+
+
+class Blob(Base):
+    """
+    Метаданные файла в хранилище (само содержимое лежит вне бд,
+    ключ - sha256 содержимого)
+    """
+    __tablename__ = 'blobs'
+    hash = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class ImageVariant(Base):
+    """
+    Уменьшенная копия картинки из хранилища (определённого размера и формата)
+    """
+    __tablename__ = 'image_variants'
+    __table_args__ = (
+        UniqueConstraint('source_hash', 'size', 'format', name='uq_image_variants_source'),
+    )
+    id = Column(Integer, primary_key=True)
+    source_hash = Column(String(64), ForeignKey('blobs.hash'), nullable=False)
+    size = Column(Integer, nullable=False)
+    format = Column(String, nullable=False)
+    blob_hash = Column(String(64), ForeignKey('blobs.hash'), nullable=False)
+
+
+def _conversation_user_id(pick):
+    """
+    Возвращает функцию для default колонки ключа переписки: меньший или
+    больший из id автора и получателя вставляемой строки
+    """
+    def default(context):
+        parameters = context.get_current_parameters()
+        return pick(parameters['author_id'], parameters['getter_id'])
+    return default
 
 
 class Message(Base):
     """
-    Модель сообщения
+    Модель сообщения. Пара (user_low_id, user_high_id) - ключ переписки,
+    одинаковый для сообщений в обе стороны, по нему история чата читается
+    одним проходом по индексу
     """
     __tablename__ = 'messages'
+    __table_args__ = (
+        Index('ix_messages_conversation', 'user_low_id', 'user_high_id', 'id'),
+    )
     id = Column(Integer, primary_key=True)
     text = Column(Text, nullable=False)
     author_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     getter_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_low_id = Column(Integer, nullable=False, default=_conversation_user_id(min))
+    user_high_id = Column(Integer, nullable=False, default=_conversation_user_id(max))
     created_at = Column(DateTime, default=datetime.now)
 
-    author = relationship("User", foreign_keys=[author_id], back_populates="messages_sent")
-    getter = relationship("User", foreign_keys=[getter_id], back_populates="messages_received")
+    author = relationship(
+        "User", foreign_keys=[author_id], back_populates="messages_sent", lazy="raise"
+    )
+    getter = relationship(
+        "User", foreign_keys=[getter_id], back_populates="messages_received", lazy="raise"
+    )
+
+
+class Conversation(Base):
+    """
+    Сводка переписки для списка чатов пользователя: по строке на
+    владельца и собеседника. Обновляется при записи и удалении сообщений.
+    """
+    __tablename__ = 'conversations'
+    __table_args__ = (
+        Index('ix_conversations_owner_last_message', 'owner_id', 'last_message_id'),
+    )
+    owner_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    partner_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    last_message_id = Column(Integer)
+    unread_count = Column(Integer, nullable=False, default=0, server_default='0')
+    last_read_message_id = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.now)
 
 
 class Like(Base):
@@ -217,12 +344,15 @@ class Like(Base):
     Модель лайка
     """
     __tablename__ = 'likes'
+    __table_args__ = (
+        UniqueConstraint('post_id', 'author_id', name='uq_likes_post_author'),
+    )
     id = Column(Integer, primary_key=True)
     author_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     post_id = Column(Integer, ForeignKey('posts.id'), nullable=False)
 
-    author = relationship("User", back_populates="likes")
-    post = relationship("Post", back_populates="likes")
+    author = relationship("User", back_populates="likes", lazy="raise")
+    post = relationship("Post", back_populates="likes", lazy="raise")
 
 
 # async def create_database():
@@ -0,0 +1,75 @@
+"""
+Метрики использования пула соединений с бд: сколько соединений выдано
+сессиям прямо сейчас, сколько всего выдач и открытых соединений
+"""
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from backend.metrics import metrics
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, который замеряет, сколько сессия ждала соединение
+    (db_pool_checkout_wait_seconds), и считает таймауты ожидания (db_pool_timeouts)
+    """
+
+    def _do_get(self):
+        # Внутри QueuePool._do_get изредка вызывает себя повторно (гонка за
+        # overflow) - такое ожидание попадёт в метрику дважды, это допустимо
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.inc('db_pool_timeouts')
+            raise
+        finally:
+            metrics.observe('db_pool_checkout_wait_seconds', time.perf_counter() - started_at)
+
+
+class PoolUsage:
+    """
+    Считает соединения, выданные из пула, по событиям checkout/checkin
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked_out = 0
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checked_out += 1
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out -= 1
+
+
+def register_pool_metrics(engine: AsyncEngine, prefix: str = 'db_pool') -> PoolUsage:
+    """
+    Подписывается на события пула движка и регистрирует метрики:
+    <prefix>_checked_out (соединений выдано сейчас), <prefix>_size и
+    <prefix>_overflow (для пулов с фиксированным размером),
+    счётчики <prefix>_checkouts и <prefix>_connections_opened
+
+    Args:
+        engine (AsyncEngine): движок
+        prefix (str): префикс названий метрик
+    Returns:
+        PoolUsage
+    """
+    usage = PoolUsage()
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, 'checkout', usage.on_checkout)
+    event.listen(sync_engine, 'checkin', usage.on_checkin)
+    event.listen(sync_engine, 'checkout', lambda *args: metrics.inc(f'{prefix}_checkouts'))
+    event.listen(sync_engine, 'connect', lambda *args: metrics.inc(f'{prefix}_connections_opened'))
+    metrics.register_gauge(f'{prefix}_checked_out', lambda: usage.checked_out)
+    pool = sync_engine.pool
+    # У NullPool (sqlite) и StaticPool нет фиксированного размера
+    if hasattr(pool, 'size') and hasattr(pool, 'overflow'):
+        metrics.register_gauge(f'{prefix}_size', pool.size)
+        metrics.register_gauge(f'{prefix}_overflow', pool.overflow)
+    return usage
@@ -0,0 +1,25 @@
+"""
+Команда для пересчёта денормализованных счётчиков (лайки, комментарии, голоса)
+по исходным таблицам. Запуск из корня проекта:
+
+    python -m backend.db.recount_counters
+"""
+import asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from backend.db.models import engine
+from backend.db.utils import recount_counters
+
+
+async def main() -> None:
+    """
+    Пересчитывает все счётчики в одной транзакции
+    """
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        await recount_counters(db)
+        await db.commit()
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
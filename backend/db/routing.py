@@ -0,0 +1,114 @@
+"""
+Распределение читающих запросов между основной бд и репликами.
+
+Запись всегда идёт в основную бд. Запросы только на чтение могут идти
+в реплики (DATABASE_REPLICA_URLS через запятую), кроме случая, когда
+пользователь недавно что-то записал: тогда в течение DB_STICKY_WINDOW
+секунд его чтения тоже идут в основную бд, чтобы он видел свои изменения,
+даже если реплика отстаёт. Окно хранится в куки, поэтому работает
+независимо от того, какой воркер обрабатывает запрос.
+"""
+import itertools
+import os
+import time
+from typing import Callable, List, Optional
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from backend.metrics import metrics
+from .pool_metrics import register_pool_metrics
+from .settings import DatabaseSettings, create_engine_from_settings
+
+# Запросы этими методами не меняют данные
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE_NAME = 'db_primary_until'
+
+SessionFactory = Callable[[], AsyncSession]
+
+
+class ReadRouter:
+    """
+    Выбирает фабрику сессий для запроса на чтение
+    """
+
+    def __init__(
+        self, primary: SessionFactory, replicas: Optional[List[SessionFactory]] = None,
+        sticky_window: float = 10
+    ):
+        self.primary = primary
+        self.replicas = list(replicas or [])
+        self.sticky_window = sticky_window
+        self._next_replica = itertools.cycle(self.replicas) if self.replicas else None
+
+    def is_sticky(self, request: Request) -> bool:
+        """
+        Проверяет, записывал ли пользователь что-то в пределах окна
+
+        Args:
+            request (Request): http request
+        Returns:
+            bool
+        """
+        value = request.cookies.get(STICKY_COOKIE_NAME)
+        if not value:
+            return False
+        try:
+            return float(value) > time.time()
+        except ValueError:
+            return False
+
+    def choose(self, request: Request) -> SessionFactory:
+        """
+        Возвращает фабрику сессий основной бд или очередной реплики
+
+        Args:
+            request (Request): http request
+        Returns:
+            фабрика сессий
+        """
+        if self._next_replica is None or self.is_sticky(request):
+            metrics.inc('db_reads_primary')
+            return self.primary
+        metrics.inc('db_reads_replica')
+        return next(self._next_replica)
+
+    def mark_write(self, request: Request, response: Response) -> None:
+        """
+        После успешного запроса, меняющего данные, направляет чтения
+        пользователя в основную бд на время окна
+
+        Args:
+            request (Request): http request
+            response (Response): ответ
+        """
+        if (
+            not self.replicas or request.method in SAFE_METHODS
+            or response.status_code >= 400 or self.sticky_window <= 0
+        ):
+            return
+        response.set_cookie(
+            STICKY_COOKIE_NAME, str(time.time() + self.sticky_window),
+            max_age=int(self.sticky_window) + 1, httponly=True, samesite='lax'
+        )
+
+
+def create_read_router(primary: SessionFactory) -> ReadRouter:
+    """
+    Создаёт маршрутизатор по настройкам из окружения: DATABASE_REPLICA_URLS
+    (адреса реплик через запятую, пусто - всё читается из основной бд) и
+    DB_STICKY_WINDOW (секунды, по умолчанию 10). Пулы реплик настраиваются
+    теми же переменными DB_*, что и основной.
+
+    Args:
+        primary: фабрика сессий основной бд
+    Returns:
+        ReadRouter
+    """
+    replicas = []
+    urls = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    for number, url in enumerate(urls):
+        engine = create_engine_from_settings(DatabaseSettings.from_env(url))
+        register_pool_metrics(engine, prefix=f'db_replica{number}_pool')
+        replicas.append(async_sessionmaker(engine, expire_on_commit=False))
+    return ReadRouter(
+        primary, replicas, sticky_window=float(os.getenv('DB_STICKY_WINDOW', 10))
+    )
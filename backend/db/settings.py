@@ -0,0 +1,106 @@
+"""
+Настройки подключения к бд и пула соединений из переменных окружения
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from .pool_metrics import InstrumentedAsyncPool
+
+load_dotenv()
+
+
+def _get_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+@dataclass
+class DatabaseSettings:
+    """
+    Параметры движка SQLAlchemy и пула соединений.
+
+    - DB_ECHO - логировать все SQL-запросы (по умолчанию выключено)
+    - DB_POOL_SIZE, DB_MAX_OVERFLOW - постоянные и дополнительные соединения пула
+    - DB_POOL_TIMEOUT - сколько секунд ждать свободное соединение
+    - DB_POOL_RECYCLE - через сколько секунд пересоздавать соединение
+    - DB_POOL_PRE_PING - проверять соединение перед выдачей
+    - DB_STATEMENT_CACHE_SIZE - кэш подготовленных запросов asyncpg
+      (0 - выключить, нужно при работе через pgbouncer в режиме transaction)
+    """
+    url: str
+    echo: bool = False
+    pool_size: int = 10
+    max_overflow: int = 20
+    pool_timeout: float = 30
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    statement_cache_size: Optional[int] = None
+
+    @classmethod
+    def from_env(cls, url: Optional[str] = None) -> 'DatabaseSettings':
+        """
+        Читает настройки из окружения
+
+        Args:
+            url (str): адрес бд (по умолчанию DATABASE_URL)
+        Returns:
+            DatabaseSettings
+        """
+        statement_cache_size = os.getenv('DB_STATEMENT_CACHE_SIZE')
+        return cls(
+            url=url or os.getenv('DATABASE_URL'),
+            echo=_get_bool('DB_ECHO', cls.echo),
+            pool_size=int(os.getenv('DB_POOL_SIZE', cls.pool_size)),
+            max_overflow=int(os.getenv('DB_MAX_OVERFLOW', cls.max_overflow)),
+            pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', cls.pool_timeout)),
+            pool_recycle=int(os.getenv('DB_POOL_RECYCLE', cls.pool_recycle)),
+            pool_pre_ping=_get_bool('DB_POOL_PRE_PING', cls.pool_pre_ping),
+            statement_cache_size=(
+                int(statement_cache_size) if statement_cache_size is not None else None
+            ),
+        )
+
+    def engine_kwargs(self) -> dict:
+        """
+        Аргументы для create_async_engine. Для sqlite настройки пула не
+        передаются: SQLAlchemy сам выбирает для неё подходящий пул.
+
+        Returns:
+            dict
+        """
+        kwargs = {'echo': self.echo}
+        url = make_url(self.url)
+        if url.get_backend_name() == 'sqlite':
+            return kwargs
+        kwargs.update(
+            poolclass=InstrumentedAsyncPool,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_timeout=self.pool_timeout,
+            pool_recycle=self.pool_recycle,
+            pool_pre_ping=self.pool_pre_ping,
+        )
+        if url.get_driver_name() == 'asyncpg' and self.statement_cache_size is not None:
+            # Кэш самого asyncpg и кэш подготовленных запросов диалекта SQLAlchemy
+            kwargs['connect_args'] = {
+                'statement_cache_size': self.statement_cache_size,
+                'prepared_statement_cache_size': self.statement_cache_size,
+            }
+        return kwargs
+
+
+def create_engine_from_settings(settings: DatabaseSettings) -> AsyncEngine:
+    """
+    Создаёт асинхронный движок по настройкам
+
+    Args:
+        settings (DatabaseSettings): настройки
+    Returns:
+        AsyncEngine
+    """
+    return create_async_engine(settings.url, **settings.engine_kwargs())
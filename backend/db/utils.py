@@ -1,23 +1,26 @@
 """
 Вспомогательные функции для обращения к бд
 """
-from typing import Type, List
+from typing import Type, List, Dict, Set, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
-from sqlalchemy import or_, and_, func
-from .models import ( User, Post, Friendship, FriendshipRequest,
-    VotingVariant, Like, Message, Vote, Base
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy import or_, and_, func, exists, update, union, case, delete, literal, insert
+from .models import ( User, Post, Friendship, FriendshipRequest, Conversation,
+    VotingVariant, Like, Message, Vote, Comment, MediaInPost, Blob, ImageVariant, Base,
+    ComplaintAboutPost, ComplaintAboutComment
 )
 
 
-async def add_and_refresh_object(
+async def add_object(
         object: Base,
         db: AsyncSession
 ) -> None:
     """
-    Добавляет обьект в бд и перезагружает его (получает автоматически созданные
-    параметры обьекта, такие как id и created_at)
+    Добавляет обьект в сессию и сразу отправляет INSERT (без коммита), чтобы
+    у обьекта появились автоматически созданные параметры, такие как id
+    и created_at. Коммит делает get_db в конце запроса
 
     Args:
         object (Base): обьект
@@ -26,8 +29,7 @@ async def add_and_refresh_object(
         None
     """
     db.add(object)
-    await db.commit()
-    await db.refresh(object)
+    await db.flush()
 
 
 async def get_user_by_email(email: str, db: AsyncSession) -> User:
@@ -44,6 +46,28 @@ async def get_user_by_email(email: str, db: AsyncSession) -> User:
     return result_email.scalars().first()
 
 
+async def update_password_hash(
+    user_id: int, old_hash: str, new_hash: str, db: AsyncSession
+) -> bool:
+    """
+    Заменяет хэш пароля пользователя, если пароль не успели поменять
+
+    Args:
+        user_id (int): id пользователя
+        old_hash (str): хэш, по которому проверялся пароль
+        new_hash (str): новый хэш
+        db (AsyncSession): Сессия базы данных.
+    Returns:
+        bool - был ли обновлён хэш
+    """
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id, User.password == old_hash)
+        .values(password=new_hash)
+    )
+    return result.rowcount == 1
+
+
 async def get_user_by_username(username: str, db: AsyncSession) -> User:
     """
     Получает пользователя по username пользователя.
@@ -63,7 +87,7 @@ async def delete_object(
     db: AsyncSession
 ) -> None:
     """
-    Удаляет обьект из бд
+    Удаляет обьект из бд (без коммита)
 
     Args:
         object (Base): обьект
@@ -72,61 +96,97 @@ async def delete_object(
         None
     """
     await db.delete(object)
-    await db.commit()
+    await db.flush()
 
 
-async def get_like_on_post_from_user(post_id: int, user_id: int, db: AsyncSession) -> Like:
+async def bulk_delete(statement, db: AsyncSession) -> None:
     """
-    Возвращает лайк пользователя на посте
+    Выполняет массовый DELETE без синхронизации обьектов сессии: удалённые
+    строки после этого не читаются, а сессия живёт один запрос (без коммита)
 
     Args:
-        post_id (int): id поста
-        post_id (int): id юзера
-    Returns:
-        обьект Like или None
+        statement: запрос delete(...)
+        db (AsyncSession): Сессия базы данных.
+    """
+    await db.execute(statement.execution_options(synchronize_session=False))
+
+
+async def delete_comment(comment_id: int, db: AsyncSession) -> None:
+    """
+    Удаляет комментарий вместе с жалобами на него (без коммита)
+
+    Args:
+        comment_id (int): id комментария
+        db (AsyncSession): Сессия базы данных.
     """
-    result_db = await db.execute(select(Like).filter( and_(
-        Like.post_id==post_id,
-        Like.author_id==user_id
-    ) ))
-    return result_db.scalars().first()
+    await bulk_delete(
+        delete(ComplaintAboutComment).where(ComplaintAboutComment.comment_id == comment_id), db
+    )
+    await bulk_delete(delete(Comment).where(Comment.id == comment_id), db)
 
 
-async def get_likes_count(post_id: int, db: AsyncSession) -> int:
+async def delete_post(post_id: int, db: AsyncSession) -> None:
     """
-    Возвращает количество лайков на посте
+    Удаляет пост и всё, что от него зависит (комментарии, жалобы, голосование,
+    лайки, картинки), массовыми DELETE без загрузки обьектов (без коммита).
+    Файлы картинок в хранилище удаляет сборщик мусора
 
     Args:
         post_id (int): id поста
-    Returns:
-        int количество лайков
+        db (AsyncSession): Сессия базы данных.
     """
-    count_query = await db.execute(select(
-        func.count()
-    ).select_from(Like).filter(
-        Like.post_id==post_id)
+    post_comments = select(Comment.id).where(Comment.post_id == post_id)
+    await bulk_delete(
+        delete(ComplaintAboutComment).where(ComplaintAboutComment.comment_id.in_(post_comments)), db
     )
-    count = count_query.scalar()
-    return count
+    await bulk_delete(delete(Comment).where(Comment.post_id == post_id), db)
+    await bulk_delete(delete(ComplaintAboutPost).where(ComplaintAboutPost.post_id == post_id), db)
+    await bulk_delete(delete(Vote).where(Vote.post_id == post_id), db)
+    await bulk_delete(delete(VotingVariant).where(VotingVariant.post_id == post_id), db)
+    await bulk_delete(delete(Like).where(Like.post_id == post_id), db)
+    await bulk_delete(delete(MediaInPost).where(MediaInPost.post_id == post_id), db)
+    await bulk_delete(delete(Post).where(Post.id == post_id), db)
 
 
-async def get_user_vote(var_id: int, user_id: int, db: AsyncSession) -> Vote:
+async def is_post_liked_by_user(post_id: int, user_id: int, db: AsyncSession) -> bool:
     """
-    Возвращает голос юзера на варианте голосования
+    Проверяет, лайкнул ли пользователь пост (EXISTS, без загрузки обьекта Like)
 
     Args:
-        var_id (int): id варианта
+        post_id (int): id поста
         user_id (int): id юзера
         db (AsyncSession): сессия бд
     Returns:
-        обьект Vote или None
+        bool
+    """
+    result_db = await db.execute(select(exists().where(and_(
+        Like.post_id == post_id,
+        Like.author_id == user_id
+    ))))
+    return bool(result_db.scalar())
+
+
+async def get_post_with_author_username(post_id: int, db: AsyncSession):
+    """
+    Возвращает поля поста вместе с юзернеймом автора одной строкой,
+    без загрузки связанных коллекций
+
+    Args:
+        post_id (int): id поста
+        db (AsyncSession): сессия бд
+    Returns:
+        строка (id, text, author_id, created_at, likes_count, comments_count,
+        username) или None
     """
     result_db = await db.execute(
-        select(Vote).filter(and_(
-        Vote.user_id == user_id,
-        Vote.variant_id == var_id
-    )))
-    return result_db.scalars().first()
+        select(
+            Post.id, Post.text, Post.author_id, Post.created_at,
+            Post.likes_count, Post.comments_count, User.username
+        )
+        .join(User, User.id == Post.author_id)
+        .filter(Post.id == post_id)
+    )
+    return result_db.first()
 
 
 async def get_existing_friendship_request(
@@ -178,7 +238,7 @@ async def get_existing_friendship(
 
 async def get_all_from_table(
         object_type: Type[Base],
-        db: AsyncSession, limit=None, skip=0
+        db: AsyncSession, limit=None, skip=0, before_id=None
 ) -> list:
     """
     Получает все обьекты из таблицы бд
@@ -188,22 +248,19 @@ async def get_all_from_table(
         db (AsyncSession): сессия бд
         limit: ограничение на количество получаемых обьектов, по умолчанию None
         skip: сколько обьектов пропустить
+        before_id: если задан, возвращаются только обьекты с id меньше него
+            (keyset-пагинация, skip при этом не используется)
     Returns:
         список обьектов
     """
+    query = select(object_type).order_by(object_type.id.desc())  # Сортировка по ID в порядке убывания
+    if before_id is not None:
+        query = query.filter(object_type.id < before_id)
+    elif skip:
+        query = query.offset(skip)
     if limit:
-        result = await db.execute(
-            select(object_type)
-            .order_by(object_type.id.desc())  # Сортировка по ID в порядке убывания
-            .offset(skip)
-            .limit(limit)
-        )
-        return result.scalars().all()
-
-    result = await db.execute(
-        select(object_type)
-        .order_by(object_type.id.desc())  # Сортировка по ID в порядке убывания
-    )
+        query = query.limit(limit)
+    result = await db.execute(query)
     return result.scalars().all()
 
 
@@ -217,7 +274,9 @@ async def get_post_voting_variants(post_id: int, db: AsyncSession) -> list:
     Returns:
         список обьектов VotingVariant
     """
-    result_db = await db.execute(select(VotingVariant).filter(VotingVariant.post_id==post_id))
+    result_db = await db.execute(
+        select(VotingVariant).filter(VotingVariant.post_id==post_id).order_by(VotingVariant.id)
+    )
     return result_db.scalars().all()
 
 
@@ -240,31 +299,36 @@ async def get_object_by_id(
 
 
 async def get_messages_between_two_users(
-        first_user_id: int, second_user_id: int, db: AsyncSession
+        first_user_id: int, second_user_id: int, db: AsyncSession,
+        limit: int = None, before_id: int = None
 ) -> list:
     """
-    Возвращает список сообщений между двумя пользователями
+    Возвращает сообщения между двумя пользователями, от новых к старым
+    (keyset-пагинация по индексу ключа переписки)
 
     Args:
         first_user_id (int): id первого пользователя
         second_user_id (int): id второго пользователя
         db (AsyncSession): сессия бд
+        limit (int): сколько сообщений вернуть (None - все)
+        before_id (int): вернуть только сообщения с id меньше этого
     Returns:
-        list - список обьектов Message
+        list - строки (id, author_id, text, created_at)
     """
-    result_db = await db.execute(select(Message).filter(
-        or_(
-            and_(
-                Message.author_id == first_user_id,
-                Message.getter_id == second_user_id
-            ),
-            and_(
-                Message.author_id == second_user_id,
-                Message.getter_id == first_user_id
-            )
+    query = (
+        select(Message.id, Message.author_id, Message.text, Message.created_at)
+        .where(
+            Message.user_low_id == min(first_user_id, second_user_id),
+            Message.user_high_id == max(first_user_id, second_user_id)
         )
-    ))
-    return result_db.scalars().all()
+        .order_by(Message.id.desc())
+    )
+    if before_id is not None:
+        query = query.where(Message.id < before_id)
+    if limit is not None:
+        query = query.limit(limit)
+    result_db = await db.execute(query)
+    return result_db.all()
 
 
 async def get_votes_on_voting_variant(variant_id: int, db: AsyncSession) -> List[Vote]:
@@ -279,22 +343,32 @@ async def get_votes_on_voting_variant(variant_id: int, db: AsyncSession) -> List
     """
     result = await db.execute(
         select(Vote)
-        .options(joinedload(Vote.user))  # Жадная загрузка пользователя
+        # Жадная загрузка пользователя, только нужные для ответа колонки
+        .options(joinedload(Vote.user).load_only(User.id, User.username))
         .filter(Vote.variant_id == variant_id)
     )
     return result.scalars().all()
 
-async def get_user_posts(user_id: int, db: AsyncSession) -> list:
+async def get_user_posts(
+        user_id: int, db: AsyncSession, limit=None, before_id=None
+) -> list:
     """
-    Возвращает посты пользователя
+    Возвращает посты пользователя, от новых к старым
 
     Args:
         user_id (int): id пользователя
         db (AsyncSession): сессия бд
+        limit: ограничение на количество постов, по умолчанию None
+        before_id: если задан, возвращаются только посты с id меньше него
     Returns:
         list
     """
-    result_db = await db.execute(select(Post).filter(Post.author_id == user_id))
+    query = select(Post).filter(Post.author_id == user_id).order_by(Post.id.desc())
+    if before_id is not None:
+        query = query.filter(Post.id < before_id)
+    if limit:
+        query = query.limit(limit)
+    result_db = await db.execute(query)
     return result_db.scalars().all()
 
 
@@ -314,8 +388,8 @@ async def get_user_friends(user_id: int, db: AsyncSession):
             Friendship.second_friend_id==user_id
         )
     ).options(
-        joinedload(Friendship.first_friend),
-        joinedload(Friendship.second_friend)
+        joinedload(Friendship.first_friend).load_only(User.id, User.username),
+        joinedload(Friendship.second_friend).load_only(User.id, User.username)
     ))
     friends_list = []
     for friendship in result_db.scalars().all():
@@ -340,6 +414,721 @@ async def get_friendship_requests_for_user(user_id: int, db: AsyncSession):
     result_db = await db.execute(select(FriendshipRequest).filter(
         FriendshipRequest.getter_id==user_id
     ).options(
-        joinedload(FriendshipRequest.author)
+        joinedload(FriendshipRequest.author).load_only(User.id, User.username)
     ))
     return result_db
+
+
+async def get_usernames_by_ids(user_ids: List[int], db: AsyncSession) -> Dict[int, str]:
+    """
+    Возвращает юзернеймы пользователей одним запросом
+
+    Args:
+        user_ids (List[int]): id пользователей
+        db (AsyncSession): сессия бд
+    Returns:
+        Dict[int, str] - словарь id пользователя -> юзернейм
+    """
+    if not user_ids:
+        return {}
+    result_db = await db.execute(
+        select(User.id, User.username).filter(User.id.in_(set(user_ids)))
+    )
+    return {row.id: row.username for row in result_db}
+
+
+async def get_media_ids_for_posts(post_ids: List[int], db: AsyncSession) -> Dict[int, List[int]]:
+    """
+    Возвращает id картинок, прикреплённых к постам, одним запросом
+
+    Args:
+        post_ids (List[int]): id постов
+        db (AsyncSession): сессия бд
+    Returns:
+        Dict[int, List[int]] - словарь id поста -> список id картинок
+    """
+    media = {post_id: [] for post_id in post_ids}
+    if not post_ids:
+        return media
+    result_db = await db.execute(
+        select(MediaInPost.id, MediaInPost.post_id)
+        .filter(MediaInPost.post_id.in_(post_ids))
+        .order_by(MediaInPost.id)
+    )
+    for row in result_db:
+        media[row.post_id].append(row.id)
+    return media
+
+
+async def get_liked_post_ids(post_ids: List[int], user_id: int, db: AsyncSession) -> Set[int]:
+    """
+    Возвращает id постов из списка, которые лайкнул пользователь
+
+    Args:
+        post_ids (List[int]): id постов
+        user_id (int): id пользователя
+        db (AsyncSession): сессия бд
+    Returns:
+        Set[int] - множество id лайкнутых постов
+    """
+    if not post_ids:
+        return set()
+    result_db = await db.execute(
+        select(Like.post_id).filter(and_(
+            Like.post_id.in_(post_ids),
+            Like.author_id == user_id
+        ))
+    )
+    return set(result_db.scalars().all())
+
+
+async def get_voting_variants_for_posts(post_ids: List[int], db: AsyncSession) -> Dict[int, list]:
+    """
+    Возвращает варианты голосования постов вместе с количеством голосов
+    на каждом варианте (из счётчика votes_count, без загрузки голосов)
+
+    Args:
+        post_ids (List[int]): id постов
+        db (AsyncSession): сессия бд
+    Returns:
+        Dict[int, list] - словарь id поста -> список строк (id, text, post_id, votes_count)
+    """
+    variants = {post_id: [] for post_id in post_ids}
+    if not post_ids:
+        return variants
+    result_db = await db.execute(
+        select(
+            VotingVariant.id, VotingVariant.text, VotingVariant.post_id,
+            VotingVariant.votes_count
+        )
+        .filter(VotingVariant.post_id.in_(post_ids))
+        .order_by(VotingVariant.id)
+    )
+    for row in result_db:
+        variants[row.post_id].append(row)
+    return variants
+
+
+async def get_comments_for_posts(post_ids: List[int], db: AsyncSession) -> Dict[int, list]:
+    """
+    Возвращает комментарии к постам вместе с юзернеймами авторов одним запросом.
+    Строки читаются потоком порциями, без загрузки ORM-обьектов
+
+    Args:
+        post_ids (List[int]): id постов
+        db (AsyncSession): сессия бд
+    Returns:
+        Dict[int, list] - словарь id поста -> список комментариев в виде dict
+    """
+    comments = {post_id: [] for post_id in post_ids}
+    if not post_ids:
+        return comments
+    result_db = await db.stream(
+        select(
+            Comment.id, Comment.text, Comment.post_id, Comment.author_id,
+            Comment.created_at, User.username
+        )
+        .join(User, User.id == Comment.author_id)
+        .filter(Comment.post_id.in_(post_ids))
+        .order_by(Comment.id)
+        .execution_options(yield_per=500)
+    )
+    async for row in result_db:
+        comments[row.post_id].append({
+            'id': row.id,
+            'text': row.text,
+            'author_id': row.author_id,
+            'author_username': row.username,
+            'created_at': row.created_at
+        })
+    return comments
+
+
+async def change_post_counter(
+        post_id: int, counter: str, delta: int, db: AsyncSession
+):
+    """
+    Атомарно изменяет счётчик поста (likes_count или comments_count)
+    в текущей транзакции, без коммита
+
+    Args:
+        post_id (int): id поста
+        counter (str): название счётчика
+        delta (int): на сколько изменить
+        db (AsyncSession): сессия бд
+    Returns:
+        новое значение счётчика или None, если поста нет
+    """
+    column = getattr(Post, counter)
+    result_db = await db.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values({column: column + delta})
+        .returning(column)
+    )
+    return result_db.scalar()
+
+
+async def change_votes_count(variant_id: int, delta: int, db: AsyncSession):
+    """
+    Атомарно изменяет счётчик голосов варианта голосования
+    в текущей транзакции, без коммита
+
+    Args:
+        variant_id (int): id варианта голосования
+        delta (int): на сколько изменить
+        db (AsyncSession): сессия бд
+    Returns:
+        None
+    """
+    await db.execute(
+        update(VotingVariant)
+        .where(VotingVariant.id == variant_id)
+        .values(votes_count=VotingVariant.votes_count + delta)
+    )
+
+
+async def add_voting_variants(post_id: int, texts: List[str], db: AsyncSession) -> None:
+    """
+    Добавляет посту варианты голосования одним многострочным INSERT (без коммита)
+
+    Args:
+        post_id (int): id поста
+        texts (List[str]): тексты вариантов в порядке показа
+        db (AsyncSession): сессия бд
+    """
+    if not texts:
+        return
+    await db.execute(insert(VotingVariant), [{'post_id': post_id, 'text': text} for text in texts])
+
+
+async def delete_voting_variants(variant_ids: List[int], db: AsyncSession) -> None:
+    """
+    Удаляет варианты голосования вместе с голосами за них (без коммита)
+
+    Args:
+        variant_ids (List[int]): id вариантов
+        db (AsyncSession): сессия бд
+    """
+    if not variant_ids:
+        return
+    await db.execute(
+        delete(Vote).where(Vote.variant_id.in_(variant_ids))
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        delete(VotingVariant).where(VotingVariant.id.in_(variant_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def add_like(post_id: int, user_id: int, db: AsyncSession) -> bool:
+    """
+    Ставит лайк, если пост существует и лайка ещё нет, одним
+    INSERT ... SELECT ... WHERE EXISTS ... ON CONFLICT DO NOTHING (без коммита)
+
+    Args:
+        post_id (int): id поста
+        user_id (int): id юзера
+        db (AsyncSession): сессия бд
+    Returns:
+        bool - добавлен ли лайк
+    """
+    result_db = await db.execute(
+        get_insert(db)(Like)
+        .from_select(
+            [Like.post_id, Like.author_id],
+            select(literal(post_id), literal(user_id)).where(exists().where(Post.id == post_id))
+        )
+        .on_conflict_do_nothing()
+        .returning(Like.id)
+    )
+    return result_db.scalar() is not None
+
+
+async def delete_like(post_id: int, user_id: int, db: AsyncSession) -> bool:
+    """
+    Удаляет лайк пользователя на посте одним DELETE ... RETURNING (без коммита)
+
+    Args:
+        post_id (int): id поста
+        user_id (int): id юзера
+        db (AsyncSession): сессия бд
+    Returns:
+        bool - был ли лайк
+    """
+    result_db = await db.execute(
+        delete(Like)
+        .where(Like.post_id == post_id, Like.author_id == user_id)
+        .returning(Like.id)
+        .execution_options(synchronize_session=False)
+    )
+    return result_db.scalar() is not None
+
+
+async def get_voting_variant_post_id(variant_id: int, db: AsyncSession) -> Optional[int]:
+    """
+    Возвращает id поста варианта голосования
+
+    Args:
+        variant_id (int): id варианта голосования
+        db (AsyncSession): сессия бд
+    Returns:
+        id поста или None, если варианта нет
+    """
+    result_db = await db.execute(
+        select(VotingVariant.post_id).where(VotingVariant.id == variant_id)
+    )
+    return result_db.scalar()
+
+
+async def delete_user_vote(post_id: int, user_id: int, db: AsyncSession) -> Optional[int]:
+    """
+    Удаляет голос пользователя в голосовании поста одним DELETE ... RETURNING
+    и уменьшает счётчик варианта (без коммита)
+
+    Args:
+        post_id (int): id поста
+        user_id (int): id юзера
+        db (AsyncSession): сессия бд
+    Returns:
+        id варианта, за который был голос, или None, если голоса не было
+    """
+    result_db = await db.execute(
+        delete(Vote)
+        .where(Vote.post_id == post_id, Vote.user_id == user_id)
+        .returning(Vote.variant_id)
+        .execution_options(synchronize_session=False)
+    )
+    variant_id = result_db.scalar()
+    if variant_id is not None:
+        await change_votes_count(variant_id, -1, db)
+    return variant_id
+
+
+async def add_user_vote(post_id: int, variant_id: int, user_id: int, db: AsyncSession) -> bool:
+    """
+    Добавляет голос, если у пользователя ещё нет голоса в этом голосовании
+    (INSERT ... ON CONFLICT DO NOTHING), и увеличивает счётчик варианта
+    (без коммита)
+
+    Args:
+        post_id (int): id поста
+        variant_id (int): id варианта голосования
+        user_id (int): id юзера
+        db (AsyncSession): сессия бд
+    Returns:
+        bool - добавлен ли голос
+    """
+    result_db = await db.execute(
+        get_insert(db)(Vote)
+        .values(post_id=post_id, variant_id=variant_id, user_id=user_id)
+        .on_conflict_do_nothing()
+        .returning(Vote.id)
+    )
+    if result_db.scalar() is None:
+        return False
+    await change_votes_count(variant_id, 1, db)
+    return True
+
+
+async def recount_counters(db: AsyncSession) -> None:
+    """
+    Пересчитывает все денормализованные счётчики (лайки и комментарии постов,
+    голоса вариантов голосования) по исходным таблицам
+
+    Args:
+        db (AsyncSession): сессия бд
+    Returns:
+        None
+    """
+    await db.execute(update(Post).values(
+        likes_count=select(func.count(Like.id))
+        .where(Like.post_id == Post.id).scalar_subquery(),
+        comments_count=select(func.count(Comment.id))
+        .where(Comment.post_id == Post.id).scalar_subquery()
+    ))
+    await db.execute(update(VotingVariant).values(
+        votes_count=select(func.count(Vote.id))
+        .where(Vote.variant_id == VotingVariant.id).scalar_subquery()
+    ))
+
+
+async def allocate_message_ids(count: int, db: AsyncSession) -> List[int]:
+    """
+    Резервирует блок id для сообщений из последовательности postgres
+    одним запросом
+
+    Args:
+        count (int): сколько id нужно
+        db (AsyncSession): Сессия базы данных.
+    Returns:
+        List[int] - зарезервированные id по возрастанию
+    """
+    result = await db.execute(
+        select(func.nextval(func.pg_get_serial_sequence('messages', 'id')))
+        .select_from(func.generate_series(1, count))
+    )
+    return sorted(result.scalars().all())
+
+
+def get_insert(db: AsyncSession):
+    """
+    Возвращает конструктор INSERT диалекта текущей бд, чтобы можно было
+    использовать ON CONFLICT (поддерживаются postgresql и sqlite)
+
+    Args:
+        db (AsyncSession): сессия бд
+    Returns:
+        функция insert нужного диалекта
+    """
+    if db.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert
+    return sqlite.insert
+
+
+async def add_blob_if_missing(
+        blob_hash: str, size: int, content_type: str, db: AsyncSession
+) -> None:
+    """
+    Добавляет метаданные файла из хранилища, если файла с таким хэшем
+    ещё нет (без коммита)
+
+    Args:
+        blob_hash (str): хэш содержимого
+        size (int): размер в байтах
+        content_type (str): mime-тип
+        db (AsyncSession): сессия бд
+    Returns:
+        None
+    """
+    insert = get_insert(db)
+    await db.execute(
+        insert(Blob)
+        .values(hash=blob_hash, size=size, content_type=content_type)
+        .on_conflict_do_nothing(index_elements=[Blob.hash])
+    )
+
+
+async def set_blob_content_type(blob_hash: str, content_type: str, db: AsyncSession) -> None:
+    """
+    Исправляет mime-тип файла в хранилище (без коммита)
+
+    Args:
+        blob_hash (str): хэш содержимого
+        content_type (str): mime-тип
+        db (AsyncSession): сессия бд
+    """
+    await db.execute(update(Blob).where(Blob.hash == blob_hash).values(content_type=content_type))
+
+
+async def add_image_variant_if_missing(
+        source_hash: str, size: int, image_format: str, blob_hash: str, db: AsyncSession
+) -> None:
+    """
+    Добавляет запись об уменьшенной копии картинки, если её ещё нет (без коммита)
+
+    Args:
+        source_hash (str): ключ оригинала
+        size (int): размер копии
+        image_format (str): формат копии
+        blob_hash (str): ключ копии
+        db (AsyncSession): сессия бд
+    Returns:
+        None
+    """
+    insert = get_insert(db)
+    await db.execute(
+        insert(ImageVariant)
+        .values(source_hash=source_hash, size=size, format=image_format, blob_hash=blob_hash)
+        .on_conflict_do_nothing(
+            index_elements=[ImageVariant.source_hash, ImageVariant.size, ImageVariant.format]
+        )
+    )
+
+
+async def blob_has_variants(blob_hash: str, db: AsyncSession) -> bool:
+    """
+    Проверяет, есть ли у картинки уменьшенные копии
+
+    Args:
+        blob_hash (str): ключ оригинала
+        db (AsyncSession): сессия бд
+    Returns:
+        bool
+    """
+    result_db = await db.execute(select(exists().where(ImageVariant.source_hash == blob_hash)))
+    return bool(result_db.scalar())
+
+
+async def get_image_variant(
+        source_hash: str, size: int, image_format: str, db: AsyncSession
+):
+    """
+    Возвращает метаданные уменьшенной копии картинки
+
+    Args:
+        source_hash (str): ключ оригинала
+        size (int): размер копии
+        image_format (str): формат копии
+        db (AsyncSession): сессия бд
+    Returns:
+        строка (blob_hash, content_type, created_at) или None
+    """
+    result_db = await db.execute(
+        select(ImageVariant.blob_hash, Blob.content_type, Blob.created_at)
+        .join(Blob, Blob.hash == ImageVariant.blob_hash)
+        .filter(and_(
+            ImageVariant.source_hash == source_hash,
+            ImageVariant.size == size,
+            ImageVariant.format == image_format
+        ))
+    )
+    return result_db.first()
+
+
+async def get_blobs_without_variants(db: AsyncSession) -> List[str]:
+    """
+    Возвращает ключи картинок постов и аватарок, для которых ещё
+    не сгенерированы уменьшенные копии
+
+    Args:
+        db (AsyncSession): сессия бд
+    Returns:
+        List[str]
+    """
+    result_db = await db.execute(select(Blob.hash).filter(and_(
+        or_(
+            exists().where(MediaInPost.blob_hash == Blob.hash),
+            exists().where(User.avatar_hash == Blob.hash)
+        ),
+        ~exists().where(ImageVariant.source_hash == Blob.hash)
+    )))
+    return result_db.scalars().all()
+
+
+async def get_media_blob(image_id: int, db: AsyncSession):
+    """
+    Возвращает метаданные картинки поста без её содержимого
+
+    Args:
+        image_id (int): id картинки
+        db (AsyncSession): сессия бд
+    Returns:
+        строка (id, blob_hash, content_type, created_at) или None
+    """
+    result_db = await db.execute(
+        select(MediaInPost.id, MediaInPost.blob_hash, Blob.content_type, Blob.created_at)
+        .outerjoin(Blob, Blob.hash == MediaInPost.blob_hash)
+        .filter(MediaInPost.id == image_id)
+    )
+    return result_db.first()
+
+
+async def get_user_avatar_blob(user_id: int, db: AsyncSession):
+    """
+    Возвращает метаданные аватарки пользователя без её содержимого
+
+    Args:
+        user_id (int): id пользователя
+        db (AsyncSession): сессия бд
+    Returns:
+        строка (id, avatar_hash, content_type, updated_at) или None,
+        если пользователя нет
+    """
+    result_db = await db.execute(
+        select(User.id, User.avatar_hash, Blob.content_type, User.updated_at)
+        .outerjoin(Blob, Blob.hash == User.avatar_hash)
+        .filter(User.id == user_id)
+    )
+    return result_db.first()
+
+
+async def get_unreferenced_blob_hashes(db: AsyncSession) -> List[str]:
+    """
+    Возвращает хэши файлов, на которые больше не ссылается ни одна
+    картинка поста и ни одна аватарка, и которые не являются уменьшенной
+    копией используемой картинки
+
+    Args:
+        db (AsyncSession): сессия бд
+    Returns:
+        List[str]
+    """
+    live_sources = union(
+        select(MediaInPost.blob_hash).filter(MediaInPost.blob_hash.is_not(None)),
+        select(User.avatar_hash).filter(User.avatar_hash.is_not(None))
+    )
+    result_db = await db.execute(select(Blob.hash).filter(and_(
+        Blob.hash.not_in(live_sources),
+        ~exists().where(and_(
+            ImageVariant.blob_hash == Blob.hash,
+            ImageVariant.source_hash.in_(live_sources)
+        ))
+    )))
+    return result_db.scalars().all()
+
+
+def get_conversation_changes(messages: List[dict]) -> List[dict]:
+    """
+    Считает, как пакет новых сообщений меняет сводки переписок: по строке
+    на владельца и собеседника с последним сообщением, числом новых
+    непрочитанных и последним прочитанным (своё сообщение - прочитанная переписка)
+
+    Args:
+        messages (List[dict]): сообщения (id, author_id, getter_id, created_at)
+    Returns:
+        List[dict] - строки для upsert_conversations
+    """
+    changes = {}
+    for message in messages:
+        for owner_id, partner_id in (
+            (message['author_id'], message['getter_id']),
+            (message['getter_id'], message['author_id'])
+        ):
+            change = changes.setdefault((owner_id, partner_id), {
+                'owner_id': owner_id, 'partner_id': partner_id, 'last_message_id': 0,
+                'last_read_message_id': None, 'updated_at': message['created_at'],
+                'incoming_ids': []
+            })
+            change['last_message_id'] = max(change['last_message_id'], message['id'])
+            change['updated_at'] = max(change['updated_at'], message['created_at'])
+            if message['author_id'] == owner_id:
+                change['last_read_message_id'] = max(
+                    change['last_read_message_id'] or 0, message['id']
+                )
+            else:
+                change['incoming_ids'].append(message['id'])
+    for change in changes.values():
+        incoming_ids = change.pop('incoming_ids')
+        change['unread_count'] = sum(
+            message_id > (change['last_read_message_id'] or 0) for message_id in incoming_ids
+        )
+    return list(changes.values())
+
+
+async def upsert_conversations(changes: List[dict], db: AsyncSession) -> None:
+    """
+    Применяет изменения сводок переписок одним INSERT ... ON CONFLICT
+    (без коммита - вызывается в транзакции записи сообщений)
+
+    Args:
+        changes (List[dict]): результат get_conversation_changes
+        db (AsyncSession): Сессия базы данных.
+    """
+    if not changes:
+        return
+    statement = get_insert(db)(Conversation).values(changes)
+    excluded = statement.excluded
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[Conversation.owner_id, Conversation.partner_id],
+        set_={
+            'last_message_id': case(
+                (
+                    excluded.last_message_id > func.coalesce(Conversation.last_message_id, 0),
+                    excluded.last_message_id
+                ),
+                else_=Conversation.last_message_id
+            ),
+            # Если владелец сам написал в пакете, всё до его сообщения прочитано
+            'unread_count': case(
+                (excluded.last_read_message_id.is_(None),
+                 Conversation.unread_count + excluded.unread_count),
+                else_=excluded.unread_count
+            ),
+            'last_read_message_id': func.coalesce(
+                excluded.last_read_message_id, Conversation.last_read_message_id
+            ),
+            'updated_at': excluded.updated_at,
+        }
+    ))
+
+
+async def mark_conversation_read(owner_id: int, partner_id: int, db: AsyncSession) -> None:
+    """
+    Отмечает переписку прочитанной
+
+    Args:
+        owner_id (int): id владельца сводки
+        partner_id (int): id собеседника
+        db (AsyncSession): Сессия базы данных.
+    """
+    await db.execute(
+        update(Conversation)
+        .where(Conversation.owner_id == owner_id, Conversation.partner_id == partner_id)
+        .values(unread_count=0, last_read_message_id=Conversation.last_message_id)
+    )
+
+
+async def update_conversations_before_message_delete(message: Message, db: AsyncSession) -> None:
+    """
+    Обновляет сводки переписки перед удалением сообщения: последнее
+    сообщение и счётчик непрочитанных у получателя (без коммита)
+
+    Args:
+        message (Message): удаляемое сообщение
+        db (AsyncSession): Сессия базы данных.
+    """
+    new_last_message_id = (
+        select(func.max(Message.id))
+        .where(
+            Message.user_low_id == message.user_low_id,
+            Message.user_high_id == message.user_high_id,
+            Message.id != message.id
+        )
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(Conversation)
+        .where(
+            or_(
+                and_(Conversation.owner_id == message.author_id,
+                     Conversation.partner_id == message.getter_id),
+                and_(Conversation.owner_id == message.getter_id,
+                     Conversation.partner_id == message.author_id)
+            ),
+            Conversation.last_message_id == message.id
+        )
+        .values(last_message_id=new_last_message_id)
+    )
+    if message.author_id != message.getter_id:
+        await db.execute(
+            update(Conversation)
+            .where(
+                Conversation.owner_id == message.getter_id,
+                Conversation.partner_id == message.author_id,
+                func.coalesce(Conversation.last_read_message_id, 0) < message.id,
+                Conversation.unread_count > 0
+            )
+            .values(unread_count=Conversation.unread_count - 1)
+        )
+
+
+async def get_conversations(owner_id: int, db: AsyncSession, limit: int = None) -> list:
+    """
+    Возвращает переписки пользователя с последним сообщением, от новых к старым
+
+    Args:
+        owner_id (int): id пользователя
+        db (AsyncSession): Сессия базы данных.
+        limit (int): сколько переписок вернуть (None - все)
+    Returns:
+        list - строки (partner_id, partner_username, unread_count, message_id,
+        message_author_id, message_text, message_created_at); если последнего
+        сообщения нет, поля сообщения равны None
+    """
+    query = (
+        select(
+            Conversation.partner_id, User.username.label('partner_username'),
+            Conversation.unread_count, Message.id.label('message_id'),
+            Message.author_id.label('message_author_id'), Message.text.label('message_text'),
+            Message.created_at.label('message_created_at')
+        )
+        .join(User, User.id == Conversation.partner_id)
+        .outerjoin(Message, Message.id == Conversation.last_message_id)
+        .where(Conversation.owner_id == owner_id)
+        .order_by(Conversation.last_message_id.desc())
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    return (await db.execute(query)).all()
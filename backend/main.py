@@ -1,11 +1,25 @@
 """
 Основной файл с приложением
 """
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from backend.application.routes import router
+from backend.application.routes import router, manager, message_writer, read_router
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Подключает шину сообщений чата при старте приложения, а при остановке
+    отключает её и дописывает в бд буфер сообщений
+    """
+    await manager.start()
+    yield
+    await manager.stop()
+    await message_writer.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,4 +29,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware('http')
+async def sticky_primary_reads(request: Request, call_next):
+    """
+    После запроса, изменившего данные, направляет чтения пользователя
+    в основную бд, пока реплики не догонят
+    """
+    response = await call_next(request)
+    read_router.mark_write(request, response)
+    return response
+
+
 app.include_router(router)
@@ -0,0 +1,109 @@
+"""
+Простой реестр метрик процесса (счётчики, текущие значения и наблюдения
+вроде задержек), которые отдаются эндпоинтом /metrics для мониторинга
+"""
+import threading
+from collections import defaultdict
+from typing import Callable, Dict
+
+
+class Metrics:
+    """
+    Потокобезопасный реестр метрик
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._gauge_callbacks: Dict[str, Callable[[], float]] = {}
+        self._observations: Dict[str, Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1) -> None:
+        """
+        Увеличивает счётчик
+
+        Args:
+            name (str): название метрики
+            value (float): на сколько увеличить
+        """
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """
+        Устанавливает текущее значение метрики
+
+        Args:
+            name (str): название метрики
+            value (float): значение
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def register_gauge(self, name: str, callback: Callable[[], float]) -> None:
+        """
+        Регистрирует метрику, значение которой вычисляется в момент чтения
+
+        Args:
+            name (str): название метрики
+            callback: функция без аргументов, возвращающая значение
+        """
+        with self._lock:
+            self._gauge_callbacks[name] = callback
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Добавляет наблюдение (например, длительность операции):
+        хранятся количество, сумма и максимум
+
+        Args:
+            name (str): название метрики
+            value (float): наблюдаемое значение
+        """
+        with self._lock:
+            observation = self._observations.setdefault(
+                name, {'count': 0, 'sum': 0.0, 'max': 0.0}
+            )
+            observation['count'] += 1
+            observation['sum'] += value
+            observation['max'] = max(observation['max'], value)
+
+    def get(self, name: str) -> float:
+        """
+        Возвращает значение счётчика или текущее значение метрики
+
+        Args:
+            name (str): название метрики
+        Returns:
+            float
+        """
+        with self._lock:
+            if name in self._gauge_callbacks:
+                callback = self._gauge_callbacks[name]
+            elif name in self._gauges:
+                return self._gauges[name]
+            else:
+                return self._counters.get(name, 0)
+        return callback()
+
+    def snapshot(self) -> dict:
+        """
+        Возвращает все метрики в виде словаря
+
+        Returns:
+            dict
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            callbacks = dict(self._gauge_callbacks)
+            observations = {
+                name: dict(observation) for name, observation in self._observations.items()
+            }
+        for name, callback in callbacks.items():
+            gauges[name] = callback()
+        return {'counters': counters, 'gauges': gauges, 'observations': observations}
+
+
+metrics = Metrics()
@@ -0,0 +1,156 @@
+"""
+Хранилище бинарных файлов (картинок постов и аватарок) вне базы данных.
+Файлы адресуются хэшем содержимого (sha256), поэтому одинаковые файлы
+хранятся один раз. В бд хранятся только метаданные (модель Blob).
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def get_content_hash(data: bytes) -> str:
+    """
+    Считает хэш содержимого файла, который используется как ключ в хранилище
+
+    Args:
+        data (bytes): содержимое файла
+    Returns:
+        str - sha256 в hex
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStorage(ABC):
+    """
+    Базовый класс хранилища. Наследники реализуют синхронные методы
+    write/read/exists/delete, асинхронные обёртки выполняют их в потоке,
+    чтобы не блокировать event loop.
+    """
+
+    @abstractmethod
+    def write(self, key: str, data: bytes) -> None:
+        """
+        Записывает файл по ключу
+        """
+
+    @abstractmethod
+    def read(self, key: str) -> bytes:
+        """
+        Читает файл по ключу
+        """
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """
+        Проверяет, есть ли файл с таким ключом
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        Удаляет файл по ключу (если его нет - ничего не делает)
+        """
+
+    def local_path(self, key: str) -> Optional[str]:
+        """
+        Путь к файлу на диске, если хранилище локальное (для отдачи файла
+        через FileResponse без чтения в память), иначе None
+        """
+        return None
+
+    def save_sync(self, data: bytes) -> str:
+        """
+        Сохраняет файл, если файла с таким же содержимым ещё нет
+
+        Args:
+            data (bytes): содержимое
+        Returns:
+            str - ключ (хэш содержимого)
+        """
+        key = get_content_hash(data)
+        if not self.exists(key):
+            self.write(key, data)
+        return key
+
+    async def save(self, data: bytes) -> str:
+        """
+        Асинхронная версия save_sync
+        """
+        return await asyncio.to_thread(self.save_sync, data)
+
+    async def load(self, key: str) -> bytes:
+        """
+        Асинхронно читает файл по ключу
+        """
+        return await asyncio.to_thread(self.read, key)
+
+    async def remove(self, key: str) -> None:
+        """
+        Асинхронно удаляет файл по ключу
+        """
+        await asyncio.to_thread(self.delete, key)
+
+
+class LocalFileBlobStorage(BlobStorage):
+    """
+    Хранилище в локальной файловой системе. Файл с ключом abcdef...
+    лежит по пути <root>/ab/cd/abcdef...
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def write(self, key: str, data: bytes) -> None:
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Пишем во временный файл и атомарно переименовываем, чтобы
+        # параллельные загрузки одного файла не видели его недописанным
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def read(self, key: str) -> bytes:
+        with open(self.local_path(key), 'rb') as file:
+            return file.read()
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+
+def create_blob_storage() -> BlobStorage:
+    """
+    Создаёт хранилище по настройкам из окружения:
+    BLOB_STORAGE_BACKEND (пока поддерживается только local) и
+    BLOB_STORAGE_DIR (папка для файлов, по умолчанию blob_storage)
+
+    Returns:
+        BlobStorage
+    """
+    backend = os.getenv('BLOB_STORAGE_BACKEND', 'local')
+    if backend == 'local':
+        return LocalFileBlobStorage(os.getenv('BLOB_STORAGE_DIR', 'blob_storage'))
+    raise ValueError(f'Неизвестный BLOB_STORAGE_BACKEND: {backend}')
+
+
+blob_storage = create_blob_storage()
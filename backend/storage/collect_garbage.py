@@ -0,0 +1,54 @@
+"""
+Команда для удаления из хранилища файлов, на которые больше ничего
+не ссылается (удалённые посты и картинки, сменённые аватарки и их
+уменьшенные копии).
+Запуск из корня проекта:
+
+    python -m backend.storage.collect_garbage
+"""
+import asyncio
+from sqlalchemy import delete, or_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from backend.db.models import engine, Blob, ImageVariant
+from backend.db.utils import get_unreferenced_blob_hashes
+from backend.storage.blob_storage import BlobStorage, blob_storage
+
+
+async def collect_garbage(db: AsyncSession, storage: BlobStorage) -> int:
+    """
+    Удаляет метаданные и файлы неиспользуемых блобов
+
+    Args:
+        db (AsyncSession): сессия бд
+        storage (BlobStorage): хранилище файлов
+    Returns:
+        int - количество удалённых файлов
+    """
+    hashes = await get_unreferenced_blob_hashes(db)
+    if not hashes:
+        return 0
+    await db.execute(delete(ImageVariant).where(or_(
+        ImageVariant.source_hash.in_(hashes),
+        ImageVariant.blob_hash.in_(hashes)
+    )))
+    await db.execute(delete(Blob).where(Blob.hash.in_(hashes)))
+    await db.commit()
+    # Файлы удаляем только после коммита, чтобы не потерять их при откате
+    for blob_hash in hashes:
+        await storage.remove(blob_hash)
+    return len(hashes)
+
+
+async def main() -> None:
+    """
+    Запускает сборку мусора в хранилище
+    """
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        removed = await collect_garbage(db, blob_storage)
+    await engine.dispose()
+    print(f'Удалено файлов: {removed}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+"""
+Команда для генерации уменьшенных копий картинок, загруженных до
+появления обработки при загрузке (в том числе перенесённых из бд).
+Запуск из корня проекта:
+
+    python -m backend.storage.generate_variants
+"""
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from fastapi.concurrency import run_in_threadpool
+from backend.db.models import engine
+from backend.db.utils import get_blobs_without_variants, set_blob_content_type
+from backend.storage.blob_storage import BlobStorage, blob_storage
+from backend.storage.images import process_image, save_processed_image, InvalidImageError
+from backend.log.log_config import logger
+
+
+async def generate_variants(db: AsyncSession, storage: BlobStorage) -> int:
+    """
+    Генерирует копии для всех картинок, у которых их ещё нет, и записывает
+    настоящий mime-тип оригинала (картинки, перенесённые из бд, могли получить
+    image/png). Оригиналы не перекодируются, каждая картинка коммитится отдельно.
+
+    Args:
+        db (AsyncSession): сессия бд
+        storage (BlobStorage): хранилище файлов
+    Returns:
+        int - количество обработанных картинок
+    """
+    processed_count = 0
+    for blob_hash in await get_blobs_without_variants(db):
+        try:
+            processed = await run_in_threadpool(process_image, await storage.load(blob_hash))
+        except InvalidImageError:
+            logger.info(f'Файл {blob_hash} не является картинкой, копии не созданы')
+            continue
+        await save_processed_image(processed, storage, db, blob_hash=blob_hash)
+        await set_blob_content_type(blob_hash, processed.content_type, db)
+        await db.commit()
+        processed_count += 1
+    return processed_count
+
+
+async def main() -> None:
+    """
+    Запускает генерацию копий
+    """
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        processed_count = await generate_variants(db, blob_storage)
+    await engine.dispose()
+    print(f'Обработано картинок: {processed_count}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,236 @@
+"""
+Обработка загружаемых картинок: определение настоящего формата, удаление
+метаданных (EXIF и т.п.) и генерация уменьшенных копий фиксированных размеров
+"""
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import List, Optional
+from PIL import Image, ImageOps, ImageSequence, UnidentifiedImageError
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.concurrency import run_in_threadpool
+from backend.db.utils import add_blob_if_missing, add_image_variant_if_missing, blob_has_variants
+from backend.storage.blob_storage import BlobStorage, get_content_hash
+
+# Стороны квадрата, в который вписываются уменьшенные копии
+IMAGE_SIZES = (64, 256, 1024)
+# Форматы уменьшенных копий и их mime-типы
+VARIANT_FORMATS = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+# Форматы, которые принимаются при загрузке
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+# Ограничение на количество пикселей (защита от "бомб" декомпрессии).
+# Проверяется по размеру из заголовка файла, до декодирования
+MAX_IMAGE_PIXELS = 50_000_000
+
+
+class InvalidImageError(ValueError):
+    """
+    Загруженный файл не является картинкой поддерживаемого формата
+    """
+
+
+@dataclass
+class ImageVariantData:
+    """
+    Уменьшенная копия картинки
+    """
+    size: int
+    format: str
+    content_type: str
+    data: bytes
+
+
+@dataclass
+class ProcessedImage:
+    """
+    Результат обработки загруженной картинки
+    """
+    data: bytes
+    content_type: str
+    variants: List[ImageVariantData] = field(default_factory=list)
+
+
+def encode_image(image: Image.Image, image_format: str) -> bytes:
+    """
+    Кодирует картинку в нужный формат без метаданных
+
+    Args:
+        image (Image): картинка
+        image_format (str): формат в терминах Pillow (JPEG, PNG, WEBP, GIF)
+    Returns:
+        bytes
+    """
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        # В JPEG нет прозрачности, поэтому накладываем картинку на белый фон
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    options = {'quality': 85} if image_format in ('JPEG', 'WEBP') else {}
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def encode_animation(image: Image.Image, image_format: str) -> bytes:
+    """
+    Перекодирует все кадры анимации без метаданных, сохраняя длительность
+    кадров и число повторов
+
+    Args:
+        image (Image): анимированная картинка
+        image_format (str): формат в терминах Pillow (GIF или WEBP)
+    Returns:
+        bytes
+    """
+    frames = []
+    durations = []
+    for frame in ImageSequence.Iterator(image):
+        durations.append(frame.info.get('duration', 100))
+        frame = frame.convert('RGBA')
+        # Кадр копирует info исходника (комментарии, EXIF, XMP) - очищаем
+        frame.info = {}
+        frames.append(frame)
+    options = {'quality': 85} if image_format == 'WEBP' else {}
+    if 'loop' in image.info:
+        options['loop'] = image.info['loop']
+    buffer = BytesIO()
+    frames[0].save(
+        buffer, format=image_format, save_all=True, append_images=frames[1:],
+        duration=durations, **options
+    )
+    return buffer.getvalue()
+
+
+def process_image(data: bytes) -> ProcessedImage:
+    """
+    Проверяет картинку, удаляет из неё метаданные и генерирует уменьшенные
+    копии всех размеров из IMAGE_SIZES во всех форматах из VARIANT_FORMATS.
+    Работает синхронно и нагружает процессор, поэтому вызывается в потоке.
+
+    Args:
+        data (bytes): содержимое загруженного файла
+    Returns:
+        ProcessedImage
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        image_format = image.format
+        width, height = image.size
+        if width * height > MAX_IMAGE_PIXELS:
+            raise InvalidImageError(
+                f'Картинка слишком большая (больше {MAX_IMAGE_PIXELS} пикселей)'
+            )
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as error:
+        raise InvalidImageError(
+            'Файл не является картинкой (поддерживаются JPEG, PNG, GIF, WebP)'
+        ) from error
+    if image_format not in ALLOWED_FORMATS:
+        raise InvalidImageError(
+            f'Формат {image_format} не поддерживается (поддерживаются JPEG, PNG, GIF, WebP)'
+        )
+
+    content_type = Image.MIME[image_format]
+    if getattr(image, 'is_animated', False):
+        original = encode_animation(image, image_format)
+        # Уменьшенные копии делаются из первого кадра
+        image.seek(0)
+    else:
+        image = ImageOps.exif_transpose(image)
+        original = encode_image(image, image_format)
+
+    variants = []
+    for size in IMAGE_SIZES:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size))
+        for variant_format, variant_content_type in VARIANT_FORMATS.items():
+            variants.append(ImageVariantData(
+                size=size, format=variant_format, content_type=variant_content_type,
+                data=encode_image(thumbnail, variant_format.upper())
+            ))
+    return ProcessedImage(data=original, content_type=content_type, variants=variants)
+
+
+async def store_image(data: bytes, storage: BlobStorage, db: AsyncSession) -> str:
+    """
+    Обрабатывает картинку и сохраняет её вместе с уменьшенными копиями
+    в хранилище, добавляя метаданные в бд (без коммита)
+
+    Args:
+        data (bytes): содержимое загруженного файла
+        storage (BlobStorage): хранилище файлов
+        db (AsyncSession): сессия бд
+    Returns:
+        str - ключ оригинала в хранилище
+    """
+    processed = await run_in_threadpool(process_image, data)
+    blob_hash = get_content_hash(processed.data)
+    if await blob_has_variants(blob_hash, db):
+        # Такая картинка уже загружалась, копии для неё уже есть
+        return blob_hash
+    await save_processed_image(processed, storage, db)
+    return blob_hash
+
+
+async def save_processed_image(
+        processed: ProcessedImage, storage: BlobStorage, db: AsyncSession,
+        blob_hash: Optional[str] = None
+) -> str:
+    """
+    Сохраняет обработанную картинку и её копии в хранилище и бд (без коммита)
+
+    Args:
+        processed (ProcessedImage): обработанная картинка
+        storage (BlobStorage): хранилище файлов
+        db (AsyncSession): сессия бд
+        blob_hash (str): ключ оригинала, если он уже лежит в хранилище
+    Returns:
+        str - ключ оригинала в хранилище
+    """
+    if blob_hash is None:
+        blob_hash = await storage.save(processed.data)
+        await add_blob_if_missing(
+            blob_hash=blob_hash, size=len(processed.data),
+            content_type=processed.content_type, db=db
+        )
+    for variant in processed.variants:
+        variant_hash = await storage.save(variant.data)
+        await add_blob_if_missing(
+            blob_hash=variant_hash, size=len(variant.data),
+            content_type=variant.content_type, db=db
+        )
+        await add_image_variant_if_missing(
+            source_hash=blob_hash, size=variant.size, image_format=variant.format,
+            blob_hash=variant_hash, db=db
+        )
+    return blob_hash
+
+
+def choose_variant_format(accept: Optional[str]) -> str:
+    """
+    Выбирает формат уменьшенной копии по заголовку Accept
+
+    Args:
+        accept (str): значение заголовка Accept
+    Returns:
+        str - webp, если клиент его поддерживает, иначе jpeg
+    """
+    if accept and 'image/webp' in accept:
+        return 'webp'
+    return 'jpeg'
+
+
+def choose_variant_size(size: int) -> int:
+    """
+    Выбирает ближайший размер копии, не меньший запрошенного
+    (или самый большой, если запрошено больше)
+
+    Args:
+        size (int): запрошенный размер
+    Returns:
+        int
+    """
+    for variant_size in IMAGE_SIZES:
+        if variant_size >= size:
+            return variant_size
+    return IMAGE_SIZES[-1]
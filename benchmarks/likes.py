@@ -0,0 +1,119 @@
+"""
+Нагрузочный тест переключения лайков: прежняя реализация против атомарной.
+
+Запуск: python -m benchmarks.likes [--database-url URL] [--workers 20] [--seconds 5]
+
+Без --database-url создаётся временная sqlite-база benchmark_likes.db.
+Для замера на Postgres передайте url пустой базы - в ней будут созданы
+таблицы и тестовые данные. Все воркеры лайкают и снимают лайк с одного
+"горячего" поста, каждый от своего пользователя; выводится количество
+переключений в секунду и проверка, что счётчик совпал с числом лайков.
+"""
+import argparse
+import asyncio
+import os
+import time
+from sqlalchemy import insert, select, func
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from backend.db.models import Base, User, Post, Like
+from backend.db.utils import get_object_by_id, change_post_counter
+from backend.application.views import create_or_delete_like_view
+
+
+DEFAULT_DATABASE = 'benchmark_likes.db'
+
+
+async def legacy_toggle(post_id: int, user_id: int, db: AsyncSession) -> dict:
+    """
+    Прежняя реализация: SELECT поста, SELECT лайка, INSERT/DELETE и UPDATE счётчика
+    """
+    post = await get_object_by_id(object_type=Post, id=post_id, db=db)
+    like = (await db.execute(
+        select(Like).where(Like.post_id == post.id, Like.author_id == user_id)
+    )).scalars().first()
+    if not like:
+        db.add(Like(post_id=post_id, author_id=user_id))
+        likes_count = await change_post_counter(post_id, 'likes_count', 1, db)
+        await db.commit()
+        return {'status': 'liked', 'likes_count': likes_count}
+    await db.delete(like)
+    likes_count = await change_post_counter(post_id, 'likes_count', -1, db)
+    await db.commit()
+    return {'status': 'unliked', 'likes_count': likes_count}
+
+
+async def atomic_toggle(post_id: int, user_id: int, db: AsyncSession) -> dict:
+    """
+    Атомарная реализация; коммит, как и в запросе, делается после представления
+    """
+    result = await create_or_delete_like_view(post_id, user_id, db)
+    await db.commit()
+    return result
+
+
+async def run(toggle, session_factory, post_id: int, user_ids: list, seconds: float) -> float:
+    """
+    Переключает лайки из нескольких воркеров в течение заданного времени
+
+    Returns:
+        float - переключений в секунду
+    """
+    count = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(user_id: int):
+        nonlocal count
+        while time.perf_counter() < deadline:
+            async with session_factory() as db:
+                await toggle(post_id, user_id, db)
+            count += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*[worker(user_id) for user_id in user_ids])
+    return count / (time.perf_counter() - started_at)
+
+
+async def check_counter(session_factory, post_id: int) -> bool:
+    async with session_factory() as db:
+        likes = await db.scalar(select(func.count(Like.id)).where(Like.post_id == post_id))
+        likes_count = await db.scalar(select(Post.likes_count).where(Post.id == post_id))
+    return likes == likes_count
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--database-url', default=None, help='url пустой базы для замера')
+    parser.add_argument('--workers', type=int, default=20, help='число параллельных клиентов')
+    parser.add_argument('--seconds', type=float, default=5.0, help='время замера одной реализации')
+    args = parser.parse_args()
+
+    database_url = args.database_url or f'sqlite+aiosqlite:///./{DEFAULT_DATABASE}'
+    engine = create_async_engine(database_url)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            max_user_id = await conn.scalar(select(func.coalesce(func.max(User.id), 0)))
+            first_user_id = max_user_id + 1
+            user_ids = list(range(first_user_id, first_user_id + args.workers))
+            await conn.execute(insert(User), [
+                {'id': user_id, 'username': f'benchmark{user_id}', 'password': '',
+                 'email': f'benchmark{user_id}@example.com'}
+                for user_id in user_ids
+            ])
+            post_id = (await conn.execute(
+                insert(Post).values(text='benchmark', author_id=user_ids[0]).returning(Post.id)
+            )).scalar()
+
+        for name, toggle in (('прежняя', legacy_toggle), ('атомарная', atomic_toggle)):
+            rate = await run(toggle, session_factory, post_id, user_ids, args.seconds)
+            consistent = await check_counter(session_factory, post_id)
+            print(f'{name}: {rate:.1f} переключений/с, счётчик {"верный" if consistent else "НЕВЕРНЫЙ"}')
+    finally:
+        await engine.dispose()
+        if args.database_url is None and os.path.exists(DEFAULT_DATABASE):
+            os.remove(DEFAULT_DATABASE)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+Замер скорости хэширования паролей при разных настройках.
+
+Запуск: python -m benchmarks.password_hashing [--seconds 2]
+
+Для каждой настройки выводится количество хэшей в секунду на одном ядре,
+по нему можно выбрать PASSWORD_BCRYPT_ROUNDS / PASSWORD_ARGON2_* так,
+чтобы вход укладывался в нужное время при ожидаемой нагрузке.
+"""
+import argparse
+import time
+from passlib.context import CryptContext
+from passlib.hash import argon2
+
+
+BCRYPT_ROUNDS = (10, 11, 12, 13, 14)
+ARGON2_SETTINGS = (
+    # memory_cost (КиБ), time_cost, parallelism
+    (19456, 2, 1),
+    (65536, 3, 4),
+    (131072, 4, 4),
+)
+
+
+def measure(context: CryptContext, seconds: float) -> float:
+    """
+    Считает, сколько хэшей в секунду успевает посчитать контекст
+
+    Args:
+        context (CryptContext): контекст хэширования
+        seconds (float): сколько секунд мерить
+    Returns:
+        float - хэшей в секунду
+    """
+    count = 0
+    started_at = time.perf_counter()
+    while True:
+        context.hash('benchmark-password')
+        count += 1
+        elapsed = time.perf_counter() - started_at
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=2.0, help='время замера одной настройки')
+    args = parser.parse_args()
+
+    for rounds in BCRYPT_ROUNDS:
+        context = CryptContext(schemes=['bcrypt'], bcrypt__default_rounds=rounds)
+        print(f'bcrypt rounds={rounds}: {measure(context, args.seconds):.1f} хэшей/с')
+
+    if not argon2.has_backend():
+        print('argon2: пропущено, установите argon2-cffi')
+        return
+    for memory_cost, time_cost, parallelism in ARGON2_SETTINGS:
+        context = CryptContext(
+            schemes=['argon2'], argon2__type='ID', argon2__memory_cost=memory_cost,
+            argon2__time_cost=time_cost, argon2__parallelism=parallelism
+        )
+        print(
+            f'argon2id m={memory_cost} t={time_cost} p={parallelism}: '
+            f'{measure(context, args.seconds):.1f} хэшей/с'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -43,6 +43,9 @@ const Chat = () => {
                 const chatResponse = await axios.get(`${API_BASE_URL}/chat/${userId}`, { withCredentials: true });
                 if (!isMounted) return; // Проверка на размонтирование
                 setMessages(chatResponse.data.messages || []);
+                // Открытая переписка считается прочитанной
+                axios.post(`${API_BASE_URL}/chat/${userId}/read`, {}, { withCredentials: true })
+                    .catch(err => console.error('Error marking chat as read:', err));
                 setRecipient({
                     id: chatResponse.data.recipient_id,
                     username: chatResponse.data.recipient_username
@@ -61,6 +64,8 @@ const Chat = () => {
                 socketRef.current.onmessage = (event) => {
                     try {
                         const message = JSON.parse(event.data);
+                        // Сервер периодически пингует соединение, такие сообщения пропускаем
+                        if (message.type === 'ping') return;
                         // Проверяем, что сообщение имеет нужный формат
                         if (message.id && message.author_id && message.text) {
                             setMessages(prev => [...prev, {
@@ -0,0 +1,43 @@
+"""Denormalized counters for likes, comments and votes
+
+Revision ID: 39832f04eb57
+Revises: ab4ec824af83
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '39832f04eb57'
+down_revision: Union[str, None] = 'ab4ec824af83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('posts', sa.Column('likes_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('posts', sa.Column('comments_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column(
+        'voting_variants',
+        sa.Column('votes_count', sa.Integer(), server_default='0', nullable=False)
+    )
+    # Заполняем счётчики по исходным таблицам
+    op.execute(
+        'UPDATE posts SET '
+        'likes_count = (SELECT count(*) FROM likes WHERE likes.post_id = posts.id), '
+        'comments_count = (SELECT count(*) FROM comments WHERE comments.post_id = posts.id)'
+    )
+    op.execute(
+        'UPDATE voting_variants SET '
+        'votes_count = (SELECT count(*) FROM votes WHERE votes.variant_id = voting_variants.id)'
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('voting_variants', 'votes_count')
+    op.drop_column('posts', 'comments_count')
+    op.drop_column('posts', 'likes_count')
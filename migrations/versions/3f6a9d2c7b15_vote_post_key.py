@@ -0,0 +1,45 @@
+"""One vote per user in a poll
+
+Revision ID: 3f6a9d2c7b15
+Revises: c4e8a1f5b903
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6a9d2c7b15'
+down_revision: Union[str, None] = 'c4e8a1f5b903'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('votes', sa.Column('post_id', sa.Integer(), nullable=True))
+    op.execute(
+        'UPDATE votes SET post_id = '
+        '(SELECT post_id FROM voting_variants WHERE voting_variants.id = votes.variant_id)'
+    )
+    # Если из-за гонки у пользователя несколько голосов в одном
+    # голосовании, оставляем последний и пересчитываем счётчики
+    op.execute(
+        'DELETE FROM votes WHERE id NOT IN '
+        '(SELECT max(id) FROM votes GROUP BY post_id, user_id)'
+    )
+    op.execute(
+        'UPDATE voting_variants SET '
+        'votes_count = (SELECT count(*) FROM votes WHERE votes.variant_id = voting_variants.id)'
+    )
+    op.alter_column('votes', 'post_id', nullable=False)
+    op.create_foreign_key('votes_post_id_fkey', 'votes', 'posts', ['post_id'], ['id'])
+    op.create_unique_constraint('uq_votes_post_user', 'votes', ['post_id', 'user_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_votes_post_user', 'votes', type_='unique')
+    op.drop_constraint('votes_post_id_fkey', 'votes', type_='foreignkey')
+    op.drop_column('votes', 'post_id')
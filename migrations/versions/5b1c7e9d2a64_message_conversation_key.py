@@ -0,0 +1,40 @@
+"""Conversation key and index for chat history
+
+Revision ID: 5b1c7e9d2a64
+Revises: e22c4b476661
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1c7e9d2a64'
+down_revision: Union[str, None] = 'e22c4b476661'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('user_low_id', sa.Integer(), nullable=True))
+    op.add_column('messages', sa.Column('user_high_id', sa.Integer(), nullable=True))
+    # Заполняем ключ переписки для уже существующих сообщений
+    op.execute(
+        'UPDATE messages SET '
+        'user_low_id = CASE WHEN author_id < getter_id THEN author_id ELSE getter_id END, '
+        'user_high_id = CASE WHEN author_id < getter_id THEN getter_id ELSE author_id END'
+    )
+    op.alter_column('messages', 'user_low_id', nullable=False)
+    op.alter_column('messages', 'user_high_id', nullable=False)
+    op.create_index(
+        'ix_messages_conversation', 'messages', ['user_low_id', 'user_high_id', 'id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_conversation', table_name='messages')
+    op.drop_column('messages', 'user_high_id')
+    op.drop_column('messages', 'user_low_id')
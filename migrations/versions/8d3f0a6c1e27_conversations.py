@@ -0,0 +1,52 @@
+"""Conversation summaries for the chat list
+
+Revision ID: 8d3f0a6c1e27
+Revises: 5b1c7e9d2a64
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f0a6c1e27'
+down_revision: Union[str, None] = '5b1c7e9d2a64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'conversations',
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('partner_id', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=True),
+        sa.Column('unread_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('last_read_message_id', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['partner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('owner_id', 'partner_id')
+    )
+    op.create_index(
+        'ix_conversations_owner_last_message', 'conversations', ['owner_id', 'last_message_id']
+    )
+    # Сводки по уже существующим сообщениям, прочтение раньше не отслеживалось,
+    # поэтому старые переписки считаем прочитанными
+    op.execute(
+        'INSERT INTO conversations '
+        '(owner_id, partner_id, last_message_id, unread_count, last_read_message_id, updated_at) '
+        'SELECT owner_id, partner_id, max(id), 0, max(id), max(created_at) FROM ('
+        'SELECT author_id AS owner_id, getter_id AS partner_id, id, created_at FROM messages '
+        'UNION ALL '
+        'SELECT getter_id AS owner_id, author_id AS partner_id, id, created_at FROM messages'
+        ') AS conversation_messages GROUP BY owner_id, partner_id'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversations_owner_last_message', table_name='conversations')
+    op.drop_table('conversations')
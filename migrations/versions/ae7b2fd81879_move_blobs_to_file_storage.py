@@ -0,0 +1,122 @@
+"""Move image blobs out of table rows into the file storage
+
+Revision ID: ae7b2fd81879
+Revises: 39832f04eb57
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from backend.storage.blob_storage import blob_storage
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ae7b2fd81879'
+down_revision: Union[str, None] = '39832f04eb57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Сигнатуры форматов картинок. Проверка встроена в миграцию, чтобы она не зависела
+# от кода приложения, который может измениться
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+)
+
+
+def sniff_content_type(data: bytes) -> str:
+    """
+    Определяет mime-тип картинки по первым байтам содержимого
+    """
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, content_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    return 'application/octet-stream'
+
+
+def move_blobs_out(connection, table: str, blob_column: str, hash_column: str) -> None:
+    """
+    Переносит содержимое колонки blob_column в хранилище файлов построчно,
+    чтобы не держать в памяти все картинки сразу
+    """
+    ids = connection.execute(sa.text(
+        f'SELECT id FROM {table} WHERE {blob_column} IS NOT NULL'
+    )).scalars().all()
+    for row_id in ids:
+        data = connection.execute(
+            sa.text(f'SELECT {blob_column} FROM {table} WHERE id = :id'), {'id': row_id}
+        ).scalar()
+        data = bytes(data)
+        blob_hash = blob_storage.save_sync(data)
+        connection.execute(
+            sa.text(
+                'INSERT INTO blobs (hash, size, content_type, created_at) '
+                'SELECT :hash, :size, :content_type, now() '
+                'WHERE NOT EXISTS (SELECT 1 FROM blobs WHERE hash = :hash)'
+            ),
+            {'hash': blob_hash, 'size': len(data), 'content_type': sniff_content_type(data)}
+        )
+        connection.execute(
+            sa.text(
+                f'UPDATE {table} SET {hash_column} = :hash, {blob_column} = NULL WHERE id = :id'
+            ),
+            {'hash': blob_hash, 'id': row_id}
+        )
+
+
+def move_blobs_back(connection, table: str, blob_column: str, hash_column: str) -> None:
+    """
+    Возвращает содержимое файлов из хранилища обратно в колонку blob_column
+    """
+    rows = connection.execute(sa.text(
+        f'SELECT id, {hash_column} FROM {table} WHERE {hash_column} IS NOT NULL'
+    )).all()
+    for row_id, blob_hash in rows:
+        connection.execute(
+            sa.text(f'UPDATE {table} SET {blob_column} = :data WHERE id = :id'),
+            {'data': blob_storage.read(blob_hash), 'id': row_id}
+        )
+
+
+def upgrade() -> None:
+    op.create_table('blobs',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('content_type', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('media_in_post', sa.Column('blob_hash', sa.String(length=64), nullable=True))
+    op.create_foreign_key(
+        'media_in_post_blob_hash_fkey', 'media_in_post', 'blobs', ['blob_hash'], ['hash']
+    )
+    op.create_index('ix_media_in_post_blob_hash', 'media_in_post', ['blob_hash'])
+    op.add_column('users', sa.Column('avatar_hash', sa.String(length=64), nullable=True))
+    op.create_foreign_key('users_avatar_hash_fkey', 'users', 'blobs', ['avatar_hash'], ['hash'])
+    op.create_index('ix_users_avatar_hash', 'users', ['avatar_hash'])
+
+    connection = op.get_bind()
+    move_blobs_out(connection, 'media_in_post', 'image', 'blob_hash')
+    move_blobs_out(connection, 'users', 'avatar', 'avatar_hash')
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    move_blobs_back(connection, 'media_in_post', 'image', 'blob_hash')
+    move_blobs_back(connection, 'users', 'avatar', 'avatar_hash')
+
+    op.drop_index('ix_users_avatar_hash', table_name='users')
+    op.drop_constraint('users_avatar_hash_fkey', 'users', type_='foreignkey')
+    op.drop_column('users', 'avatar_hash')
+    op.drop_index('ix_media_in_post_blob_hash', table_name='media_in_post')
+    op.drop_constraint('media_in_post_blob_hash_fkey', 'media_in_post', type_='foreignkey')
+    op.drop_column('media_in_post', 'blob_hash')
+    op.drop_table('blobs')
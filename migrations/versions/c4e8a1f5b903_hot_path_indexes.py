@@ -0,0 +1,62 @@
+"""Indexes for hot lookup paths, unique likes and votes
+
+Revision ID: c4e8a1f5b903
+Revises: 8d3f0a6c1e27
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a1f5b903'
+down_revision: Union[str, None] = '8d3f0a6c1e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_comments_post_id', 'comments', ['post_id', 'id']),
+    ('ix_posts_author_id', 'posts', ['author_id', 'id']),
+    ('ix_voting_variants_post_id', 'voting_variants', ['post_id', 'id']),
+    ('ix_friendship_first_second', 'friendship', ['first_friend_id', 'second_friend_id']),
+    ('ix_friendship_second_first', 'friendship', ['second_friend_id', 'first_friend_id']),
+    ('ix_friendship_requests_getter_author', 'friendship_requests', ['getter_id', 'author_id']),
+    ('ix_media_in_post_post_id', 'media_in_post', ['post_id', 'id']),
+    ('ix_complaints_about_comment_comment_id', 'complaints_about_comment', ['comment_id']),
+    ('ix_complaints_about_post_post_id', 'complaints_about_post', ['post_id']),
+]
+
+
+def upgrade() -> None:
+    # Перед уникальными ключами убираем повторные лайки и голоса
+    # (могли появиться при двойном клике) и пересчитываем счётчики
+    op.execute(
+        'DELETE FROM likes WHERE id NOT IN '
+        '(SELECT min(id) FROM likes GROUP BY post_id, author_id)'
+    )
+    op.execute(
+        'DELETE FROM votes WHERE id NOT IN '
+        '(SELECT min(id) FROM votes GROUP BY variant_id, user_id)'
+    )
+    op.execute(
+        'UPDATE posts SET '
+        'likes_count = (SELECT count(*) FROM likes WHERE likes.post_id = posts.id)'
+    )
+    op.execute(
+        'UPDATE voting_variants SET '
+        'votes_count = (SELECT count(*) FROM votes WHERE votes.variant_id = voting_variants.id)'
+    )
+    op.create_unique_constraint('uq_likes_post_author', 'likes', ['post_id', 'author_id'])
+    op.create_unique_constraint('uq_votes_variant_user', 'votes', ['variant_id', 'user_id'])
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+    op.drop_constraint('uq_votes_variant_user', 'votes', type_='unique')
+    op.drop_constraint('uq_likes_post_author', 'likes', type_='unique')
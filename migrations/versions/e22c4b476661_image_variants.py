@@ -0,0 +1,38 @@
+"""Image size variants
+
+Revision ID: e22c4b476661
+Revises: ae7b2fd81879
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e22c4b476661'
+down_revision: Union[str, None] = 'ae7b2fd81879'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('image_variants',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('source_hash', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('format', sa.String(), nullable=False),
+    sa.Column('blob_hash', sa.String(length=64), nullable=False),
+    sa.ForeignKeyConstraint(['blob_hash'], ['blobs.hash'], ),
+    sa.ForeignKeyConstraint(['source_hash'], ['blobs.hash'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('source_hash', 'size', 'format', name='uq_image_variants_source')
+    )
+    # Копии для уже загруженных картинок создаёт команда
+    # python -m backend.storage.generate_variants
+
+
+def downgrade() -> None:
+    op.drop_table('image_variants')
@@ -5,7 +5,12 @@ import sys
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
+import re
 import json
+import asyncio
+import threading
+from io import BytesIO
+from contextlib import contextmanager
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
@@ -13,14 +18,19 @@ from httpx import ASGITransport
 from fastapi import Request, status, Response
 from fastapi.exceptions import HTTPException
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from PIL import Image
 from backend.main import app
 from backend.application.schemas import (RegisterFormData, LoginFormData)
 from backend.application.views import (register_view, login_view)
 from backend.db.models import Base  # Импортируем Base из моделей приложения
 from backend.application.config import (security, config)
-from backend.application.routes import (get_db)
+from backend.application.routes import (get_db, get_read_db, get_message_writer)
+from backend.db.message_writer import MessageWriter
+from backend.application import utils as password_utils
+from backend.application.utils import PasswordHashingPool
 
 # Важно: Используйте переменную окружения для тестирования.
 TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL", "sqlite+aiosqlite:///./test.db")
@@ -50,6 +60,8 @@ async def db():
 @pytest_asyncio.fixture(scope="module")
 async def client():
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_message_writer] = override_get_message_writer
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         yield ac
@@ -62,6 +74,73 @@ async def clear_data():
 async def override_get_db():
     async with SessionLocal() as session:
         yield session
+        await session.commit()
+
+class InMemoryMessageIds:
+    """
+    Выдаёт id сообщений в тестах: в sqlite нет последовательностей, поэтому
+    id считаются в памяти от максимального в бд. Один счётчик на все
+    тестовые MessageWriter, чтобы их id не пересекались
+    """
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self._next_id = None
+
+    async def __call__(self, count: int) -> list:
+        if self._next_id is None:
+            from sqlalchemy import select, func
+            from backend.db.models import Message
+
+            async with self.session_factory() as session:
+                max_id = await session.scalar(select(func.coalesce(func.max(Message.id), 0)))
+            self._next_id = max_id + 1
+        ids = list(range(self._next_id, self._next_id + count))
+        self._next_id += count
+        return ids
+
+
+test_message_ids = InMemoryMessageIds(SessionLocal)
+
+
+def make_test_message_writer(**kwargs) -> MessageWriter:
+    """
+    Создаёт MessageWriter для тестов. id выдаются по одному, чтобы сообщения
+    разных буферов шли по id в порядке отправки
+    """
+    return MessageWriter(SessionLocal, id_block_size=1, id_allocator=test_message_ids, **kwargs)
+
+
+test_message_writer = make_test_message_writer()
+
+def override_get_message_writer():
+    return test_message_writer
+
+
+def make_image(color, size=(300, 200), image_format='PNG') -> bytes:
+    """
+    Создаёт настоящую картинку для тестов загрузки
+    """
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+@contextmanager
+def capture_sql():
+    """
+    Собирает тексты всех SQL-запросов, выполненных через тестовый движок
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
 
 
 @pytest.mark.asyncio
@@ -246,6 +325,29 @@ async def test_create_like(client):
     assert response.status_code == 200
     assert response.json() == {'status': 'liked', 'likes_count': 1}
 
+@pytest.mark.asyncio
+async def test_get_post_liked(client):
+    """
+    Тест данных отдельного поста после лайка
+    (количество лайков и статус лайка считаются агрегатными запросами)
+    Ожидается:
+        статус код: 200
+        likes_count: 1, liked_status: True
+    """
+    token = security.create_access_token(uid="1")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    response = await client.get(
+        f'/posts/{1}'
+    )
+    assert response.status_code == 200
+    post = response.json()['post']
+    assert post['likes_count'] == 1
+    assert post['liked_status'] is True
+    assert post['author_username'] == 'test'
+    assert post['comments_count'] == 1
+    assert post['comments'][0]['text'] == 'string'
+
+
 @pytest.mark.asyncio
 async def test_delete_like(client):
     """
@@ -282,6 +384,36 @@ async def test_get_posts(client):
     assert response.status_code == 200
 
 
+@pytest.mark.asyncio
+async def test_get_posts_data(client):
+    """
+    Тест содержимого ленты постов (данные собираются пачкой запросов на всю страницу)
+        - пользователь авторизован
+    Ожидается:
+        статус код: 200
+        json в нужном формате
+    """
+    token = security.create_access_token(uid="1")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+
+    response = await client.get(
+        '/posts'
+    )
+    assert response.status_code == 200
+    post = response.json()['posts'][0]
+    assert post['id'] == 1
+    assert post['author_id'] == 1
+    assert post['author_username'] == 'test'
+    assert post['images_id'] == []
+    assert post['likes_count'] == 0
+    assert post['liked_status'] is False
+    assert post['voting_variants'] == [
+        {'id': 1, 'text': 'string', 'percent': 0, 'votes_count': 0}
+    ]
+    assert post['comments_count'] == 1
+    assert post['comments'][0]['author_username'] == 'test'
+
+
 @pytest.mark.asyncio
 async def test_register_2(client):
     """
@@ -381,6 +513,25 @@ async def test_get_someones_avatar(client):
     assert response.status_code == 200
 
 
+@pytest.mark.asyncio
+async def test_default_avatar_not_modified(client):
+    """
+    Тест кэширования стандартной аватарки
+    Ожидается:
+        ETag и Cache-Control, на If-None-Match с тем же ETag - 304
+    """
+    token = security.create_access_token(uid="1")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    response = await client.get(f'/user/{2}/avatar')
+    assert response.status_code == 200
+    assert response.headers['cache-control'] == 'public, no-cache'
+
+    response = await client.get(
+        f'/user/{2}/avatar', headers={'If-None-Match': response.headers['etag']}
+    )
+    assert response.status_code == 304
+
+
 @pytest.mark.asyncio
 async def test_vote(client):
     """
@@ -415,6 +566,182 @@ async def test_delete_vote(client):
     assert response.status_code == 200
 
 
+@pytest.mark.asyncio
+async def test_concurrent_votes(client):
+    """
+    Тест параллельного голосования одного пользователя за разные варианты
+    одного поста
+    Ожидается:
+        у пользователя остаётся ровно один голос, сумма счётчиков равна 1
+    """
+    from sqlalchemy import select, func
+    from backend.db.models import Post, Vote, VotingVariant
+
+    token = security.create_access_token(uid="2")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    response = await client.post(
+        '/post', json={"text": "poll", "options": [f"option {i}" for i in range(5)]}
+    )
+    assert response.status_code == 200
+    async with SessionLocal() as session:
+        post_id = await session.scalar(select(func.max(Post.id)))
+        variant_ids = list(await session.scalars(
+            select(VotingVariant.id).where(VotingVariant.post_id == post_id)
+        ))
+
+    responses = await asyncio.gather(*[
+        client.post(f'/vote/{variant_id}') for variant_id in variant_ids * 4
+    ])
+    assert {response.status_code for response in responses} == {200}
+
+    async with SessionLocal() as session:
+        votes = list(await session.scalars(
+            select(Vote).where(Vote.post_id == post_id, Vote.user_id == 2)
+        ))
+        counts = list(await session.scalars(
+            select(VotingVariant.votes_count).where(VotingVariant.post_id == post_id)
+        ))
+    assert len(votes) == 1
+    assert sum(counts) == 1
+
+    response = await client.delete(f'/vote/{post_id}')
+    assert response.status_code == 200
+    async with SessionLocal() as session:
+        assert await session.scalar(
+            select(func.count(Vote.id)).where(Vote.post_id == post_id)
+        ) == 0
+        assert await session.scalar(
+            select(func.sum(VotingVariant.votes_count)).where(VotingVariant.post_id == post_id)
+        ) == 0
+    response = await client.delete(f'/post/{post_id}')
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_concurrent_likes(client):
+    """
+    Тест двойного клика по лайку
+    Ожидается:
+        два переключения (лайк и снятие), лайков в бд не больше одного,
+        счётчик совпадает с числом лайков
+    """
+    from sqlalchemy import select, func
+    from backend.db.models import Post, Like
+
+    token = security.create_access_token(uid="2")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    response = await client.post('/post', json={"text": "likes", "options": None})
+    assert response.status_code == 200
+    async with SessionLocal() as session:
+        post_id = await session.scalar(select(func.max(Post.id)))
+
+    for clicks in (2, 3):
+        responses = await asyncio.gather(*[
+            client.post(f'/post/{post_id}/like') for _ in range(clicks)
+        ])
+        assert {response.status_code for response in responses} == {200}
+        async with SessionLocal() as session:
+            likes = await session.scalar(
+                select(func.count(Like.id)).where(Like.post_id == post_id)
+            )
+            likes_count = await session.scalar(select(Post.likes_count).where(Post.id == post_id))
+        assert likes == likes_count <= 1
+
+    response = await client.delete(f'/post/{post_id}')
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_edit_poll_keeps_unchanged_variants(client):
+    """
+    Тест создания поста с голосованием и редактирования вариантов
+    Ожидается:
+        пост с вариантами создаётся одним коммитом, при редактировании
+        неизменённые варианты и голоса за них сохраняются
+    """
+    from sqlalchemy import select, func
+    from backend.db.models import Post, Vote, VotingVariant
+
+    token = security.create_access_token(uid="2")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    with capture_sql() as statements:
+        response = await client.post(
+            '/post', json={"text": "poll", "options": ["first", "second", "third"]}
+        )
+    assert response.status_code == 200
+    assert sum(statement.startswith('INSERT INTO voting_variants') for statement in statements) == 1
+    async with SessionLocal() as session:
+        post_id = await session.scalar(select(func.max(Post.id)))
+        first_id, second_id, third_id = await session.scalars(
+            select(VotingVariant.id).where(VotingVariant.post_id == post_id).order_by(VotingVariant.id)
+        )
+    assert (await client.post(f'/vote/{first_id}')).status_code == 200
+
+    response = await client.put(
+        f'/post/{post_id}', json={"options": ["first", "third", "fourth", "fifth"]}
+    )
+    assert response.status_code == 200
+    async with SessionLocal() as session:
+        variants = (await session.execute(
+            select(VotingVariant.id, VotingVariant.text, VotingVariant.votes_count)
+            .where(VotingVariant.post_id == post_id).order_by(VotingVariant.id)
+        )).all()
+        votes = list(await session.scalars(select(Vote.variant_id).where(Vote.post_id == post_id)))
+    assert [variant.text for variant in variants] == ["first", "third", "fourth", "fifth"]
+    assert [variant.id for variant in variants][:2] == [first_id, third_id]
+    assert second_id not in [variant.id for variant in variants]
+    assert variants[0].votes_count == 1
+    assert votes == [first_id]
+
+    response = await client.delete(f'/post/{post_id}')
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_single_commit_per_request(client):
+    """
+    Тест единицы работы: запрос, меняющий несколько таблиц, делает один коммит,
+    а запрос, завершившийся ошибкой, не коммитит ничего
+    """
+    from sqlalchemy import select, func
+    from backend.db.models import Post
+
+    commits = []
+
+    def on_commit(conn):
+        commits.append(conn)
+
+    token = security.create_access_token(uid="2")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    event.listen(async_engine.sync_engine, "commit", on_commit)
+    try:
+        response = await client.post(
+            '/post', json={"text": "unit of work", "options": ["first", "second"]}
+        )
+        assert response.status_code == 200
+        assert len(commits) == 1
+
+        async with SessionLocal() as session:
+            post_id = await session.scalar(select(func.max(Post.id)))
+        commits.clear()
+        response = await client.post(f'/post/{post_id}/comment', json={"text": "comment"})
+        assert response.status_code == 200
+        assert len(commits) == 1
+
+        commits.clear()
+        token = security.create_access_token(uid="3")
+        client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+        response = await client.put(f'/post/{post_id}', json={"text": "not mine"})
+        assert response.status_code == 400
+        assert commits == []
+    finally:
+        event.remove(async_engine.sync_engine, "commit", on_commit)
+
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, security.create_access_token(uid="2"))
+    response = await client.delete(f'/post/{post_id}')
+    assert response.status_code == 200
+
+
 @pytest.mark.asyncio
 async def test_edit_post(client):
     token = security.create_access_token(uid="1")
@@ -521,7 +848,7 @@ async def test_upload_post_image(client):
     token = security.create_access_token(uid="1")
     client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
 
-    test_file = ("post_image.jpg", b"fake image data", "image/jpeg")
+    test_file = ("post_image.jpg", make_image('red', image_format='JPEG'), "image/jpeg")
 
     response = await client.post(
         f"/posts/{1}/media",
@@ -543,6 +870,146 @@ async def test_get_post_image(client):
     assert response.status_code == 200
 
 
+@pytest.mark.asyncio
+async def test_post_image_deduplicated(client, db):
+    """
+    Тест хранения картинок в хранилище файлов по хэшу содержимого
+        - одинаковые картинки хранятся один раз
+    Ожидается:
+        отдаётся загруженное содержимое, в бд одна запись о файле
+    """
+    from sqlalchemy import select, func
+    from backend.db.models import ImageVariant, MediaInPost
+
+    token = security.create_access_token(uid="1")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+
+    test_file = ("same_image.jpg", make_image('red', image_format='JPEG'), "image/jpeg")
+    response = await client.post(
+        f"/posts/{1}/media",
+        files={"uploaded_file": test_file}
+    )
+    assert response.status_code == 200
+
+    first = await client.get(f"/posts/image/{1}")
+    second = await client.get(f"/posts/image/{2}")
+    assert second.status_code == 200
+    assert second.content == first.content
+
+    hashes = (await db.execute(select(MediaInPost.blob_hash))).scalars().all()
+    assert len(hashes) == 2 and len(set(hashes)) == 1
+    # по две копии (webp и jpeg) трёх размеров, сгенерированные один раз
+    assert (await db.execute(select(func.count()).select_from(ImageVariant))).scalar() == 6
+
+
+@pytest.mark.asyncio
+async def test_post_image_not_modified(client):
+    """
+    Тест кэширования картинки поста
+    Ожидается:
+        ETag и долгий Cache-Control, на If-None-Match с тем же ETag - 304 без тела
+    """
+    token = security.create_access_token(uid="1")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    response = await client.get(f"/posts/image/{1}")
+    assert response.status_code == 200
+    etag = response.headers['etag']
+    assert 'immutable' in response.headers['cache-control']
+    assert 'last-modified' in response.headers
+
+    response = await client.get(f"/posts/image/{1}", headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['etag'] == etag
+
+    response = await client.get(f"/posts/image/{1}", headers={'If-None-Match': '"other"'})
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_post_image_variants(client):
+    """
+    Тест получения уменьшенных копий картинки поста
+    Ожидается:
+        webp или jpeg (по заголовку Accept) нужного размера, без EXIF
+    """
+    token = security.create_access_token(uid="1")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+
+    response = await client.get(
+        f"/posts/image/{1}", params={'size': 64}, headers={'Accept': 'image/webp,*/*'}
+    )
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'image/webp'
+    assert response.headers['vary'] == 'Accept'
+    image = Image.open(BytesIO(response.content))
+    assert max(image.size) == 64
+
+    response = await client.get(f"/posts/image/{1}", params={'size': 200})
+    assert response.headers['content-type'] == 'image/jpeg'
+    assert max(Image.open(BytesIO(response.content)).size) == 256
+
+    original = await client.get(f"/posts/image/{1}")
+    assert original.headers['content-type'] == 'image/jpeg'
+    assert not Image.open(BytesIO(original.content)).getexif()
+
+
+@pytest.mark.asyncio
+async def test_upload_not_image(client):
+    """
+    Тест загрузки файла, который не является картинкой
+    Ожидается:
+        статус код: 400
+    """
+    token = security.create_access_token(uid="1")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    response = await client.post(
+        f"/posts/{1}/media",
+        files={"uploaded_file": ("fake.png", b"fake image data", "image/png")}
+    )
+    assert response.status_code == 400
+
+
+def test_process_animated_image_strips_metadata():
+    """
+    Тест того, что кадры анимации перекодируются без метаданных,
+    а длительность кадров и число повторов сохраняются
+    """
+    from backend.storage.images import process_image
+
+    frames = [Image.new('RGB', (40, 30), color) for color in ('red', 'green', 'blue')]
+    buffer = BytesIO()
+    frames[0].save(
+        buffer, format='GIF', save_all=True, append_images=frames[1:],
+        duration=[100, 200, 300], loop=0, comment=b'secret location'
+    )
+
+    processed = process_image(buffer.getvalue())
+    assert processed.content_type == 'image/gif'
+    original = Image.open(BytesIO(processed.data))
+    assert original.n_frames == 3
+    assert 'comment' not in original.info
+    assert original.info['loop'] == 0
+    durations = []
+    for index in range(original.n_frames):
+        original.seek(index)
+        durations.append(original.info['duration'])
+    assert durations == [100, 200, 300]
+
+
+def test_process_image_rejects_too_many_pixels():
+    """
+    Тест того, что картинка больше MAX_IMAGE_PIXELS отклоняется до декодирования
+    """
+    from backend.storage.images import process_image, InvalidImageError, MAX_IMAGE_PIXELS
+
+    buffer = BytesIO()
+    Image.new('1', (10_000, MAX_IMAGE_PIXELS // 10_000 + 1)).save(buffer, format='PNG')
+    with pytest.raises(InvalidImageError):
+        process_image(buffer.getvalue())
+    assert Image.MAX_IMAGE_PIXELS != MAX_IMAGE_PIXELS
+
+
 @pytest.mark.asyncio
 async def test_delete_post_image(client):
     """
@@ -623,7 +1090,8 @@ async def test_get_chat(client):
     assert response.json() == {
         "recipient_id": 2,
         "recipient_username": "test2",
-        "messages": []
+        "messages": [],
+        "next_cursor": None
     }
 
 
@@ -642,7 +1110,7 @@ async def test_get_user_posts(client):
         f'/users/{2}/posts'
     )
     assert response.status_code == 200
-    assert response.json() == {'posts':[]}
+    assert response.json() == {'posts':[], 'next_cursor': None}
 
 
 @pytest.mark.asyncio
@@ -665,7 +1133,8 @@ async def test_get_profile(client):
         'name':'user2',
         'surname':'testuser2',
         'email':'user2@example.com',
-        'posts': []
+        'posts': [],
+        'next_cursor': None
     }
 
 
@@ -689,7 +1158,8 @@ async def test_get_other_profile(client):
         'name':'user2',
         'surname':'testuser2',
         'email':'user2@example.com',
-        'posts': []
+        'posts': [],
+        'next_cursor': None
     }
 
 
@@ -750,7 +1220,7 @@ async def test_get_user_posts(client):
         f'/profile/posts'
     )
     assert response.status_code == 200
-    assert response.json() == {'posts':[]}
+    assert response.json() == {'posts':[], 'next_cursor': None}
 
 
 @pytest.mark.asyncio
@@ -829,7 +1299,9 @@ async def test_websocket_chat():
     1. Подключение двух клиентов
     2. Отправка сообщения от первого клиента второму
     3. Проверка получения сообщения вторым клиентом
+    4. Проверка записи сообщения в бд
     """
+    from backend.db.models import Message
     client = TestClient(app)
     with client.websocket_connect("/chatsocket/1") as websocket1:
         with client.websocket_connect("/chatsocket/2") as websocket2:
@@ -847,6 +1319,134 @@ async def test_websocket_chat():
             assert "created_at" in received_message
             assert "id" in received_message
 
+    # Сообщения пишутся в бд пакетами, дописываем буфер
+    await test_message_writer.close()
+    async with SessionLocal() as session:
+        stored = await session.get(Message, received_message["id"])
+    assert stored.text == "Hello from user 1"
+
+
+@pytest.mark.asyncio
+async def test_websocket_chat_many_connections():
+    """
+    Тест доставки сообщения во все вкладки получателя
+    """
+    client = TestClient(app)
+    with client.websocket_connect("/chatsocket/1") as websocket1, \
+            client.websocket_connect("/chatsocket/2") as first_tab, \
+            client.websocket_connect("/chatsocket/2") as second_tab:
+        websocket1.send_text(json.dumps({"recipient_id": "2", "message": "Hello tabs"}))
+        assert json.loads(first_tab.receive_text())["text"] == "Hello tabs"
+        assert json.loads(second_tab.receive_text())["text"] == "Hello tabs"
+
+
+@pytest.mark.asyncio
+async def test_chat_backplane_between_workers():
+    """
+    Тест доставки сообщения через шину получателю, подключённому к другому воркеру
+    """
+    from backend.application.backplane import ChatBackplane
+    from backend.application.utils import WebSocketConnectionManager
+
+    class SharedBackplane(ChatBackplane):
+        subscribers = []
+
+        def subscribe(self, handler):
+            super().subscribe(handler)
+            self.subscribers.append(self)
+
+        async def start(self):
+            pass
+
+        async def stop(self):
+            pass
+
+        async def publish(self, user_id, payload):
+            for backplane in self.subscribers:
+                await backplane._dispatch(user_id, payload)
+
+    class IncompleteBackplane(ChatBackplane):
+        async def publish(self, user_id, payload):
+            pass
+
+    # Шина без start/stop не создаётся, а не падает на первом сообщении
+    with pytest.raises(TypeError):
+        IncompleteBackplane()
+
+    class FakeWebSocket:
+        def __init__(self):
+            self.sent = []
+
+        async def accept(self):
+            pass
+
+        async def send_text(self, text):
+            self.sent.append(text)
+
+    first_worker = WebSocketConnectionManager(SharedBackplane())
+    second_worker = WebSocketConnectionManager(SharedBackplane())
+    recipient = FakeWebSocket()
+    await second_worker.connect("2", recipient)
+
+    await first_worker.send_personal_message(message_id=1, author_id="1", text="hi", user_id="2")
+    await asyncio.sleep(0.05)
+    assert json.loads(recipient.sent[0])["text"] == "hi"
+
+    second_worker.disconnect("2", recipient)
+    assert second_worker.active_connections == {}
+
+
+@pytest.mark.asyncio
+async def test_chat_connection_backpressure():
+    """
+    Тест очереди исходящих сообщений: медленный получатель не блокирует
+    отправку, переполнение обрабатывается политикой, пустое соединение пингуется
+    """
+    from backend.application.utils import ChatConnection, HEARTBEAT_MESSAGE
+
+    class SlowWebSocket:
+        def __init__(self):
+            self.sent = []
+            self.closed_with = None
+            self.release = asyncio.Event()
+
+        async def send_text(self, text):
+            await self.release.wait()
+            self.sent.append(text)
+
+        async def close(self, code):
+            self.closed_with = code
+
+    websocket = SlowWebSocket()
+    connection = ChatConnection(
+        websocket, max_queue=2, overflow_policy='drop_oldest',
+        heartbeat_interval=0.05, send_timeout=1
+    )
+    connection.start()
+    for number in range(4):
+        assert connection.enqueue(str(number))
+    await asyncio.sleep(0)
+    websocket.release.set()
+    await asyncio.sleep(0.1)
+    # В очередь помещаются два сообщения, самые старые вытеснены
+    assert websocket.sent[:2] == ['2', '3']
+    assert HEARTBEAT_MESSAGE in websocket.sent[2:]
+    connection.close()
+
+    websocket = SlowWebSocket()
+    connection = ChatConnection(
+        websocket, max_queue=1, overflow_policy='disconnect',
+        heartbeat_interval=10, send_timeout=1
+    )
+    connection.start()
+    assert connection.enqueue('first')
+    await asyncio.sleep(0.01)
+    assert connection.enqueue('second')
+    assert not connection.enqueue('third')
+    await asyncio.sleep(0.01)
+    assert connection.closed
+    assert websocket.closed_with == status.WS_1013_TRY_AGAIN_LATER
+
 
 @pytest.mark.asyncio
 async def test_upload_avatar(client):
@@ -856,7 +1456,7 @@ async def test_upload_avatar(client):
     token = security.create_access_token(uid="1")
     client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
 
-    test_file = ("post_image.jpg", b"fake image data", "image/jpeg")
+    test_file = ("post_image.jpg", make_image('red', image_format='JPEG'), "image/jpeg")
 
     response = await client.post(
         "/avatar",
@@ -1021,6 +1621,8 @@ async def test_unit_register(client, db):
         password='test123'
     )
     response = await register_view(data, db=db)
+    # Коммит - дело вызывающего (в приложении его делает get_db)
+    await db.commit()
     assert response == {'status': 'ok'}
 
 
@@ -1035,4 +1637,753 @@ async def test_unit_login(client, db):
     test_token = test_token[10]
     response = await login_view(data, db=db, response=response)
     token = response["auth_token"][10]
-    assert token == test_token
\ No newline at end of file
+    assert token == test_token
+
+@pytest.mark.asyncio
+async def test_posts_cursor_pagination(client):
+    """
+    Тест keyset-пагинации ленты и постов пользователя
+        - пользователь авторизован
+    Ожидается:
+        страницы идут от новых постов к старым без повторов,
+        на последней странице next_cursor равен None
+    """
+    token = security.create_access_token(uid="3")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    for number in range(3):
+        response = await client.post('/post', json={"text": f"paged post {number}"})
+        assert response.status_code == 200
+
+    first_page = (await client.get('/users/3/posts', params={'limit': 2})).json()
+    assert [post['text'] for post in first_page['posts']] == ['paged post 2', 'paged post 1']
+    assert first_page['next_cursor'] is not None
+
+    second_page = (await client.get(
+        '/users/3/posts', params={'limit': 2, 'cursor': first_page['next_cursor']}
+    )).json()
+    assert [post['text'] for post in second_page['posts']] == ['paged post 0']
+    assert second_page['next_cursor'] is None
+
+    profile = (await client.get('/users/3', params={'limit': 2})).json()
+    assert [post['text'] for post in profile['posts']] == ['paged post 2', 'paged post 1']
+    profile = (await client.get(
+        '/mypage', params={'limit': 2, 'cursor': profile['next_cursor']}
+    )).json()
+    assert [post['text'] for post in profile['posts']] == ['paged post 0']
+    assert profile['next_cursor'] is None
+
+    feed_page = (await client.get('/posts', params={'limit': 1})).json()
+    newest_id = feed_page['posts'][0]['id']
+    feed_page = (await client.get(
+        '/posts', params={'limit': 1, 'cursor': feed_page['next_cursor']}
+    )).json()
+    assert feed_page['posts'][0]['id'] < newest_id
+
+    response = await client.get('/profile/posts', params={'before_id': newest_id})
+    assert [post['text'] for post in response.json()['posts']] == ['paged post 1', 'paged post 0']
+
+    response = await client.get('/posts', params={'cursor': 'not a cursor'})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_recount_counters(client, db):
+    """
+    Тест пересчёта денормализованных счётчиков по исходным таблицам
+    Ожидается:
+        испорченные счётчики восстанавливаются
+    """
+    from sqlalchemy import select, update
+    from backend.db.models import Post
+    from backend.db.utils import recount_counters
+
+    token = security.create_access_token(uid="3")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    post_id = (await client.get('/users/3/posts', params={'limit': 1})).json()['posts'][0]['id']
+    await client.post(f'/post/{post_id}/like')
+    await client.post(f'/post/{post_id}/comment', json={"text": "counted comment"})
+
+    await db.execute(update(Post).where(Post.id == post_id).values(likes_count=42, comments_count=42))
+    await db.commit()
+    await recount_counters(db)
+    await db.commit()
+
+    post = (await db.execute(
+        select(Post.likes_count, Post.comments_count).where(Post.id == post_id)
+    )).first()
+    assert post.likes_count == 1
+    assert post.comments_count == 1
+
+
+@pytest.mark.asyncio
+async def test_collect_blob_garbage(client, db):
+    """
+    Тест удаления из хранилища файлов, на которые больше ничего не ссылается
+    Ожидается:
+        файл текущей аватарки остаётся, файл сменённой аватарки удаляется
+    """
+    from sqlalchemy import select
+    from backend.db.models import Blob, User
+    from backend.storage.blob_storage import blob_storage
+    from backend.storage.collect_garbage import collect_garbage
+
+    token = security.create_access_token(uid="3")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    await client.post("/avatar", files={"uploaded_file": ("a.png", make_image('blue'), "image/png")})
+    old_hash = (await db.execute(select(User.avatar_hash).where(User.id == 3))).scalar()
+    await client.post("/avatar", files={"uploaded_file": ("b.png", make_image('green'), "image/png")})
+    new_hash = (await db.execute(select(User.avatar_hash).where(User.id == 3))).scalar()
+    assert old_hash != new_hash and blob_storage.exists(old_hash)
+
+    assert await collect_garbage(db, blob_storage) >= 1
+
+    remaining = (await db.execute(select(Blob.hash))).scalars().all()
+    assert old_hash not in remaining and not blob_storage.exists(old_hash)
+    assert new_hash in remaining
+    small = await client.get('/user/3/avatar', params={'size': 64})
+    assert small.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_blob_columns_not_selected(client):
+    """
+    Тест того, что эндпоинты, не связанные с картинками, не читают из бд
+    колонки с содержимым картинок (users.avatar и media_in_post.image)
+    """
+    blob_column = re.compile(r'\b(users\.avatar|media_in_post\.image)\b', re.IGNORECASE)
+    token = security.create_access_token(uid="3")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+
+    with capture_sql() as statements:
+        response = await client.post(
+            '/login', json={"email": "test@exapmle.com", "password": "test123"}
+        )
+        assert response.status_code == 200
+        post_id = (await client.get('/posts')).json()['posts'][0]['id']
+        for url in [
+            f'/posts/{post_id}', '/mypage', '/users/1', '/users/3/posts', '/friends',
+            '/friendship_requests', '/isfriend/1', '/chat/1'
+        ]:
+            assert (await client.get(url)).status_code == 200
+        assert (await client.post('/friendship_request/1')).status_code == 200
+
+    assert statements
+    assert [statement for statement in statements if blob_column.search(statement)] == []
+
+
+@pytest.mark.asyncio
+async def test_password_hashing_pool_bounded(client):
+    """
+    Тест пула хэширования паролей: event loop не блокируется, пока идёт
+    хэширование, а запросы сверх лимита очереди получают 503
+    """
+    pool = PasswordHashingPool(max_workers=1, max_queue=1)
+    release = threading.Event()
+    first = asyncio.create_task(pool.run(release.wait))
+    second = asyncio.create_task(pool.run(release.wait))
+    await asyncio.sleep(0.05)
+    assert pool.queue_depth == 1
+
+    with pytest.raises(HTTPException) as exc:
+        await pool.run(release.wait)
+    assert exc.value.status_code == 503
+
+    release.set()
+    assert await first and await second
+    assert pool.queue_depth == 0
+
+    response = await client.get('/metrics')
+    assert response.status_code == 200
+    metrics = response.json()
+    assert metrics['counters']['password_hashing_rejected'] >= 1
+    assert metrics['observations']['password_hashing_seconds']['count'] >= 1
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_outdated_password(client, monkeypatch):
+    """
+    Тест пересчёта хэша при входе, если параметры хэширования изменились
+    """
+    from sqlalchemy import select
+    from backend.db.models import User
+
+    monkeypatch.setenv('PASSWORD_BCRYPT_ROUNDS', '4')
+    monkeypatch.setattr(password_utils, 'pwd_context', password_utils.create_password_context())
+
+    response = await client.post('/login', json={"email": "test@exapmle.com", "password": "test123"})
+    assert response.status_code == 200
+
+    async with SessionLocal() as session:
+        user = (await session.execute(
+            select(User).where(User.email == "test@exapmle.com")
+        )).scalars().one()
+    assert user.password.startswith('$2b$04$')
+    assert not password_utils.password_needs_rehash(user.password)
+
+    response = await client.post('/login', json={"email": "test@exapmle.com", "password": "test123"})
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_verified_token_cache(client, monkeypatch):
+    """
+    Тест кэша проверенных токенов: подпись проверяется один раз на токен,
+    refresh-токены и истёкшие записи не принимаются
+    """
+    decode_calls = []
+    original_decode = password_utils.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decode_calls.append(args[0])
+        return original_decode(*args, **kwargs)
+
+    monkeypatch.setattr(password_utils.jwt, 'decode', counting_decode)
+    password_utils.token_cache.clear()
+    token = security.create_access_token(uid="3")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+
+    assert (await client.get('/my_id')).json() == {'id': 3}
+    assert (await client.get('/mypage')).status_code == 200
+    assert len(decode_calls) == 1
+
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, security.create_refresh_token(uid="3"))
+    assert (await client.get('/mypage')).status_code == 401
+
+    cache = password_utils.VerifiedTokenCache(max_size=1)
+    cache.put('expired', '3', 0)
+    assert cache.get('expired') is None
+    cache.put('first', '1', float('inf'))
+    cache.put('second', '2', float('inf'))
+    assert cache.get('first') is None
+    assert cache.get('second') == '2'
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+
+
+@pytest.mark.asyncio
+async def test_message_writer_batches_inserts(client):
+    """
+    Тест пакетной записи сообщений: id выдаются сразу, а в бд сообщения
+    попадают одним INSERT, когда набирается пакет
+    """
+    from sqlalchemy import select
+    from backend.db.models import Message
+
+    writer = make_test_message_writer(flush_interval=60, flush_size=3)
+    with capture_sql() as statements:
+        messages = [
+            await writer.submit(author_id=1, getter_id=3, text=f'batch {number}')
+            for number in range(3)
+        ]
+        await asyncio.sleep(0.1)
+
+    ids = [message['id'] for message in messages]
+    assert ids == list(range(ids[0], ids[0] + 3))
+    inserts = [statement for statement in statements if statement.startswith('INSERT INTO messages')]
+    assert len(inserts) == 1
+    async with SessionLocal() as session:
+        stored = (await session.execute(
+            select(Message.text).where(Message.id.in_(ids)).order_by(Message.id)
+        )).scalars().all()
+    assert stored == ['batch 0', 'batch 1', 'batch 2']
+
+
+@pytest.mark.asyncio
+async def test_message_writer_requires_sequence():
+    """
+    Тест того, что без последовательности Postgres и своего id_allocator
+    MessageWriter не выдаёт id молча из памяти процесса
+    """
+    writer = MessageWriter(SessionLocal)
+    with pytest.raises(RuntimeError):
+        await writer.submit(author_id=1, getter_id=3, text='no sequence')
+    assert writer._buffer == []
+
+
+@pytest.mark.asyncio
+async def test_chat_cursor_pagination(client):
+    """
+    Тест постраничной загрузки истории чата: страницы идут от новых
+    сообщений к старым, внутри страницы - по времени, без пропусков и повторов
+    """
+    writer = make_test_message_writer(flush_interval=60)
+    sent = []
+    for number in range(5):
+        author_id, getter_id = (2, 3) if number % 2 else (3, 2)
+        sent.append((await writer.submit(
+            author_id=author_id, getter_id=getter_id, text=f'page {number}'
+        ))['id'])
+    await writer.close()
+
+    token = security.create_access_token(uid="2")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    response = await client.get('/chat/3', params={'limit': 2})
+    assert response.status_code == 200
+    page = response.json()
+    assert [message['id'] for message in page['messages']] == sent[3:]
+
+    received = page['messages']
+    while page['next_cursor']:
+        page = (await client.get(
+            '/chat/3', params={'limit': 2, 'cursor': page['next_cursor']}
+        )).json()
+        received = page['messages'] + received
+    assert [message['text'] for message in received] == [f'page {number}' for number in range(5)]
+
+    response = await client.get('/chat/3', params={'before_id': sent[1]})
+    assert [message['id'] for message in response.json()['messages']] == sent[:1]
+
+
+@pytest.mark.asyncio
+async def test_chats_list(client):
+    """
+    Тест списка переписок: последнее сообщение и непрочитанные обновляются
+    при записи, прочтении и удалении сообщений
+    """
+    token = security.create_access_token(uid="2")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    response = await client.post('/chat/3/read')
+    assert response.status_code == 200
+
+    writer = make_test_message_writer(flush_interval=60)
+    first = await writer.submit(author_id=3, getter_id=2, text='unread 1')
+    second = await writer.submit(author_id=3, getter_id=2, text='unread 2')
+    await writer.close()
+
+    chats = (await client.get('/chats')).json()['chats']
+    chat = next(chat for chat in chats if chat['partner_id'] == 3)
+    assert chat['partner_username'] == 'testuser'
+    assert chat['unread_count'] == 2
+    assert chat['last_message']['id'] == second['id']
+    assert chat['last_message']['text'] == 'unread 2'
+
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, security.create_access_token(uid="3"))
+    assert (await client.delete(f'/message/{second["id"]}')).status_code == 200
+    chats = (await client.get('/chats')).json()['chats']
+    chat = next(chat for chat in chats if chat['partner_id'] == 2)
+    assert chat['unread_count'] == 0
+    assert chat['last_message']['id'] == first['id']
+
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    chat = next(chat for chat in (await client.get('/chats')).json()['chats'] if chat['partner_id'] == 3)
+    assert chat['unread_count'] == 1
+    assert chat['last_message']['id'] == first['id']
+    await client.post('/chat/3/read')
+    chat = next(chat for chat in (await client.get('/chats')).json()['chats'] if chat['partner_id'] == 3)
+    assert chat['unread_count'] == 0
+
+
+@pytest.mark.asyncio
+async def test_chats_list_without_last_message(client):
+    """
+    Тест того, что переписка без последнего сообщения (оно удалено или id
+    не записан) остаётся в списке переписок вместе с непрочитанными
+    """
+    from sqlalchemy import update
+    from backend.db.models import Conversation
+
+    token = security.create_access_token(uid="1")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    response = await client.post('/chat/3/read')
+    assert response.status_code == 200
+
+    writer = make_test_message_writer()
+    await writer.submit(author_id=3, getter_id=1, text='lost message')
+    await writer.close()
+    async with SessionLocal() as session:
+        await session.execute(
+            update(Conversation)
+            .where(Conversation.owner_id == 1, Conversation.partner_id == 3)
+            .values(last_message_id=None)
+        )
+        await session.commit()
+
+    chats = (await client.get('/chats')).json()['chats']
+    chat = next(chat for chat in chats if chat['partner_id'] == 3)
+    assert chat['unread_count'] == 1
+    assert chat['last_message'] is None
+
+
+@pytest.mark.asyncio
+async def test_idle_websockets_hold_no_db_connections(client):
+    """
+    Тест того, что подключённые к чату пользователи не держат соединения с бд
+    """
+    from backend.db.pool_metrics import register_pool_metrics
+
+    usage = register_pool_metrics(async_engine, prefix='test_db_pool')
+    test_client = TestClient(app)
+    with test_client.websocket_connect("/chatsocket/1"), \
+            test_client.websocket_connect("/chatsocket/2"), \
+            test_client.websocket_connect("/chatsocket/3"):
+        assert usage.checked_out == 0
+        response = await client.get('/metrics')
+        assert response.json()['gauges']['test_db_pool_checked_out'] == 0
+    assert 'db_pool_checked_out' in response.json()['gauges']
+
+
+@pytest.mark.asyncio
+async def test_metrics_require_access(client, monkeypatch):
+    """
+    Тест того, что метрики не отдаются без авторизации или токена сборщика
+    """
+    token = security.create_access_token(uid="1")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    assert (await client.get('/metrics')).status_code == 200
+    client.cookies.clear()
+    assert (await client.get('/metrics')).status_code == 401
+
+    monkeypatch.setenv('METRICS_TOKEN', 'scraper-secret')
+    response = await client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+    assert response.status_code == 401
+    response = await client.get('/metrics', headers={'Authorization': 'Bearer scraper-secret'})
+    assert response.status_code == 200
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+
+
+@pytest.mark.asyncio
+async def test_database_settings(monkeypatch):
+    """
+    Тест настроек движка из окружения и замера ожидания соединения из пула
+    """
+    from sqlalchemy import text
+    from backend.metrics import metrics
+    from backend.db.pool_metrics import InstrumentedAsyncPool
+    from backend.db.settings import DatabaseSettings
+
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    monkeypatch.setenv('DB_ECHO', 'false')
+    monkeypatch.setenv('DB_STATEMENT_CACHE_SIZE', '0')
+    settings = DatabaseSettings.from_env('postgresql+asyncpg://user:password@db/test')
+    kwargs = settings.engine_kwargs()
+    assert kwargs['echo'] is False
+    assert kwargs['pool_size'] == 3
+    assert kwargs['poolclass'] is InstrumentedAsyncPool
+    assert kwargs['connect_args']['statement_cache_size'] == 0
+    assert DatabaseSettings.from_env(TEST_DATABASE_URL).engine_kwargs() == {'echo': False}
+
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass=InstrumentedAsyncPool, pool_size=1)
+    before = metrics.snapshot()['observations'].get('db_pool_checkout_wait_seconds', {'count': 0})
+    async with engine.connect() as connection:
+        await connection.execute(text('SELECT 1'))
+    await engine.dispose()
+    after = metrics.snapshot()['observations']['db_pool_checkout_wait_seconds']
+    assert after['count'] == before['count'] + 1
+
+
+@pytest.mark.asyncio
+async def test_read_replica_routing(client, monkeypatch):
+    """
+    Тест маршрутизации чтений на реплику: без недавних записей страница
+    читается из реплики (пустой отдельной бд), после записи - из основной бд
+    """
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from backend.application import routes
+    from backend.db.routing import ReadRouter, STICKY_COOKIE_NAME
+
+    replica_engine = create_async_engine("sqlite+aiosqlite:///./test_replica.db")
+    async with replica_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    router = ReadRouter(
+        primary=SessionLocal, replicas=[async_sessionmaker(replica_engine)], sticky_window=60
+    )
+    monkeypatch.setattr(routes, 'read_router', router)
+    monkeypatch.setattr('backend.main.read_router', router)
+    monkeypatch.delitem(app.dependency_overrides, get_read_db)
+    client.cookies.delete(STICKY_COOKIE_NAME)
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, security.create_access_token(uid="2"))
+    try:
+        # В реплике пользователей нет
+        response = await client.get('/users/3')
+        assert response.status_code == 400
+
+        response = await client.post('/chat/3/read')
+        assert response.status_code == 200
+        assert STICKY_COOKIE_NAME in response.cookies
+
+        response = await client.get('/users/3')
+        assert response.status_code == 200
+    finally:
+        client.cookies.delete(STICKY_COOKIE_NAME)
+        await replica_engine.dispose()
+        os.remove('test_replica.db')
+
+
+@contextmanager
+def capture_sql_with_parameters(engine):
+    """
+    Собирает SQL-запросы вместе с параметрами, чтобы потом получить их план
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+async def get_full_scans(engine, statements) -> list:
+    """
+    Возвращает шаги планов (EXPLAIN QUERY PLAN), читающие таблицу целиком
+    """
+    full_scans = []
+    async with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = await connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+            for row in plan:
+                detail = row[-1]
+                if (
+                    detail.startswith('SCAN') and 'INDEX' not in detail
+                    and detail != 'SCAN CONSTANT ROW'
+                ):
+                    full_scans.append((statement, detail))
+    return full_scans
+
+
+@pytest.mark.asyncio
+async def test_db_helpers_use_indexes():
+    """
+    Тест того, что запросы вспомогательных функций бд на наполненной бд
+    идут по индексам, а не читают таблицы целиком
+    """
+    from sqlalchemy import insert
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from backend.db import utils as db_utils
+    from backend.db.models import (
+        User, Post, Like, Comment, VotingVariant, Vote, Friendship, FriendshipRequest,
+        MediaInPost, Message, Conversation
+    )
+
+    engine = create_async_engine("sqlite+aiosqlite:///./test_explain.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        users, posts = 50, 500
+        await conn.execute(insert(User), [
+            {'id': i, 'username': f'user{i}', 'password': '', 'email': f'user{i}@example.com'}
+            for i in range(1, users + 1)
+        ])
+        await conn.execute(insert(Post), [
+            {'id': i, 'text': 'post', 'author_id': i % users + 1} for i in range(1, posts + 1)
+        ])
+        await conn.execute(insert(Like), [
+            {'post_id': post_id, 'author_id': user_id}
+            for post_id in range(1, posts + 1) for user_id in range(1, 6)
+        ])
+        await conn.execute(insert(Comment), [
+            {'text': 'comment', 'post_id': i % posts + 1, 'author_id': i % users + 1}
+            for i in range(2000)
+        ])
+        await conn.execute(insert(VotingVariant), [
+            {'id': i, 'text': 'variant', 'post_id': i % posts + 1} for i in range(1, 1001)
+        ])
+        await conn.execute(insert(Vote), [
+            {'variant_id': variant_id, 'post_id': variant_id % posts + 1, 'user_id': user_id}
+            for variant_id in range(1, posts + 1) for user_id in range(1, 4)
+        ])
+        await conn.execute(insert(Friendship), [
+            {'first_friend_id': i, 'second_friend_id': j}
+            for i in range(1, users + 1) for j in range(i + 1, min(i + 6, users + 1))
+        ])
+        await conn.execute(insert(FriendshipRequest), [
+            {'author_id': i, 'getter_id': i % users + 1} for i in range(1, users + 1)
+        ])
+        await conn.execute(insert(MediaInPost), [{'post_id': i % posts + 1} for i in range(1000)])
+        await conn.execute(insert(Message), [
+            {'text': 'message', 'author_id': i % users + 1, 'getter_id': (i * 7) % users + 1}
+            for i in range(3000)
+        ])
+        await conn.execute(insert(Conversation), [
+            {'owner_id': i, 'partner_id': j, 'last_message_id': i * j}
+            for i in range(1, users + 1) for j in range(1, 11) if i != j
+        ])
+        await conn.exec_driver_sql('ANALYZE')
+
+    post_ids = list(range(100, 120))
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    try:
+        async with session_factory() as session:
+            with capture_sql_with_parameters(engine) as statements:
+                await db_utils.is_post_liked_by_user(10, 3, session)
+                await db_utils.get_liked_post_ids(post_ids, 3, session)
+                await db_utils.get_post_with_author_username(10, session)
+                await db_utils.get_votes_on_voting_variant(11, session)
+                await db_utils.get_post_voting_variants(10, session)
+                await db_utils.get_voting_variants_for_posts(post_ids, session)
+                await db_utils.get_comments_for_posts(post_ids, session)
+                await db_utils.get_media_ids_for_posts(post_ids, session)
+                await db_utils.get_user_posts(7, session, limit=10)
+                await db_utils.get_existing_friendship(3, 5, session)
+                await db_utils.get_user_friends(3, session)
+                await db_utils.get_existing_friendship_request(3, 4, session)
+                await db_utils.get_friendship_requests_for_user(4, session)
+                await db_utils.get_usernames_by_ids([1, 2, 3], session)
+                await db_utils.get_messages_between_two_users(3, 21, session, limit=20)
+                await db_utils.get_conversations(3, session, limit=20)
+        assert len(statements) >= 16
+        assert await get_full_scans(engine, statements) == []
+    finally:
+        await engine.dispose()
+        os.remove('test_explain.db')
+
+
+# Бюджет SQL-запросов на эндпоинт. Тест падает, если эндпоинт стал делать
+# больше запросов, чем указано (например, появился N+1 или ленивая загрузка).
+# Бюджеты не зависят от количества данных: в тесте у постов несколько
+# вариантов, комментариев и лайков
+STATEMENT_BUDGETS = {
+    ('GET', '/posts'): 6,
+    ('GET', '/posts/{post_id}'): 5,
+    ('GET', '/users/2/posts'): 6,
+    ('GET', '/profile/posts'): 6,
+    ('GET', '/mypage'): 7,
+    ('GET', '/users/3'): 7,
+    ('GET', '/friends'): 1,
+    ('GET', '/friendship_requests'): 1,
+    ('GET', '/chat/3'): 2,
+    ('GET', '/chats'): 1,
+    ('GET', '/voted_users/{variant_id}'): 2,
+    ('POST', '/post/{post_id}/like'): 3,
+    ('POST', '/vote/{variant_id}'): 5,
+    ('POST', '/post/{post_id}/comment'): 3,
+    ('PUT', '/post/{post_id}'): 6,
+    ('DELETE', '/post/{post_id}'): 9,
+}
+
+
+@contextmanager
+def statement_budget(limit: int, endpoint: str = ''):
+    """
+    Проверяет, что внутри блока выполнено не больше limit SQL-запросов
+    """
+    with capture_sql() as statements:
+        yield statements
+    assert len(statements) <= limit, (
+        f'{endpoint}: {len(statements)} запросов при бюджете {limit}:\n' + '\n'.join(statements)
+    )
+
+
+@pytest.mark.asyncio
+async def test_endpoint_statement_budgets(client):
+    """
+    Тест бюджетов SQL-запросов на эндпоинты
+    Ожидается:
+        ни один эндпоинт из STATEMENT_BUDGETS не превышает свой бюджет
+    """
+    from sqlalchemy import select, func
+    from backend.db.models import Post, VotingVariant
+
+    token = security.create_access_token(uid="2")
+    client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, token)
+    post_ids = []
+    for number in range(3):
+        response = await client.post(
+            '/post', json={"text": f"budget {number}", "options": ["first", "second", "third"]}
+        )
+        assert response.status_code == 200
+        async with SessionLocal() as session:
+            post_ids.append(await session.scalar(select(func.max(Post.id))))
+        for comment in range(2):
+            await client.post(f'/post/{post_ids[-1]}/comment', json={"text": f"comment {comment}"})
+        await client.post(f'/post/{post_ids[-1]}/like')
+    async with SessionLocal() as session:
+        variant_id = await session.scalar(
+            select(func.min(VotingVariant.id)).where(VotingVariant.post_id == post_ids[0])
+        )
+    await client.post(f'/vote/{variant_id}')
+
+    requests = [
+        ('GET', '/posts', None),
+        ('GET', '/posts/{post_id}', None),
+        ('GET', '/users/2/posts', None),
+        ('GET', '/profile/posts', None),
+        ('GET', '/mypage', None),
+        ('GET', '/users/3', None),
+        ('GET', '/friends', None),
+        ('GET', '/friendship_requests', None),
+        ('GET', '/chat/3', None),
+        ('GET', '/chats', None),
+        ('GET', '/voted_users/{variant_id}', None),
+        ('POST', '/post/{post_id}/like', None),
+        ('POST', '/vote/{variant_id}', None),
+        ('POST', '/post/{post_id}/comment', {"text": "budget comment"}),
+        ('PUT', '/post/{post_id}', {"text": "budget", "options": ["first", "fourth"]}),
+        ('DELETE', '/post/{post_id}', None),
+    ]
+    assert {(method, path) for method, path, _ in requests} == set(STATEMENT_BUDGETS)
+    for method, path, body in requests:
+        url = path.format(post_id=post_ids[0], variant_id=variant_id)
+        with statement_budget(STATEMENT_BUDGETS[method, path], f'{method} {path}'):
+            response = await client.request(method, url, json=body)
+        assert response.status_code == 200, f'{method} {path}: {response.text}'
+
+    for post_id in post_ids[1:]:
+        await client.delete(f'/post/{post_id}')
+
+
+def test_migration_sniffs_content_type():
+    """
+    Тест определения mime-типа картинки по первым байтам при переносе
+    картинок из бд в хранилище
+    """
+    import importlib.util
+
+    path = os.path.join(
+        project_root, 'migrations', 'versions', 'ae7b2fd81879_move_blobs_to_file_storage.py'
+    )
+    spec = importlib.util.spec_from_file_location('move_blobs_migration', path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    sniff = migration.sniff_content_type
+    assert sniff(make_image('red', image_format='JPEG')) == 'image/jpeg'
+    assert sniff(make_image('red', image_format='GIF')) == 'image/gif'
+    assert sniff(make_image('red', image_format='WEBP')) == 'image/webp'
+    assert sniff(make_image('red', image_format='BMP')) == 'image/bmp'
+    assert sniff(make_image('red')) == 'image/png'
+    assert sniff(b'not an image') == 'application/octet-stream'
+
+
+@pytest.mark.asyncio
+async def test_chat_reads_own_messages_with_replica(client, monkeypatch):
+    """
+    Тест того, что при настроенной реплике только что отправленное через
+    websocket сообщение видно в истории чата и в списке переписок
+    """
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from backend.application import routes
+    from backend.db.routing import ReadRouter, STICKY_COOKIE_NAME
+
+    replica_engine = create_async_engine("sqlite+aiosqlite:///./test_replica.db")
+    async with replica_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    router = ReadRouter(
+        primary=SessionLocal, replicas=[async_sessionmaker(replica_engine)], sticky_window=60
+    )
+    monkeypatch.setattr(routes, 'read_router', router)
+    monkeypatch.setattr('backend.main.read_router', router)
+    monkeypatch.delitem(app.dependency_overrides, get_read_db)
+    client.cookies.delete(STICKY_COOKIE_NAME)
+    try:
+        socket_client = TestClient(app)
+        with socket_client.websocket_connect("/chatsocket/2") as websocket, \
+                socket_client.websocket_connect("/chatsocket/3") as recipient:
+            websocket.send_text(json.dumps({"recipient_id": "3", "message": "fresh message"}))
+            assert json.loads(recipient.receive_text())['text'] == 'fresh message'
+        await test_message_writer.close()
+
+        client.cookies.set(config.JWT_ACCESS_COOKIE_NAME, security.create_access_token(uid="2"))
+        response = await client.get('/chat/3')
+        assert response.status_code == 200
+        assert response.json()['messages'][-1]['text'] == 'fresh message'
+
+        response = await client.get('/chats')
+        assert response.status_code == 200
+        chat = next(chat for chat in response.json()['chats'] if chat['partner_id'] == 3)
+        assert chat['last_message']['text'] == 'fresh message'
+    finally:
+        await replica_engine.dispose()
+        os.remove('test_replica.db')